@@ -0,0 +1,295 @@
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import blake2b
+from io import BytesIO
+import json
+import multiprocessing
+import os
+from pathlib import Path
+import platform
+import resource
+from statistics import quantiles
+import sys
+from time import perf_counter, process_time, sleep
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+ROBOTS_TXT = "User-agent: *\nAllow: /\n"
+
+
+# Recorded origin responses, read from HAR 1.2 files
+def load_pages(directory=FIXTURES_DIR):
+    pages = {}
+    for path in sorted(Path(directory).glob("*.har")):
+        with open(path) as f:
+            har = json.load(f)
+        for entry in har["log"]["entries"]:
+            request, response = entry["request"], entry["response"]
+            if request["method"] != "GET" or response["status"] != 200:
+                continue
+            headers = {h["name"]: h["value"] for h in response["headers"]}
+            headers.pop("Content-Encoding", None)  # HAR content is decoded
+            body = response["content"].get("text", "").encode("utf-8")
+            pages[request["url"]] = (headers, body)
+    return pages
+
+
+def corpus_digest(pages):
+    digest = blake2b(digest_size=8)
+    for url, (_, body) in sorted(pages.items()):
+        digest.update(url.encode("utf-8"))
+        digest.update(body)
+    return digest.hexdigest()
+
+
+# Stands in for backend-service, squid (and the origins behind it), and the
+# ingredient and quantity parser services
+class Replay:
+    def __init__(self, pages, latency=0):
+        self.pages = pages
+        self.latency = latency
+
+    def route(self, method, url, body=b""):
+        parts = urlsplit(url)
+        if parts.netloc == "backend-service":
+            return 200, {"Content-Type": "application/json"}, b"{}"
+        if parts.netloc.endswith("-parser-service"):
+            # The requests engine sends form bodies as text, and httpx as bytes
+            if isinstance(body, bytes):
+                body = body.decode("utf-8")
+            form = parse_qs(body)
+            descriptions = form.get("descriptions[]", [])
+            if parts.netloc.startswith("quantity"):
+                entities = [{"magnitude": 1, "units": "g"} for _ in descriptions]
+            else:
+                entities = [{"description": d} for d in descriptions]
+            return 200, {"Content-Type": "application/json"}, json.dumps(entities)
+        if parts.path == "/robots.txt":
+            return 200, {"Content-Type": "text/plain"}, ROBOTS_TXT.encode()
+
+        page_url = url.split("?")[0]
+        if page_url not in self.pages:
+            return 404, {}, b""
+        headers, content = self.pages[page_url]
+        return 200, {**headers, "X-Cache": "MISS from proxy"}, content
+
+
+def _requests_adapter(replay):
+    from requests import Response
+    from requests.adapters import BaseAdapter
+    from requests.structures import CaseInsensitiveDict
+
+    class ReplayAdapter(BaseAdapter):
+        def send(self, request, **kwargs):
+            status, headers, content = replay.route(
+                request.method, request.url, request.body or b""
+            )
+            if replay.latency and "service" not in urlsplit(request.url).netloc:
+                sleep(replay.latency)
+            response = Response()
+            response.status_code = status
+            response.headers = CaseInsensitiveDict(headers)
+            response.raw = BytesIO(
+                content if isinstance(content, bytes) else content.encode()
+            )
+            response.url = request.url
+            response.request = request
+            response.encoding = None
+            return response
+
+        def close(self):
+            pass
+
+    return ReplayAdapter()
+
+
+def _httpx_transport(replay):
+    import asyncio
+    import httpx
+
+    async def handler(request):
+        if replay.latency and "service" not in request.url.host:
+            await asyncio.sleep(replay.latency)
+        status, headers, content = replay.route(
+            request.method, str(request.url), request.content
+        )
+        return httpx.Response(status, headers=headers, content=content)
+
+    return httpx.MockTransport(handler)
+
+
+def _install_stand_ins(replay, engine_name):
+    from web import app, parsing, web_clients
+    from web.async_clients import AsyncEngine
+    from web.politeness import PolitenessScheduler, crawl_state
+
+    adapter = _requests_adapter(replay)
+    sessions = (
+        web_clients.microservice_client,
+        web_clients.proxy_cache_client,
+        web_clients.web_client,
+    )
+    for session in sessions:
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+    if engine_name == "async":
+        engine = AsyncEngine(enabled=True, transport=_httpx_transport(replay))
+        app.engine = parsing.engine = engine
+
+    # Replayed origins are not burdened by repeated requests; the politeness
+    # stage is exercised, but without any crawl delay
+    class UnthrottledScheduler(PolitenessScheduler):
+        def acquire(self, domain, interval, max_wait=None):
+            return super().acquire(domain, 0, max_wait)
+
+    app.scheduler = UnthrottledScheduler(store=crawl_state)
+
+
+def _measure(config, results):
+    os.environ.setdefault("IMAGE_VERSION", "benchmark")
+    pages = load_pages(config["fixtures"])
+    replay = Replay(pages, latency=config["latency"])
+
+    from web.app import app
+    from web.parsing import description_cache
+
+    _install_stand_ins(replay, config["engine"])
+
+    # Pages whose recipe could not be extracted are counted as errors, although
+    # the crawl itself succeeds
+    def crawl(url):
+        started = perf_counter()
+        response = app.test_client().post("/crawl", data={"url": url})
+        elapsed = perf_counter() - started
+        recipe = response.status_code == 200 and response.json.get("recipe")
+        return elapsed, isinstance(recipe, dict)
+
+    # Warm up robots.txt and domain configuration caches, and scraper imports
+    for url in pages:
+        crawl(f"{url}?replay=warmup")
+    description_cache.clear()
+
+    # Each request is for a distinct URL, so that revalidation and extraction
+    # caches do not apply
+    urls = [f"{url}?replay={n}" for n in range(config["passes"]) for url in pages]
+    cpu_started, started = process_time(), perf_counter()
+    if config["mode"] == "sync":
+        timings = [crawl(url) for url in urls]
+    else:
+        with ThreadPoolExecutor(max_workers=config["concurrency"]) as executor:
+            timings = list(executor.map(crawl, urls))
+    elapsed, cpu = perf_counter() - started, process_time() - cpu_started
+
+    latencies = [latency for latency, _ in timings]
+    percentiles = quantiles(latencies, n=100, method="inclusive")
+    results.put(
+        {
+            "mode": config["mode"],
+            "engine": config["engine"],
+            "requests": len(urls),
+            "errors": sum(not extracted for _, extracted in timings),
+            "requests_per_second": len(urls) / elapsed,
+            "p50_ms": percentiles[49] * 1000,
+            "p99_ms": percentiles[98] * 1000,
+            "cpu_per_page_ms": cpu / len(urls) * 1000,
+            "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
+    )
+
+
+# Each mode is measured in a separate interpreter, so that peak memory usage
+# is attributable to that mode alone
+def measure(config):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_measure, args=(config, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def environment(pages):
+    from recipe_scrapers.__version__ import __version__ as rs_version
+
+    return {
+        "recipe_scrapers_version": rs_version,
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "corpus": corpus_digest(pages),
+        "pages": len(pages),
+    }
+
+
+def compare(baseline, current, tolerance):
+    if baseline["environment"]["corpus"] != current["environment"]["corpus"]:
+        print("! Baseline was recorded against a different fixture corpus")
+
+    regressions = []
+    baseline_runs = {(r["mode"], r["engine"]): r for r in baseline["results"]}
+    for result in current["results"]:
+        before = baseline_runs.get((result["mode"], result["engine"]))
+        if not before:
+            continue
+        for metric, higher_is_better in (
+            ("requests_per_second", True),
+            ("p99_ms", False),
+            ("cpu_per_page_ms", False),
+        ):
+            change = result[metric] / before[metric] - 1
+            print(f"{result['mode']:>10} {metric:>20}: {change:+7.1%}")
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append((result["mode"], metric))
+    return regressions
+
+
+def main():
+    parser = ArgumentParser(description="Replay recorded recipe pages via web.app")
+    parser.add_argument("--fixtures", default=str(FIXTURES_DIR))
+    parser.add_argument("--modes", default="sync,concurrent")
+    parser.add_argument("--engine", choices=("requests", "async"), default="requests")
+    parser.add_argument("--passes", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0, help="origin latency (s)")
+    parser.add_argument("--output", help="file to write results to, as JSON")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    pages = load_pages(args.fixtures)
+    report = {"environment": environment(pages), "results": []}
+    print(json.dumps(report["environment"]))
+    for mode in args.modes.split(","):
+        config = {
+            "fixtures": args.fixtures,
+            "mode": mode,
+            "engine": args.engine,
+            "passes": args.passes,
+            "concurrency": args.concurrency,
+            "latency": args.latency,
+        }
+        result = measure(config)
+        report["results"].append(result)
+        print(
+            f"{mode:>10}: {result['requests_per_second']:8.1f} req/s"
+            f"  p50 {result['p50_ms']:7.1f}ms  p99 {result['p99_ms']:7.1f}ms"
+            f"  cpu {result['cpu_per_page_ms']:6.1f}ms/page"
+            f"  rss {result['peak_rss_mib']:6.1f}MiB"
+            f"  errors {result['errors']}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), report, args.tolerance)
+        if regressions:
+            print(f"! Performance regressions: {regressions}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import os
+from time import process_time
+import warnings
+
+from recipe_scrapers import scrape_html
+
+from benchmarks.crawl import load_pages
+from web.extraction import RECIPE_ACCESSORS, ExtractionExecutor, RecordedScraper
+from web.jsonld import FastPathUnavailable, fast_scraper
+
+
+def _accessors(scraper):
+    for accessor in RECIPE_ACCESSORS:
+        try:
+            getattr(scraper, accessor)()
+        except Exception:
+            pass
+
+
+def full_scraper(html, url):
+    scraper = scrape_html(html, org_url=url, online=False, supported_only=True)
+    _accessors(scraper)
+
+
+def jsonld_fast_path(html, url):
+    try:
+        _accessors(RecordedScraper(fast_scraper(html, url), RECIPE_ACCESSORS))
+    except FastPathUnavailable:
+        full_scraper(html, url)
+
+
+# Only the time spent by the calling process is measured, which excludes the
+# parsing and extraction performed by the worker process
+def offloaded(html, url, executor=ExtractionExecutor(processes=1)):
+    _accessors(executor.extract(html, url)[1])
+
+
+def main(passes=20):
+    warnings.simplefilter("ignore")
+    os.environ["PYTHONWARNINGS"] = "ignore"  # for the worker process
+    pages = [(url, body.decode("utf-8")) for url, (_, body) in load_pages().items()]
+    for extract in (full_scraper, jsonld_fast_path, offloaded):
+        extract(*pages[0])  # warm up the scraper's plugins
+        started = process_time()
+        for _ in range(passes):
+            for url, html in pages:
+                extract(html, url)
+        per_page = (process_time() - started) / (passes * len(pages)) * 1000
+        print(f"{extract.__name__:>16}: {per_page:8.2f} ms cpu/page")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+from timeit import repeat
+
+from web.robots import ROBOTS_TXT_TTL, USER_AGENT, RobotsPolicy
+
+# A robots.txt resembling those of large recipe publishers: a handful of
+# agent-specific groups followed by a long default group with wildcards.
+ROBOTS_TXT = "\n".join(
+    [
+        "User-agent: Mediapartners-Google",
+        "Disallow:",
+        "",
+        "User-agent: GPTBot",
+        "Disallow: /",
+        "",
+        "User-agent: *",
+        "Crawl-delay: 2",
+        *(f"Disallow: /section-{n}/" for n in range(100)),
+        *(f"Disallow: /*?{param}=" for param in ("print", "utm_source", "sort")),
+        "Disallow: /*.pdf$",
+        "Allow: /recipes/",
+        "Disallow: /",
+    ]
+).encode()
+
+URLS = [
+    "https://example.test/recipes/tomato-soup",
+    "https://example.test/recipes/tomato-soup?print=1",
+    "https://example.test/section-99/feature",
+    "https://example.test/guides/menu.pdf",
+    "https://example.test/about",
+]
+
+
+def parser_lookup(policy, url):
+    try:
+        allowed = policy.parser.is_allowed(USER_AGENT, url)
+    except IndexError:
+        allowed = True
+    return allowed, max(1, policy.parser.get_crawl_delay(USER_AGENT) or 0)
+
+
+def matcher_lookup(policy, url):
+    return policy.matcher.check(url)
+
+
+def main(number=2_000, repetitions=5):
+    policy = RobotsPolicy(ROBOTS_TXT, ttl=ROBOTS_TXT_TTL)
+    for lookup in (parser_lookup, matcher_lookup):
+        best = min(
+            repeat(
+                lambda: [lookup(policy, url) for url in URLS],
+                number=number,
+                repeat=repetitions,
+            )
+        )
+        per_url = best / (number * len(URLS)) * 1e6
+        print(f"{lookup.__name__:>16}: {per_url:8.2f} µs/url")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+from argparse import ArgumentParser
+import os
+from pathlib import Path
+import re
+import subprocess
+import sys
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+READY = re.compile(r"Worker (\d+) ready")
+REGISTRY_SCRIPT = """
+import resource
+from time import perf_counter
+import web.app
+from web import scrapers
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+started = perf_counter()
+scrapers.load()
+elapsed = perf_counter() - started
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(elapsed, (after - before) / 1024)
+"""
+
+
+# Resident and proportional set sizes in MiB; pages shared copy-on-write
+# between processes are divided among them in the proportional size
+def memory_usage(pid):
+    usage = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            field, _, value = line.partition(":")
+            if field in ("Rss", "Pss"):
+                usage[field.lower()] = int(value.split()[0]) / 1024
+    return usage
+
+
+# Starts gunicorn, and measures the time until each worker is ready to serve
+# requests and the memory usage of each worker at that time
+def measure(preload, workers):
+    env = {**os.environ, "PRELOAD_APP": "true" if preload else "false"}
+    with TemporaryDirectory() as directory:
+        command = [
+            *(sys.executable, "-m", "gunicorn"),
+            *("--config", "web/gunicorn_config.py"),
+            *("--bind", f"unix:{Path(directory) / 'web.sock'}"),
+            *("--workers", str(workers)),
+            "web.app:app",
+        ]
+        started = perf_counter()
+        server = subprocess.Popen(
+            command, env=env, stderr=subprocess.PIPE, text=True, bufsize=1
+        )
+        try:
+            ready = []
+            for line in server.stderr:
+                if match := READY.search(line):
+                    ready.append(int(match.group(1)))
+                if len(ready) == workers:
+                    break
+            elapsed = perf_counter() - started
+            if len(ready) < workers:
+                raise SystemExit("gunicorn exited before its workers were ready")
+            usage = [memory_usage(pid) for pid in ready]
+        finally:
+            server.terminate()
+            server.wait()
+    return {
+        "mode": "preload" if preload else "lazy",
+        "ready": elapsed,
+        "rss": sum(u["rss"] for u in usage) / workers,
+        "pss": sum(u["pss"] for u in usage) / workers,
+    }
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    # The cost that each lazily-loading worker incurs upon its first extraction
+    output = subprocess.check_output([sys.executable, "-c", REGISTRY_SCRIPT])
+    elapsed, growth = map(float, output.split())
+    print(f"{'registry':>8}: {elapsed:6.3f} s load, {growth:6.1f} MiB")
+
+    for preload in (False, True):
+        runs = [measure(preload, args.workers) for _ in range(args.runs)]
+        best = min(runs, key=lambda result: result["ready"])
+        print(
+            f"{best['mode']:>8}: {best['ready']:6.3f} s until {args.workers} "
+            f"workers ready, {best['rss']:6.1f} MiB rss/worker, "
+            f"{best['pss']:6.1f} MiB pss/worker"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,17 @@
+from argparse import ArgumentParser
 from http import HTTPStatus
 import json
-from random import shuffle
+import os
+from random import Random
+import sys
+from urllib.error import HTTPError
 from urllib.parse import urlencode
 from urllib.request import Request, urlopen
 
+# The ingestion helpers are shared with the crawler, from the parent directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from web.ingestion import BitmapCheckpoint, dispatch, supported_hosts  # noqa: E402
+
 
 def ingest_url(url):
     headers = {"Host": "backend"}
@@ -11,19 +19,96 @@ def ingest_url(url):
     request = Request("http://localhost:30080/recipes/crawl", data, headers)
     try:
         with urlopen(request) as response:
-            if response.status == HTTPStatus.OK:
-                return
-            print(f"! Crawling url={url} failed with status={response.status}")
+            status = response.status
+    except HTTPError as e:
+        status = e.code
     except Exception as e:
         print(f"! Crawling url={url} failed with exception={e}")
+        return "exception"
+    if status == HTTPStatus.OK:
+        print(f"* Processed {url}")
+    else:
+        print(f"! Crawling url={url} failed with status={status}")
+    return status
+
+
+# Yields (line number, url) for each recipe in the dataset, without reading
+# the entire file into memory
+def read_urls(path):
+    with open(path, "r") as f:
+        for line_number, line in enumerate(f):
+            if line.strip():
+                yield line_number, json.loads(line)["url"]
+
+
+# Approximates a shuffle of an arbitrarily-long stream, using a buffer of
+# bounded size; the resulting order is reproducible given the same seed
+def shuffled(items, buffer_size, rng):
+    buffer = []
+    for item in items:
+        if len(buffer) < buffer_size:
+            buffer.append(item)
+            continue
+        index = rng.randrange(buffer_size)
+        yield buffer[index]
+        buffer[index] = item
+    rng.shuffle(buffer)
+    yield from buffer
+
+
+# The dataset is identified by its location and size
+def fingerprint(path):
+    return {"source": os.path.abspath(path), "size": os.stat(path).st_size}
+
+
+def load(args):
+    checkpoint = BitmapCheckpoint(args.state, fingerprint(args.input))
+    checkpoint.load()
+
+    rng = Random(args.seed)
+    pending = (
+        (line_number, url)
+        for line_number, url in read_urls(args.input)
+        if not checkpoint.is_done(line_number)
+    )
+    # URLs of websites that the crawler does not support are not submitted
+    hosts = supported_hosts()
+
+    return dispatch(
+        shuffled(pending, args.buffer, rng),
+        action=lambda item: ingest_url(item[1]),
+        checkpoint=checkpoint,
+        concurrency=args.concurrency,
+        url_of=lambda item: item[1],
+        accept=lambda item: hosts.supports(item[1]),
+        window=args.window,
+        backoff=args.backoff,
+        rate=args.rate,
+    )
+
+
+def main():
+    parser = ArgumentParser(description="Crawl the openrecipes dataset")
+    parser.add_argument("--input", default="recipes.json")
+    parser.add_argument("--state", default="crawl-state.json")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=5, help="requests per second")
+    parser.add_argument("--buffer", type=int, default=10_000, help="shuffle buffer")
+    parser.add_argument("--window", type=int, default=1_000, help="interleave window")
+    parser.add_argument("--backoff", type=float, default=30, help="retry delay (s)")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    try:
+        outcomes = load(args)
+    except KeyboardInterrupt:
+        print(f"* Interrupted; progress saved to {args.state}")
+        return
 
+    print("* Outcomes, including those of any previous runs:")
+    for outcome, count in sorted(outcomes.items()):
+        print(f"  {outcome}: {count}")
 
-with open("recipes.json", "r") as f:
-    docs = []
-    for line in f:
-        docs.append(json.loads(line))
 
-    shuffle(docs)
-    for doc in docs:
-        ingest_url(doc["url"])
-        print("* Processed {}".format(doc["url"]))
+if __name__ == "__main__":
+    main()
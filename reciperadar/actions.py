@@ -1,4 +1,5 @@
 from http import HTTPStatus
+from urllib.error import HTTPError
 from urllib.parse import urlencode
 from urllib.request import Request, urlopen
 
@@ -10,10 +11,15 @@ def recrawl(url):
     try:
         with urlopen(request) as response:
             if response.status == HTTPStatus.OK:
-                return
+                return response.status
             print(f"! Crawling url={url} failed with status={response.status}")
+            return response.status
+    except HTTPError as e:
+        print(f"! Crawling url={url} failed with status={e.code}")
+        return e.code
     except Exception as e:
         print(f"! Crawling url={url} failed with exception={e}")
+        return "exception"
 
 
 def reindex(recipe_id):
@@ -23,7 +29,12 @@ def reindex(recipe_id):
     try:
         with urlopen(request) as response:
             if response.status == HTTPStatus.OK:
-                return
+                return response.status
             print(f"! Indexing recipe_id={recipe_id} failed: status={response.status}")
+            return response.status
+    except HTTPError as e:
+        print(f"! Indexing recipe_id={recipe_id} failed: status={e.code}")
+        return e.code
     except Exception as e:
         print(f"! Indexing recipe_id={recipe_id} failed: exception={e}")
+        return "exception"
@@ -0,0 +1,45 @@
+import os
+import sys
+
+# The ingestion helpers are shared with the crawler, from the parent directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+BATCH_SIZE = 1000
+
+
+# The database driver is imported upon connection, so that the queries of
+# this module can be tested without it
+def connect():
+    import pg8000
+
+    return pg8000.connect(host="192.168.100.1", user="backend", database="backend")
+
+
+# Yields the rows of a table in order of a unique key (which may be an
+# expression), one batch at a time, by keyset pagination; each row begins with
+# its key
+def query_rows(table, key, columns, where=None, after=None, batch_size=BATCH_SIZE):
+    # The clause is interpolated into a query that has parameters, so any
+    # literal percent signs within it must be escaped
+    where = (where or "true").replace("%", "%%")
+    select = ", ".join([key, *columns])
+
+    db = connect()
+    cursor = db.cursor()
+    try:
+        while True:
+            if after is None:
+                query = f"select {select} from {table} where ({where}) "
+                params = (batch_size,)
+            else:
+                query = f"select {select} from {table} where ({where}) and {key} > %s "
+                params = (after, batch_size)
+            cursor.execute(query + f"order by {key} limit %s", params)
+            rows = cursor.fetchall()
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            after = rows[-1][0]
+    finally:
+        cursor.close()
+        db.close()
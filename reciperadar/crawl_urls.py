@@ -1,30 +1,45 @@
 import argparse
 
-import pg8000
-
 from actions import recrawl
+from batches import query_rows
+from web.ingestion import KeyCheckpoint, dispatch, supported_hosts
 
 
-def query_crawl_urls(where):
-    where = where or "true"
-    query = f"select url " f"from crawl_urls " f"where {where} " f"order by random()"
-
-    db = pg8000.connect(host="192.168.100.1", user="backend", database="backend")
-    cursor = db.cursor()
-    results = cursor.execute(query)
-    for (url,) in results.fetchall():
-        yield url
-    cursor.close()
+# URLs are paged in order of their digest, which scatters each domain's URLs
+# evenly throughout the results
+def query_crawl_urls(where, after=None):
+    yield from query_rows("crawl_urls", "md5(url)", ["url"], where, after)
 
 
 parser = argparse.ArgumentParser(description="Recrawl recipes")
 parser.add_argument("--where", help="SQL WHERE clause to select crawl_urls")
 parser.add_argument("--recrawl", action="store_true", help="Invoke recrawling")
+parser.add_argument("--concurrency", type=int, default=8, help="Concurrent requests")
+parser.add_argument("--state", default="crawl_urls.state.json", help="Progress file")
 args = parser.parse_args()
 
-for url in query_crawl_urls(args.where):
-    if args.recrawl:
-        recrawl(url)
-        print(f"* Processed URL {url} for recrawling")
-    else:
+if not args.recrawl:
+    for _, url in query_crawl_urls(args.where):
         print(f"* Found URL {url}")
+    raise SystemExit
+
+
+def process(row):
+    _, url = row
+    outcome = recrawl(url)
+    print(f"* Processed URL {url} for recrawling")
+    return outcome
+
+
+checkpoint = KeyCheckpoint(args.state, scope={"where": args.where})
+checkpoint.load()
+hosts = supported_hosts()
+outcomes = dispatch(
+    query_crawl_urls(args.where, after=checkpoint.position),
+    action=process,
+    checkpoint=checkpoint,
+    concurrency=args.concurrency,
+    url_of=lambda row: row[1],
+    accept=lambda row: hosts.supports(row[1]),
+)
+print(f"* Outcomes, including those of any previous runs: {dict(outcomes)}")
@@ -1,38 +1,52 @@
 import argparse
 
-import pg8000
-
 from actions import recrawl, reindex
+from batches import query_rows
+from web.ingestion import KeyCheckpoint, dispatch, supported_hosts
 
 
-def query_recipes(where):
-    where = where or "true"
-    query = (
-        f"select id, dst, title "
-        f"from recipes "
-        f"where {where} "
-        f"order by random()"
-    )
-
-    db = pg8000.connect(host="192.168.100.1", user="backend", database="backend")
-    cursor = db.cursor()
-    results = cursor.execute(query)
-    yield from results.fetchall()
-    cursor.close()
+# Recipe identifiers are random, so paging in identifier order does not
+# cluster recipes from the same domain
+def query_recipes(where, after=None):
+    yield from query_rows("recipes", "id", ["dst", "title"], where, after)
 
 
 parser = argparse.ArgumentParser(description="Reindex recipes")
 parser.add_argument("--where", help="SQL WHERE clause to select recipes")
 parser.add_argument("--recrawl", action="store_true", help="Invoke recrawling")
 parser.add_argument("--reindex", action="store_true", help="Invoke reindexing")
+parser.add_argument("--concurrency", type=int, default=8, help="Concurrent requests")
+parser.add_argument("--state", default="recipes.state.json", help="Progress file")
 args = parser.parse_args()
 
-for recipe_id, dst, title in query_recipes(args.where):
+if not (args.recrawl or args.reindex):
+    for recipe_id, dst, title in query_recipes(args.where):
+        print(f"* Found recipe {title}")
+    raise SystemExit
+
+
+def process(row):
+    recipe_id, dst, title = row
     if args.recrawl:
-        recrawl(dst)
+        outcome = recrawl(dst)
         print(f"* Processed recipe {title} for recrawling")
-    elif args.reindex:
-        reindex(recipe_id)
-        print(f"* Processed recipe {title} for reindexing")
     else:
-        print(f"* Found recipe {title}")
+        outcome = reindex(recipe_id)
+        print(f"* Processed recipe {title} for reindexing")
+    return outcome
+
+
+action = "recrawl" if args.recrawl else "reindex"
+checkpoint = KeyCheckpoint(args.state, scope={"where": args.where, "action": action})
+checkpoint.load()
+hosts = supported_hosts() if args.recrawl else None
+outcomes = dispatch(
+    query_recipes(args.where, after=checkpoint.position),
+    action=process,
+    checkpoint=checkpoint,
+    concurrency=args.concurrency,
+    # Reindexing does not contact recipe origins, and need not be interleaved
+    url_of=(lambda row: row[1]) if args.recrawl else None,
+    accept=(lambda row: hosts.supports(row[1])) if args.recrawl else None,
+)
+print(f"* Outcomes, including those of any previous runs: {dict(outcomes)}")
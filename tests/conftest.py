@@ -1,11 +1,19 @@
 from collections import OrderedDict
 import re
+from unittest.mock import patch
 
 import pytest
 
 from responses import matchers
 
+from web.adaptive import origin_limits
 from web.app import app
+from web.domains import domain_configurations
+from web.hosts import HostIndex
+from web.parsing import description_cache, extraction_cache
+from web.politeness import crawl_state
+from web.revalidation import revalidation_cache
+from web.scrapers import host_index
 
 
 @pytest.fixture
@@ -31,3 +39,21 @@ def cache_proxy_matcher():
     protocols = ("http", "https")
     proxies = OrderedDict([(protocol, "http://proxy:3128") for protocol in protocols])
     return matchers.request_kwargs_matcher({"proxies": proxies})
+
+
+# Websites under the example.test domain are treated as supported
+@pytest.fixture(autouse=True)
+def supported_hosts():
+    index = HostIndex([*host_index(), "example.test"])
+    with patch("web.app.host_index", return_value=index):
+        yield index
+
+
+@pytest.fixture(autouse=True)
+def reset_state():
+    crawl_state.clear()
+    origin_limits.clear()
+    description_cache.clear()
+    domain_configurations.clear()
+    extraction_cache.clear()
+    revalidation_cache.clear()
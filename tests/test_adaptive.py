@@ -0,0 +1,84 @@
+import pytest
+
+from web.adaptive import AdaptiveLimits
+
+
+@pytest.fixture
+def limits():
+    return AdaptiveLimits(
+        timeout=5, min_timeout=1, max_timeout=10, factor=2, max_concurrency=4
+    )
+
+
+def test_default_timeout(limits):
+    for _ in range(4):
+        limits.record("example.test", latency=0.1)
+
+    assert limits.timeout("example.test") == 5
+
+
+def test_timeout_bounds(limits):
+    for _ in range(20):
+        limits.record("fast.test", latency=0.1)
+        limits.record("slow.test", latency=8)
+
+    assert limits.timeout("fast.test") == 1
+    assert limits.timeout("slow.test") == 10
+
+
+def test_timeout_follows_latency(limits):
+    for latency in [1, 2] * 20:
+        limits.record("example.test", latency=latency)
+
+    # The p99 estimate lies above the mean response time
+    assert 3 < limits.timeout("example.test") < 10
+
+
+def test_timeout_grows_after_timeouts(limits):
+    for _ in range(20):
+        limits.record("example.test", latency=0.1)
+    timeouts = [limits.timeout("example.test")]
+
+    for _ in range(5):
+        limits.record("example.test", latency=timeouts[-1], failed=True)
+        timeouts.append(limits.timeout("example.test"))
+
+    assert timeouts[0] == 1
+    assert timeouts == sorted(timeouts)
+    assert timeouts[-1] == 10
+
+
+def test_additive_increase(limits):
+    acquired = [limits.acquire("example.test") for _ in range(2)]
+    assert acquired == [True, False]
+
+    for _ in range(20):
+        limits.acquire("example.test")
+        limits.record("example.test", latency=0.1)
+
+    assert [limits.acquire("example.test") for _ in range(5)] == [True] * 4 + [False]
+
+
+def test_multiplicative_decrease(limits):
+    for _ in range(20):
+        limits.acquire("example.test")
+        limits.record("example.test", latency=0.1)
+    assert limits.describe("example.test")["concurrency_limit"] == 4
+
+    limits.acquire("example.test")
+    limits.record("example.test", failed=True)
+    assert limits.describe("example.test")["concurrency_limit"] == 2
+
+    for _ in range(3):
+        limits.acquire("example.test")
+        limits.record("example.test", failed=True)
+    assert limits.describe("example.test")["concurrency_limit"] == 1
+    assert limits.describe("example.test")["error_rate"] > 0
+
+
+def test_release(limits):
+    assert limits.acquire("example.test")
+    limits.release("example.test")
+
+    assert limits.acquire("example.test")
+    assert limits.describe("example.test")["concurrency_limit"] == 1
@@ -0,0 +1,132 @@
+import asyncio
+from unittest.mock import patch
+
+import httpx
+import pytest
+import responses
+
+from web.async_clients import AsyncEngine, DelayableRedirectClient
+from web.exceptions import ResponseTooLarge, UnsupportedContentType
+
+
+@pytest.fixture
+def content_url():
+    return "https://recipe.migrated.example.test/recipe/123"
+
+
+@pytest.fixture
+def async_engine():
+    return AsyncEngine(enabled=True)
+
+
+def test_redirect_retry_after(async_engine):
+    def handler(request):
+        if request.url.path == "/origin":
+            headers = {"Location": "/content", "Retry-After": "0.1"}
+            return httpx.Response(302, headers=headers)
+        return httpx.Response(200, text="content")
+
+    async def fetch():
+        transport = httpx.MockTransport(handler)
+        client = DelayableRedirectClient(transport=transport)
+        return await client.get("https://example.test/origin")
+
+    with patch("web.async_clients.asyncio.sleep") as sleep:
+        response = async_engine.run(fetch())
+
+    sleep.assert_called_once_with(1)  # 0.1 rounded up to 1
+    assert response.ok
+    assert response.url == "https://example.test/content"
+    assert response.text == "content"
+    assert len(response.history) == 1
+    assert response.elapsed.total_seconds() > 0
+
+
+def test_per_host_connection_limit(async_engine):
+    active, peak = {}, {}
+
+    async def handler(request):
+        host = request.url.host
+        active[host] = active.get(host, 0) + 1
+        peak[host] = max(peak.get(host, 0), active[host])
+        await asyncio.sleep(0.01)
+        active[host] -= 1
+        return httpx.Response(200)
+
+    async def fetch_all():
+        transport = httpx.MockTransport(handler)
+        client = DelayableRedirectClient(per_host_connections=2, transport=transport)
+        urls = [
+            f"https://{host}/{n}" for host in ("a.test", "b.test") for n in range(8)
+        ]
+        return await asyncio.gather(*[client.get(url) for url in urls])
+
+    responses_ = async_engine.run(fetch_all())
+
+    assert len(responses_) == 16
+    assert peak == {"a.test": 2, "b.test": 2}
+
+
+@responses.activate
+@pytest.mark.parametrize("endpoint", ["resolve", "crawl"])
+def test_async_engine_endpoints(client, content_url, endpoint):
+    responses.get(
+        "http://backend-service/domains/recipe.migrated.example.test",
+        json={},
+    )
+    responses.get(
+        "https://recipe.migrated.example.test/robots.txt",
+        body="User-agent: *\nAllow: *\n",
+    )
+    requested = []
+
+    def handler(request):
+        requested.append(str(request.url))
+        return httpx.Response(200, text="<html></html>")
+
+    async_engine = AsyncEngine(enabled=True, transport=httpx.MockTransport(handler))
+    with patch("web.app.engine", async_engine):
+        response = client.post(f"/{endpoint}", data={"url": content_url})
+
+    assert response.status_code == 200
+    assert requested == [content_url]
+
+
+@responses.activate
+def test_async_engine_timeout_backoff(client, content_url):
+    responses.get(
+        "http://backend-service/domains/recipe.migrated.example.test",
+        json={},
+    )
+    responses.get(
+        "https://recipe.migrated.example.test/robots.txt",
+        body="User-agent: *\nAllow: *\n",
+    )
+
+    def handler(request):
+        raise httpx.ReadTimeout("timeout", request=request)
+
+    async_engine = AsyncEngine(enabled=True, transport=httpx.MockTransport(handler))
+    with patch("web.app.engine", async_engine):
+        response = client.post("/crawl", data={"url": content_url})
+
+    assert response.status_code == 429
+    assert "adding backoff" in response.json["error"]["message"]
+
+
+def test_body_size_limit(async_engine):
+    def handler(request):
+        if request.url.path == "/image":
+            return httpx.Response(200, headers={"Content-Type": "image/png"})
+        return httpx.Response(200, text="x" * 100)
+
+    async def fetch(path, max_bytes):
+        transport = httpx.MockTransport(handler)
+        client = DelayableRedirectClient(transport=transport)
+        return await client.get(f"https://example.test{path}", max_bytes=max_bytes)
+
+    assert async_engine.run(fetch("/page", 100)).text == "x" * 100
+    with pytest.raises(ResponseTooLarge):
+        async_engine.run(fetch("/page", 99))
+    with pytest.raises(UnsupportedContentType):
+        async_engine.run(fetch("/image", 100))
@@ -0,0 +1,51 @@
+from unittest.mock import patch
+
+from reciperadar.batches import query_rows
+
+
+# Serves keyset-paginated queries over a sorted table of rows
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+        self.closed = False
+
+    def execute(self, query, params):
+        self.queries.append((query, params))
+        *after, limit = params
+        rows = [row for row in self.rows if not after or row[0] > after[0]]
+        self.results = rows[:limit]
+
+    def fetchall(self):
+        return self.results
+
+    def close(self):
+        self.closed = True
+
+
+def test_query_rows():
+    cursor = FakeCursor([(n, f"recipe {n}") for n in range(5)])
+    with patch("reciperadar.batches.connect") as connect:
+        connect.return_value.cursor.return_value = cursor
+        rows = list(
+            query_rows("recipes", "id", ["title"], "title like 'a%'", batch_size=2)
+        )
+
+    assert rows == cursor.rows
+    assert [params for _, params in cursor.queries] == [(2,), (1, 2), (3, 2)]
+    query, _ = cursor.queries[1]
+    assert query == (
+        "select id, title from recipes where (title like 'a%%') and id > %s "
+        "order by id limit %s"
+    )
+    assert cursor.closed
+    connect.return_value.close.assert_called_once()
+
+
+def test_query_rows_resumed():
+    cursor = FakeCursor([(n, f"recipe {n}") for n in range(5)])
+    with patch("reciperadar.batches.connect") as connect:
+        connect.return_value.cursor.return_value = cursor
+        rows = list(query_rows("recipes", "id", ["title"], after=2))
+
+    assert rows == cursor.rows[3:]
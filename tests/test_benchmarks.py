@@ -0,0 +1,43 @@
+import json
+
+from requests import Request
+
+from benchmarks.crawl import Replay, load_pages
+
+
+def test_fixture_corpus():
+    pages = load_pages()
+
+    assert len(pages) >= 6
+    for headers, body in pages.values():
+        assert headers["Content-Type"].startswith("text/html")
+        assert b"application/ld+json" in body
+
+
+def test_replay_routes():
+    url = "https://recipe.example.test/recipe/1"
+    replay = Replay({url: ({"Content-Type": "text/html"}, b"<html></html>")})
+    # Form bodies are encoded as the ingredient parser client would send them
+    form = Request(
+        "POST",
+        "http://ingredient-parser-service",
+        data={"language_code": "en", "descriptions[]": ["1 onion", "salt"]},
+    ).prepare()
+
+    page = replay.route("GET", f"{url}?replay=1")
+    config = replay.route("GET", "http://backend-service/domains/recipe.example.test")
+    parsed = replay.route("POST", form.url, form.body)
+    encoded = replay.route("POST", form.url, form.body.encode("utf-8"))
+
+    assert page == (
+        200,
+        {"Content-Type": "text/html", "X-Cache": "MISS from proxy"},
+        b"<html></html>",
+    )
+    assert config[0] == 200
+    assert json.loads(parsed[2]) == [
+        {"description": "1 onion"},
+        {"description": "salt"},
+    ]
+    assert encoded == parsed
+    assert replay.route("GET", "https://recipe.example.test/missing")[0] == 404
@@ -0,0 +1,221 @@
+from threading import Barrier, Event, Thread
+
+import pytest
+import responses
+
+from web.caching import CoalescingCache, DiskCache, TieredCache
+from web.domains import domain_configurations, get_domain_configuration
+from web.metrics import registry
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def timer():
+    return FakeTimer()
+
+
+def test_cache_hits_and_misses(timer):
+    cache = CoalescingCache(ttl=10, maxsize=10, timer=timer)
+    loads = []
+
+    def loader(key):
+        loads.append(key)
+        return key.upper()
+
+    assert cache.get("a", loader) == "A"
+    assert cache.get("a", loader) == "A"
+    assert cache.get("b", loader) == "B"
+
+    assert loads == ["a", "b"]
+    assert cache.stats["hits"] == 1
+    assert cache.stats["misses"] == 2
+
+
+def test_cache_expiry(timer):
+    cache = CoalescingCache(ttl=10, maxsize=10, timer=timer)
+    loads = []
+
+    def loader(key):
+        loads.append(key)
+        return len(loads)
+
+    assert cache.get("a", loader) == 1
+    timer.now = 11
+    assert cache.get("a", loader) == 2
+
+
+def test_cache_stale_while_revalidate(timer):
+    cache = CoalescingCache(ttl=10, stale_ttl=60, maxsize=10, timer=timer)
+    refreshed = Event()
+    values = iter(["original", "refreshed"])
+
+    def loader(key):
+        try:
+            return next(values)
+        finally:
+            refreshed.set()
+
+    assert cache.get("a", loader) == "original"
+    refreshed.clear()
+    timer.now = 30
+
+    assert cache.get("a", loader) == "original"
+    assert refreshed.wait(timeout=5)
+    assert cache.stats["stale_hits"] == 1
+
+
+def test_cache_errors_not_stored(timer):
+    cache = CoalescingCache(ttl=10, maxsize=10, timer=timer)
+
+    def failing_loader(key):
+        raise ValueError(key)
+
+    with pytest.raises(ValueError):
+        cache.get("a", failing_loader)
+
+    assert "a" not in cache
+    assert cache.get("a", str.upper) == "A"
+    assert cache.stats["errors"] == 1
+
+
+def test_cache_size_bound(timer):
+    cache = CoalescingCache(ttl=10, maxsize=2, timer=timer)
+    for key in "abc":
+        cache.get(key, str.upper)
+
+    assert len(cache) == 2
+    assert "a" not in cache
+
+
+def test_cache_single_flight(timer):
+    cache = CoalescingCache(ttl=10, maxsize=10, timer=timer)
+    clients = 8
+    barrier = Barrier(clients)
+    started, release = Event(), Event()
+    loads = []
+
+    def loader(key):
+        loads.append(key)
+        started.set()
+        release.wait(timeout=5)
+        return key.upper()
+
+    results = []
+
+    def client():
+        barrier.wait()
+        results.append(cache.get("a", loader))
+
+    threads = [Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    started.wait(timeout=5)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert loads == ["a"]
+    assert results == ["A"] * clients
+    assert cache.stats["coalesced"] == cache.stats["misses"] - 1
+
+
+def cache_requests(name, result):
+    labels = {"cache": name, "result": result}
+    return registry.get_sample_value("crawler_cache_requests_total", labels) or 0
+
+
+def test_cache_metrics(timer):
+    cache = CoalescingCache(ttl=10, stale_ttl=60, maxsize=10, timer=timer, name="t")
+    hits, stale_hits, misses = (
+        cache_requests("t", "hits"),
+        cache_requests("t", "stale_hits"),
+        cache_requests("t", "misses"),
+    )
+
+    cache.get("a", str.upper)
+    cache.get("a", str.upper)
+    timer.now = 30
+    cache.get("a", str.upper)
+
+    assert cache_requests("t", "misses") == misses + 1
+    assert cache_requests("t", "hits") == hits + 1
+    assert cache_requests("t", "stale_hits") == stale_hits + 1
+
+
+@responses.activate
+def test_domain_configuration_cached():
+    responses.get("http://backend-service/domains/example.test", json={})
+
+    get_domain_configuration("example.test")
+    get_domain_configuration("example.test")
+
+    assert len(responses.calls) == 1
+    assert domain_configurations.stats["hits"] == 1
+
+
+def test_tiered_cache(timer, tmp_path):
+    disk = DiskCache(str(tmp_path / "cache.db"), maxsize=10, ttl=60, timer=timer)
+    cache = TieredCache(maxsize=10, disk=disk)
+    cache.set_many({("a", "1"): {"value": 1}, ("b", "2"): {"value": 2}})
+
+    assert cache.get_many([("a", "1"), ("c", "3")]) == {("a", "1"): {"value": 1}}
+
+    # A fresh process-local cache is populated from the disk tier
+    cache = TieredCache(maxsize=10, disk=disk)
+    assert cache.get(("b", "2")) == {"value": 2}
+    assert cache.get(("b", "2")) == {"value": 2}
+    assert cache.stats == {"hits": 1, "disk_hits": 1, "misses": 0}
+
+
+def test_tiered_cache_metrics():
+    cache = TieredCache(maxsize=10, name="tiered")
+    hits, misses = cache_requests("tiered", "hits"), cache_requests("tiered", "misses")
+    cache.set(("a",), 1)
+
+    cache.get_many([("a",), ("b",), ("c",)])
+
+    assert cache_requests("tiered", "hits") == hits + 1
+    assert cache_requests("tiered", "misses") == misses + 2
+
+
+def test_disk_cache_expiry_and_size(timer, tmp_path):
+    disk = DiskCache(str(tmp_path / "cache.db"), maxsize=2, ttl=60, timer=timer)
+    disk.evict_interval = 1
+    for n, key in enumerate("abc"):
+        timer.now = n
+        disk.set_many({key: n})
+
+    assert disk.get_many(["a", "b", "c"]) == {"b": 1, "c": 2}
+
+    timer.now = 61.5
+    assert disk.get_many(["a", "b", "c"]) == {"c": 2}
+
+
+def test_disk_cache_version_invalidation(timer, tmp_path):
+    def disk(version):
+        path = str(tmp_path / "cache.db")
+        return DiskCache(path, maxsize=10, ttl=60, version=version, timer=timer)
+
+    disk("1").set_many({"a": 1})
+
+    assert disk("1").get_many(["a"]) == {"a": 1}
+    assert disk("2").get_many(["a"]) == {}
+    assert disk("1").get_many(["a"]) == {}
+
+
+def test_disk_cache_errors(tmp_path):
+    path = tmp_path / "cache.db"
+    path.write_bytes(b"not a database" * 1024)
+    cache = TieredCache(maxsize=10, disk=DiskCache(str(path), maxsize=10, ttl=60))
+
+    # An unusable disk tier is treated as empty, and writes to it are skipped
+    cache.set(("a",), 1)
+    assert cache.get(("a",)) == 1
+    assert cache.disk.get_many(["a"]) == {}
@@ -0,0 +1,57 @@
+import pytest
+from recipe_scrapers import WebsiteNotImplementedError
+
+from benchmarks.crawl import load_pages
+from web.extraction import (
+    RECIPE_ACCESSORS,
+    ExtractionExecutor,
+    _portable,
+    extract_recipe,
+)
+
+
+@pytest.fixture(scope="module")
+def executor():
+    executor = ExtractionExecutor(processes=1)
+    yield executor
+    executor.shutdown()
+
+
+def _results(scraper):
+    results = {}
+    for accessor in RECIPE_ACCESSORS:
+        try:
+            results[accessor] = getattr(scraper, accessor)()
+        except Exception as e:
+            results[accessor] = type(e)
+    return results
+
+
+def test_offloaded_extraction(executor):
+    for url, (_, body) in load_pages().items():
+        html = body.decode("utf-8")
+        fast_path, offloaded = executor.extract(html, url)
+        expected_path, expected = extract_recipe(html, url)
+
+        assert fast_path == expected_path
+        assert _results(offloaded) == _results(expected)
+
+
+def test_offloaded_unsupported_website(executor):
+    with pytest.raises(WebsiteNotImplementedError):
+        executor.extract("<html></html>", "https://example.test/recipe")
+
+
+def test_queue_depth():
+    assert ExtractionExecutor(processes=3).queue_depth == 6
+    assert ExtractionExecutor(processes=3, queue_depth=1).queue_depth == 1
+    assert not ExtractionExecutor(processes=0).enabled
+
+
+def test_portable_exception():
+    class Unpicklable(Exception):
+        def __init__(self, first, second):
+            super().__init__(f"{first} {second}")
+
+    assert isinstance(_portable(ValueError("ratings")), ValueError)
+    assert str(_portable(Unpicklable("a", "b"))) == "Unpicklable: a b"
@@ -0,0 +1,136 @@
+from threading import Thread
+
+from web.frontier import CrawlFrontier
+from web.urls import get_domain
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def timer(self):
+        return self.now
+
+
+def test_get_domain():
+    assert get_domain("https://www.example.test/recipe?id=1") == "www.example.test"
+
+
+def test_round_robin():
+    frontier = CrawlFrontier()
+    for url in ("a.test/1", "a.test/2", "a.test/3", "b.test/1", "c.test/1"):
+        frontier.put(f"https://{url}")
+
+    crawled = []
+    while (entry := frontier.get(block=False)) is not None:
+        domain, url, _ = entry
+        crawled.append(url)
+        frontier.done(domain)
+
+    assert crawled == [
+        "https://a.test/1",
+        "https://b.test/1",
+        "https://c.test/1",
+        "https://a.test/2",
+        "https://a.test/3",
+    ]
+
+
+def test_retry():
+    frontier = CrawlFrontier(capacity=1)
+    frontier.put("https://a.test/1", item=1)
+    frontier.close()
+
+    domain, url, _ = frontier.get(block=False)
+    frontier.retry(domain, url, item=2)
+    frontier.done(domain)
+
+    assert frontier.get() == ("a.test", "https://a.test/1", 2)
+    frontier.done(domain)
+    assert frontier.get() is None
+
+
+def test_domain_in_progress():
+    frontier = CrawlFrontier()
+    frontier.put("https://a.test/1")
+    frontier.put("https://a.test/2")
+
+    domain, _, _ = frontier.get(block=False)
+    assert frontier.get(block=False) is None
+
+    frontier.done(domain)
+    assert frontier.get(block=False)[1] == "https://a.test/2"
+
+
+def test_crawl_delay():
+    clock = FakeClock()
+    frontier = CrawlFrontier(timer=clock.timer)
+    frontier.put("https://a.test/1", item=1)
+    frontier.put("https://a.test/2", item=2)
+    frontier.put("https://b.test/1", item=3)
+
+    domain, _, _ = frontier.get(block=False)
+    clock.now = 0.5
+    frontier.done(domain, delay=2)
+
+    # The delay is measured from the time at which the URL was handed out
+    assert frontier.get(block=False)[2] == 3
+    assert frontier.get(block=False) is None
+    assert frontier._wait_time(clock.now) == 1.5
+
+    clock.now = 2
+    assert frontier.get(block=False)[2] == 2
+
+
+def test_defer():
+    clock = FakeClock()
+    frontier = CrawlFrontier(timer=clock.timer)
+    frontier.put("https://a.test/1")
+    frontier.defer("a.test", 30)
+
+    assert frontier.get(block=False) is None
+
+    clock.now = 30
+    assert frontier.get(block=False)[0] == "a.test"
+
+
+def test_explicit_domain():
+    frontier = CrawlFrontier()
+    frontier.put("recipe-1", domain="1")
+    frontier.put("recipe-2", domain="2")
+
+    assert frontier.get(block=False)[0] == "1"
+    assert frontier.get(block=False)[0] == "2"
+
+
+def test_bounded_capacity():
+    frontier = CrawlFrontier(capacity=2)
+    urls = [f"https://example-{n}.test/" for n in range(10)]
+
+    def feed():
+        for url in urls:
+            frontier.put(url)
+        frontier.close()
+
+    feeder = Thread(target=feed)
+    feeder.start()
+
+    crawled = []
+    while (entry := frontier.get()) is not None:
+        assert len(frontier) <= 2
+        domain, url, _ = entry
+        crawled.append(url)
+        frontier.done(domain)
+    feeder.join()
+
+    assert crawled == urls
+
+
+def test_prune():
+    frontier = CrawlFrontier()
+    for n in range(3):
+        frontier.put(f"https://example-{n}.test/")
+        domain, _, _ = frontier.get(block=False)
+        frontier.done(domain)
+
+    assert frontier._eligible_at == {}
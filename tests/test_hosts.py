@@ -0,0 +1,42 @@
+from io import BytesIO
+import json
+from unittest.mock import patch
+
+from web.hosts import HostIndex, fetch_host_index
+from web.scrapers import host_index
+
+
+def test_host_variants():
+    index = HostIndex(["example.test", "www1.example.org", "Cooking.Example.com"])
+
+    assert index.supports("https://example.test/recipe")
+    assert index.supports("https://www.example.test/recipe")
+    assert index.supports("https://m.recipes.example.test:8443/recipe")
+    assert index.supports("HTTP://EXAMPLE.TEST./recipe")
+    assert index.supports("https://www1.example.org/recipe")
+    assert index.supports("https://cooking.example.com/recipe")
+
+    assert not index.supports("https://example.com/recipe")
+    assert not index.supports("https://example.org/recipe")
+    assert not index.supports("https://notexample.test/recipe")
+    assert not index.supports("example.test/recipe")
+    assert not index.supports("https://[::1/recipe")
+
+
+def test_registry_index():
+    index = host_index()
+
+    assert "allrecipes.com" in index.hosts
+    assert index.supports("https://www.allrecipes.com/recipe/1")
+    assert not index.supports("https://www.example.test/recipe/1")
+
+
+@patch("web.hosts.urlopen")
+def test_fetch_host_index(urlopen):
+    body = json.dumps({"metadata": {}, "hosts": ["example.test"]}).encode("utf-8")
+    urlopen.return_value = BytesIO(body)
+
+    index = fetch_host_index("http://crawler/hosts", headers={"Host": "crawler"})
+
+    assert index.supports("https://www.example.test/recipe")
+    assert urlopen.call_args.args[0].get_header("Host") == "crawler"
@@ -0,0 +1,101 @@
+from unittest.mock import patch
+
+import pytest
+
+from web.ingestion import (
+    BitmapCheckpoint,
+    KeyCheckpoint,
+    RateLimiter,
+    dispatch,
+    is_transient,
+)
+
+
+def test_is_transient():
+    assert is_transient(429)
+    assert is_transient(503)
+    assert is_transient("exception")
+    assert not is_transient(200)
+    assert not is_transient(404)
+    assert not is_transient("unsupported")
+
+
+def test_key_checkpoint_resume(tmp_path):
+    path = str(tmp_path / "state.json")
+    checkpoint = KeyCheckpoint(path, scope={"where": None})
+    for key in ("a", "b", "c"):
+        checkpoint.track(key)
+
+    # The position advances only past contiguous completed keys
+    checkpoint.complete("b", 200)
+    assert checkpoint.position is None
+    checkpoint.complete("a", 404)
+    assert checkpoint.position == "b"
+    checkpoint.save()
+
+    resumed = KeyCheckpoint(path, scope={"where": None})
+    assert resumed.load()
+    assert resumed.position == "b"
+    assert resumed.outcomes == {"200": 1, "404": 1}
+
+
+def test_checkpoint_scope(tmp_path):
+    path = str(tmp_path / "state.json")
+    KeyCheckpoint(path, scope={"where": None}).save()
+
+    assert not KeyCheckpoint(str(tmp_path / "other.json"), scope={}).load()
+    with pytest.raises(SystemExit):
+        KeyCheckpoint(path, scope={"where": "id = 1"}).load()
+
+
+def test_bitmap_checkpoint_resume(tmp_path):
+    path = str(tmp_path / "state.json")
+    checkpoint = BitmapCheckpoint(path, scope={"size": 100}, interval=0)
+
+    checkpoint.complete(3, 200)
+    checkpoint.complete(17, "unsupported")
+    checkpoint.complete(5, 503)
+
+    # Progress is saved once the interval has passed
+    resumed = BitmapCheckpoint(path, scope={"size": 100})
+    assert resumed.load()
+    assert [n for n in range(24) if resumed.is_done(n)] == [3, 17]
+    assert resumed.outcomes == {"200": 1, "unsupported": 1, "503": 1}
+
+
+def test_rate_limiter():
+    limiter = RateLimiter(rate=2)
+    with patch("web.ingestion.sleep") as sleep:
+        for _ in range(3):
+            limiter.wait()
+
+    assert sleep.call_count == 2
+
+
+@patch("web.ingestion.CRAWL_DELAY", 0)
+def test_dispatch(tmp_path):
+    items = [(n, f"https://{domain}.test/{n}") for n, domain in enumerate("abcab")]
+    attempts = []
+
+    def action(item):
+        attempts.append(item[0])
+        # The second item succeeds upon its second attempt, and the third fails
+        if item[0] == 1 and attempts.count(1) == 1:
+            return 503
+        return 500 if item[0] == 2 else 200
+
+    checkpoint = KeyCheckpoint(str(tmp_path / "state.json"), scope={})
+    outcomes = dispatch(
+        items,
+        action,
+        checkpoint,
+        concurrency=2,
+        url_of=lambda item: item[1],
+        accept=lambda item: item[0] != 4,
+        backoff=0,
+    )
+
+    assert outcomes == {"200": 3, "500": 1, "unsupported": 1}
+    assert attempts.count(1) == 2
+    assert attempts.count(2) == 3
+    assert checkpoint.position == 4
@@ -0,0 +1,144 @@
+import json
+import warnings
+
+import pytest
+from recipe_scrapers import scrape_html
+
+from benchmarks.crawl import load_pages
+from web.extraction import RECIPE_ACCESSORS, RecordedScraper
+from web.jsonld import FastPathUnavailable, fast_scraper
+
+GRAPH = {
+    "@context": "https://schema.org",
+    "@graph": [
+        {"@type": "WebSite", "name": "Example"},
+        {"@type": "Person", "@id": "#author", "name": "Jo Cook"},
+        {"@type": "AggregateRating", "@id": "#rating", "ratingValue": 3.9},
+        {
+            "@type": ["Recipe", "NewsArticle"],
+            "name": "Tomato &amp; <b>Basil</b> Pie",
+            "author": {"@id": "#author"},
+            "aggregateRating": {"@id": "#rating"},
+            "recipeIngredient": ["2 <i>tomatoes</i>", "For the pastry:", "flour"],
+            "prepTime": "PT10M",
+            "cookTime": "PT1H5M",
+            "recipeYield": ["6", "6 slices"],
+            "nutrition": {"@type": "NutritionInformation", "calories": "210 kcal"},
+        },
+    ],
+}
+MINIMAL = {"@context": "http://schema.org", "@type": "Recipe", "name": "Bare"}
+
+PAGES = {
+    "graph": (
+        '<html><head><meta http-equiv="Content-Language" content="fr, en">'
+        f'<script type="application/ld+json">{json.dumps(GRAPH)}</script>'
+        "</head><body><h1>Pie</h1></body></html>"
+    ),
+    "minimal": (
+        '<html lang="de"><head><script type=application/ld+json>'
+        f"{json.dumps(MINIMAL)}</script></head></html>"
+    ),
+    "commented": (
+        '<html><head><!-- <script type="application/ld+json">'
+        f"{json.dumps(GRAPH)}</script> --><script>var s = '<!--';</script>"
+        f'<script type="application/ld+json">{json.dumps(MINIMAL)}</script>'
+        "</head></html>"
+    ),
+    "comment": (
+        '<html lang="es"><head><script type="application/ld+json">\n'
+        f"<!-- recipe -->\n{json.dumps(MINIMAL)}</script></head></html>"
+    ),
+}
+HOSTS = ["allrecipes.com", "bbcgoodfood.com", "budgetbytes.com", "food.com"]
+
+
+def _results(scraper):
+    results = {}
+    for accessor in RECIPE_ACCESSORS:
+        try:
+            results[accessor] = getattr(scraper, accessor)()
+        except FastPathUnavailable:
+            raise
+        except Exception as e:
+            results[accessor] = type(e)
+    return results
+
+
+def _assert_parity(html, url):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        full = scrape_html(html, org_url=url, online=False, supported_only=True)
+        fast = RecordedScraper(fast_scraper(html, url), RECIPE_ACCESSORS)
+
+    assert _results(fast) == _results(full)
+
+
+@pytest.mark.parametrize("url", load_pages())
+def test_fixture_parity(url):
+    _, body = load_pages()[url]
+
+    _assert_parity(body.decode("utf-8"), url)
+
+
+@pytest.mark.parametrize("page", PAGES)
+@pytest.mark.parametrize("host", HOSTS)
+def test_schema_parity(page, host):
+    _assert_parity(PAGES[page], f"https://www.{host}/recipe/1")
+
+
+def test_unsupported_website():
+    assert fast_scraper(PAGES["minimal"], "https://example.test/recipe/1") is None
+
+
+def test_microdata():
+    html = PAGES["minimal"].replace("<head>", '<head itemscope itemtype="Recipe">')
+
+    assert fast_scraper(html, "https://www.allrecipes.com/recipe/1") is None
+
+
+def test_scraper_requires_document():
+    # This site's scraper reads nutrients from an HTML table
+    scraper = fast_scraper(PAGES["graph"], "https://www.matprat.no/recipe/1")
+
+    assert scraper.title() == "Tomato & Basil Pie"
+    with pytest.raises(FastPathUnavailable):
+        scraper.nutrients()
+
+
+def test_commented_script():
+    scraper = fast_scraper(PAGES["commented"], "https://www.allrecipes.com/recipe/1")
+
+    assert scraper.title() == "Bare"
+
+
+def test_caught_lookup():
+    scraper = fast_scraper(PAGES["graph"], "https://www.allrecipes.com/recipe/1")
+
+    # Site scrapers may catch any exception raised while reading the page
+    def description():
+        try:
+            return scraper.soup.find("div").get_text()
+        except Exception:
+            return None
+
+    scraper.description = description
+    with pytest.raises(FastPathUnavailable):
+        RecordedScraper(scraper, ["title", "description"])
+
+
+def test_recorded_scraper():
+    class Scraper:
+        def title(self):
+            return "Bare"
+
+        def ratings(self):
+            raise ValueError
+
+    recorded = RecordedScraper(Scraper(), ["title", "ratings"])
+
+    assert recorded.title() == "Bare"
+    with pytest.raises(ValueError):
+        recorded.ratings()
+    with pytest.raises(AttributeError):
+        recorded.yields()
@@ -0,0 +1,137 @@
+import json
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import pytest
+import responses
+
+from web import gunicorn_config
+from web.metrics import DomainCounter, registry, stage
+
+
+def stage_count(name, outcome="ok", status=""):
+    labels = {"stage": name, "outcome": outcome, "status": status}
+    value = registry.get_sample_value("crawler_stage_duration_seconds_count", labels)
+    return value or 0
+
+
+def test_stage_outcomes():
+    ok, not_found, error = (
+        stage_count("test"),
+        stage_count("test", "error", "404"),
+        stage_count("test", "error"),
+    )
+
+    with stage("test"):
+        pass
+    with stage("test") as span:
+        span.outcome, span.status = "error", 404
+    with pytest.raises(ValueError):
+        with stage("test"):
+            raise ValueError
+
+    assert stage_count("test") == ok + 1
+    assert stage_count("test", "error", "404") == not_found + 1
+    assert stage_count("test", "error") == error + 1
+
+
+def test_domain_counter_top_domains(tmp_path):
+    counter = DomainCounter(directory=str(tmp_path), top=2)
+    other_worker = [["a.example.test", "200", 5], ["c.example.test", "200", 3]]
+    (tmp_path / "domains_1.json").write_text(json.dumps(other_worker))
+
+    for _ in range(4):
+        counter.increment("b.example.test", 200)
+    counter.increment("c.example.test", 429)
+    counter.increment("c.example.test", 429)
+
+    (family,) = counter.collect()
+    samples = {tuple(s.labels.values()): s.value for s in family.samples}
+    assert samples == {
+        ("a.example.test", "200"): 5,
+        ("c.example.test", "200"): 3,
+        ("c.example.test", "429"): 2,
+    }
+
+
+def test_domain_counter_capacity():
+    counter = DomainCounter(capacity=2)
+    for domain, count in (("a", 3), ("b", 2), ("c", 1), ("d", 1), ("e", 1)):
+        for _ in range(count):
+            counter.increment(domain, 200)
+
+    assert counter.counts == {("a", "200"): 3, ("b", "200"): 2, ("other", "200"): 3}
+
+
+def test_domain_counter_retains_exported():
+    counter = DomainCounter(top=1)
+    counter.increment("a.example.test", 200)
+    list(counter.collect())
+
+    for _ in range(2):
+        counter.increment("b.example.test", 200)
+    (family,) = counter.collect()
+
+    # Counters that have been reported continue to be, rather than vanishing
+    domains = {s.labels["domain"] for s in family.samples}
+    assert domains == {"a.example.test", "b.example.test"}
+
+
+def test_domain_counter_flush(tmp_path):
+    timer = iter([0, 5, 20, 20])
+    counter = DomainCounter(directory=str(tmp_path), timer=lambda: next(timer))
+
+    counter.increment("example.test", 200)
+    assert not list(tmp_path.iterdir())
+    counter.increment("example.test", 200)
+
+    (written,) = tmp_path.iterdir()
+    assert json.loads(written.read_text()) == [["example.test", "200", 2]]
+
+
+@responses.activate
+def test_metrics_endpoint(client):
+    responses.get("http://backend-service/domains/example.test", json={})
+    responses.get("https://example.test/robots.txt", status=404)
+    responses.get("https://example.test/recipe", status=410)
+    fetches = stage_count("origin_fetch", "error", "410")
+
+    client.post("/crawl", data={"url": "https://example.test/recipe"})
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain")
+    assert stage_count("origin_fetch", "error", "410") == fetches + 1
+    assert b'crawler_domain_requests_total{domain="example.test"' in response.data
+    assert b"crawler_stage_duration_seconds_bucket{" in response.data
+
+
+def test_multiprocess_directory_created(tmp_path):
+    directory = tmp_path / "metrics"
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(directory)}
+
+    subprocess.run([sys.executable, "-c", "import web.metrics"], env=env, check=True)
+
+    assert directory.is_dir()
+
+
+def test_stale_metrics_removed(tmp_path, monkeypatch):
+    (tmp_path / "counter_1.db").write_bytes(b"")
+    (tmp_path / "domains_1.json").write_text("[]")
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+
+    gunicorn_config.on_starting(server=None)
+
+    assert not list(tmp_path.iterdir())
+
+
+def test_exited_worker_gauges_removed(tmp_path, monkeypatch):
+    (tmp_path / "gauge_livesum_7.db").write_bytes(b"")
+    (tmp_path / "counter_7.db").write_bytes(b"")
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+
+    gunicorn_config.child_exit(server=None, worker=SimpleNamespace(pid=7))
+
+    assert [path.name for path in tmp_path.iterdir()] == ["counter_7.db"]
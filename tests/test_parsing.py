@@ -1,8 +1,20 @@
 from datetime import UTC, datetime
+from unittest.mock import patch
 
 import pytest
+import responses
+from requests import ReadTimeout
 
-from web.parsing import parse_retry_duration
+from benchmarks.crawl import load_pages
+from web.extraction import ExtractionExecutor
+from web.parsing import (
+    Document,
+    _scrape_recipe,
+    parse_descriptions,
+    parse_retry_duration,
+    scrape_canonical_url,
+    scrape_recipe,
+)
 
 
 @pytest.mark.parametrize(
@@ -26,3 +38,150 @@ def test_parse_retry_duration(retry_after, expected_duration):
     duration = parse_retry_duration(from_moment, retry_after)
 
     assert duration == expected_duration
+
+
+@patch("web.scrapers.scrape_html")
+def test_document_parsed_once(scrape_html):
+    document = Document(text="<html></html>", url="https://example.test/recipe")
+
+    assert document.scraper is document.scraper
+    assert document.soup is scrape_html.return_value.soup
+    scrape_html.assert_called_once_with(
+        html="<html></html>",
+        org_url="https://example.test/recipe",
+        online=False,
+        supported_only=True,
+    )
+
+
+@responses.activate
+def test_parse_descriptions_empty():
+    assert parse_descriptions("quantity-parser-service", "en", []) == []
+    assert len(responses.calls) == 0
+
+
+@responses.activate
+def test_parse_descriptions_retry():
+    responses.post("http://ingredient-parser-service", body=ReadTimeout())
+    responses.post("http://ingredient-parser-service", json=[{"product": "sugar"}])
+
+    entities = parse_descriptions("ingredient-parser-service", "en", ["1 cup sugar"])
+
+    assert entities == [{"index": 0, "product": "sugar"}]
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_parse_descriptions_retry_budget():
+    responses.post("http://ingredient-parser-service", body=ReadTimeout())
+
+    with pytest.raises(ReadTimeout):
+        parse_descriptions("ingredient-parser-service", "en", ["1 cup sugar"])
+
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_parse_descriptions_cached():
+    service = "http://ingredient-parser-service"
+    responses.post(service, json=[{"product": "sugar"}, {"product": "egg"}])
+    responses.post(service, json=[{"product": "flour"}])
+
+    first = parse_descriptions(
+        "ingredient-parser-service", "en", ["1 cup sugar", "2 eggs"]
+    )
+    second = parse_descriptions(
+        "ingredient-parser-service", "en", ["2 eggs", "1 cup flour", "1 cup sugar"]
+    )
+
+    assert [entity["product"] for entity in first] == ["sugar", "egg"]
+    assert second == [
+        {"index": 0, "product": "egg"},
+        {"index": 1, "product": "flour"},
+        {"index": 2, "product": "sugar"},
+    ]
+    assert "1+cup+flour" in responses.calls[1].request.body
+    assert "sugar" not in responses.calls[1].request.body
+
+
+@patch("web.parsing._scrape_recipe")
+def test_scrape_recipe_cached(_scrape_recipe):
+    _scrape_recipe.return_value = {"title": "test", "src": "a", "domain": "a"}
+    url = "https://example.test/recipe"
+
+    first = scrape_recipe("a", "a", Document(text="<html></html>", url=url))
+    second = scrape_recipe("b", "b", Document(text="<html></html>", url=url))
+    changed = scrape_recipe("c", "c", Document(text="<html>!</html>", url=url))
+
+    assert first == {"title": "test", "src": "a", "domain": "a"}
+    assert second == {"title": "test", "src": "b", "domain": "b"}
+    assert changed == first
+    assert _scrape_recipe.call_count == 2
+
+
+@patch("web.parsing.parse_descriptions")
+def test_scrape_recipe_fast_path(parse_descriptions):
+    parse_descriptions.side_effect = lambda service, language_code, descriptions: [
+        {"description": d, "magnitude": 1, "units": "g"} for d in descriptions
+    ]
+    url, (_, body) = next(iter(load_pages().items()))
+    document = Document(text=body.decode("utf-8"), url=url)
+
+    with patch("web.scrapers.scrape_html") as scrape_html:
+        fast = _scrape_recipe(url, "example.test", document)
+    with patch("web.parsing.fast_scraper", return_value=None):
+        full = _scrape_recipe(url, "example.test", document)
+
+    scrape_html.assert_not_called()
+    assert fast == full
+    assert fast["title"] and fast["ingredients"]
+
+
+@patch("web.parsing.parse_descriptions")
+def test_scrape_recipe_offloaded(parse_descriptions):
+    parse_descriptions.side_effect = lambda service, language_code, descriptions: [
+        {"description": d, "magnitude": 1, "units": "g"} for d in descriptions
+    ]
+    url, (_, body) = next(iter(load_pages().items()))
+    document = Document(text=body.decode("utf-8"), url=url)
+    executor = ExtractionExecutor(processes=1)
+
+    try:
+        with patch("web.parsing.extraction_executor", executor):
+            offloaded = _scrape_recipe(url, "example.test", document)
+            unsupported = _scrape_recipe(
+                url, "example.test", Document(text="", url="https://example.test/")
+            )
+    finally:
+        executor.shutdown()
+
+    assert offloaded == _scrape_recipe(url, "example.test", document)
+    assert unsupported[1] == 501
+
+
+@patch("web.parsing.parse_descriptions")
+def test_canonical_url_offloaded(parse_descriptions):
+    parse_descriptions.side_effect = lambda service, language_code, descriptions: [
+        {"description": d, "magnitude": 1, "units": "g"} for d in descriptions
+    ]
+    url, (_, body) = next(iter(load_pages().items()))
+    document = Document(text=body.decode("utf-8"), url=url, resolve=True)
+    expected = Document(text=document.text, url=url).scraper.canonical_url()
+    executor = ExtractionExecutor(processes=1)
+
+    try:
+        with (
+            patch("web.parsing.extraction_executor", executor),
+            patch.object(executor, "extract", wraps=executor.extract) as extract,
+            patch("web.scrapers.scrape_html") as scrape_html,
+        ):
+            _scrape_recipe(url, "example.test", document)
+            canonical_url = scrape_canonical_url(document)
+    finally:
+        executor.shutdown()
+
+    # The canonical URL is recorded by the worker process that extracted the
+    # recipe, rather than by parsing the page again
+    assert extract.call_count == 1
+    scrape_html.assert_not_called()
+    assert canonical_url == expected
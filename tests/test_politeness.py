@@ -0,0 +1,50 @@
+import pytest
+
+from web.politeness import PolitenessScheduler
+from web.state import MemoryStateStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def timer(self):
+        return self.now
+
+    def sleeper(self, duration):
+        self.sleeps.append(duration)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_scheduler_spacing(clock):
+    scheduler = PolitenessScheduler(
+        MemoryStateStore(), timer=clock.timer, sleeper=clock.sleeper
+    )
+
+    assert scheduler.acquire("example.test", 5) == 0
+    assert scheduler.acquire("example.test", 5) == 5
+    assert scheduler.acquire("other.test", 5) == 0
+
+    clock.now = 3
+    assert scheduler.acquire("example.test", 5) == 2
+
+    clock.now = 5
+    assert scheduler.acquire("example.test", 5) == 0
+    assert clock.sleeps == []
+
+
+def test_scheduler_bounded_wait(clock):
+    scheduler = PolitenessScheduler(
+        MemoryStateStore(), max_wait=10, timer=clock.timer, sleeper=clock.sleeper
+    )
+
+    waits = [scheduler.acquire("example.test", 4) for _ in range(4)]
+
+    # Slots are allocated in arrival order until the wait bound is exceeded
+    assert waits == [0, 0, 0, 12]
+    assert clock.sleeps == [4, 8]
@@ -1,6 +1,22 @@
+import pytest
 import responses
+from requests import ReadTimeout
 
-from web.robots import get_robot_parser, can_fetch, crawl_delay, domain_robot_parsers
+from web.robots import (
+    ROBOTS_TXT_MAX_BYTES,
+    ROBOTS_TXT_MAX_TTL,
+    ROBOTS_TXT_MIN_TTL,
+    ROBOTS_TXT_TTL,
+    ROBOTS_TXT_UNREACHABLE_TTL,
+    USER_AGENT,
+    RobotsPolicy,
+    can_fetch,
+    crawl_delay,
+    domain_robot_parsers,
+    fetch_robots_policy,
+    get_robot_parser,
+    robots_rules,
+)
 
 
 @responses.activate
@@ -63,3 +79,139 @@ def test_get_crawl_delay(user_agent_matcher):
     delay = crawl_delay(target_url)
 
     assert delay == 5
+
+
+@responses.activate
+@pytest.mark.parametrize(
+    "status, target_allowed",
+    [(200, True), (401, True), (404, True), (500, False), (503, False)],
+)
+def test_robots_txt_status_handling(status, target_allowed):
+    domain_robot_parsers.clear()  # TODO: implicit cache teardown
+    responses.get("http://backend-service/domains/example.test", json={})
+    responses.get("https://example.test/robots.txt", status=status)
+
+    allowed = can_fetch("https://example.test/foo/bar")
+
+    assert allowed is target_allowed
+
+
+@responses.activate
+def test_robots_txt_unreachable():
+    responses.get("http://backend-service/domains/example.test", json={})
+    responses.get("https://example.test/robots.txt", body=ReadTimeout())
+
+    policy = fetch_robots_policy("https://example.test/robots.txt")
+
+    assert policy.ttl == ROBOTS_TXT_UNREACHABLE_TTL
+    assert not policy.parser.is_allowed("*", "https://example.test/foo/bar")
+
+
+@responses.activate
+@pytest.mark.parametrize(
+    "headers, expected_ttl",
+    [
+        ({}, ROBOTS_TXT_TTL),
+        ({"Cache-Control": "public, max-age=600"}, 600),
+        ({"Cache-Control": "max-age=0"}, ROBOTS_TXT_MIN_TTL),
+        ({"Cache-Control": "max-age=31536000"}, ROBOTS_TXT_MAX_TTL),
+        ({"Expires": "Thu, 01 Jan 1970 00:00:00 GMT"}, ROBOTS_TXT_MIN_TTL),
+        ({"Expires": "invalid"}, ROBOTS_TXT_TTL),
+    ],
+)
+def test_robots_txt_cache_ttl(headers, expected_ttl):
+    responses.get("http://backend-service/domains/example.test", json={})
+    responses.get("https://example.test/robots.txt", headers=headers)
+
+    policy = fetch_robots_policy("https://example.test/robots.txt")
+
+    assert policy.ttl == expected_ttl
+
+
+@responses.activate
+def test_robots_txt_size_limit():
+    responses.get("http://backend-service/domains/example.test", json={})
+    padding = "# padding\n" * (ROBOTS_TXT_MAX_BYTES // 10)
+    responses.get(
+        "https://example.test/robots.txt",
+        body=f"User-agent: *\n{padding}Disallow: /private\n",
+    )
+
+    policy = fetch_robots_policy("https://example.test/robots.txt")
+
+    assert len(policy.content) == ROBOTS_TXT_MAX_BYTES
+    assert policy.parser.is_allowed("*", "https://example.test/private")
+
+
+PARITY_ROBOTS_TXT = "\n".join(
+    [
+        "User-agent: OtherBot",
+        "Disallow: /",
+        "",
+        "User-agent: RecipeRadar",
+        "Crawl-delay: 3",
+        "Allow: /recipes/public",
+        "Disallow: /recipes/",
+        "Disallow: /*.pdf$",
+        "Allow: /search?*sort=",
+        "Disallow: /search",
+        "Disallow: /caf%C3%A9",
+        "Disallow: /**/print",
+        "",
+        "User-agent: *",
+        "Disallow: /",
+    ]
+)
+
+
+@pytest.mark.parametrize(
+    "path",
+    [
+        "/",
+        "/recipes/",
+        "/recipes/public/soup",
+        "/recipes/private/soup",
+        "/guides/menu.pdf",
+        "/guides/menu.pdf?download=1",
+        "/search",
+        "/search?q=soup&sort=rating",
+        "/search?q=soup",
+        "/café/menu",
+        "/caf%C3%A9/menu",
+        "/cake/print",
+        "/cake/printable",
+        "/about#recipes",
+    ],
+)
+@pytest.mark.parametrize(
+    "content",
+    [
+        PARITY_ROBOTS_TXT,
+        "User-agent: *\nDisallow:\n",
+        "User-agent: *\nAllow: /\nDisallow: /private\n",
+        "User-agent: *\nDisallow: /$\n",
+        "User-agent: *\nCrawl-delay: 5\n\nUser-agent: OtherBot\nDisallow: /\n",
+    ],
+)
+def test_robots_matcher_parity(content, path):
+    policy = RobotsPolicy(content.encode("utf-8"), ttl=ROBOTS_TXT_TTL)
+    url = f"https://example.test{path}"
+
+    try:
+        expected = policy.parser.is_allowed(USER_AGENT, url)
+    except IndexError:
+        expected = True  # the library fails upon rulesets without path rules
+    expected_delay = max(1, policy.parser.get_crawl_delay(USER_AGENT) or 0)
+
+    assert policy.matcher.check(url) == (expected, expected_delay)
+
+
+@responses.activate
+def test_robots_rules():
+    domain_robot_parsers.clear()  # TODO: implicit cache teardown
+    responses.get("http://backend-service/domains/example.test", json={})
+    responses.get("https://example.test/robots.txt", body=PARITY_ROBOTS_TXT)
+
+    assert robots_rules("https://example.test/recipes/public/soup") == (True, 3)
+    assert robots_rules("https://example.test/recipes/other") == (False, 3)
+    assert len(responses.calls) == 2  # domain configuration, robots.txt
@@ -1,4 +1,8 @@
+import json
+from queue import Queue
+from threading import Event
 from urllib.parse import urljoin
+from time import time
 from unittest.mock import patch
 
 from dulwich import porcelain
@@ -8,7 +12,9 @@ from requests import ReadTimeout
 from responses import matchers
 from recipe_scrapers import StaticValueException
 
-from web.app import app, domain_backoffs, get_domain
+from web.app import _crawl_frontier, app, get_domain
+from web.frontier import CrawlFrontier
+from web.politeness import crawl_state
 from web.robots import domain_robot_parsers
 
 
@@ -149,7 +155,6 @@ def test_fetch_endpoints_timeout_backoff(
 
 @responses.activate
 @pytest.mark.parametrize("endpoint", ["resolve", "crawl"])
-@patch.dict(domain_backoffs, clear=True)
 def test_fetch_endpoints_respect_server_backoff(
     client,
     origin_domain,
@@ -157,7 +162,7 @@ def test_fetch_endpoints_respect_server_backoff(
     origin_url,
     endpoint,
 ):
-    assert len(domain_backoffs) == 0
+    assert origin_domain not in crawl_state
 
     responses.get(
         "http://backend-service/domains/recipe.subdomain.example.test",
@@ -174,12 +179,11 @@ def test_fetch_endpoints_respect_server_backoff(
 
     assert error is not None
     assert "url" not in response.json
-    assert origin_domain in domain_backoffs
+    assert origin_domain in crawl_state
 
 
 @responses.activate
 @pytest.mark.parametrize("endpoint", ["resolve", "crawl"])
-@patch.dict(domain_backoffs, clear=True)
 @patch("web.web_clients.sleep")
 def test_fetch_endpoints_respect_server_redirect_backoff(
     sleep,
@@ -190,7 +194,7 @@ def test_fetch_endpoints_respect_server_redirect_backoff(
     content_url,
     endpoint,
 ):
-    assert len(domain_backoffs) == 0
+    assert origin_domain not in crawl_state
 
     responses.get(
         "http://backend-service/domains/recipe.subdomain.example.test",
@@ -214,12 +218,15 @@ def test_fetch_endpoints_respect_server_redirect_backoff(
 
     sleep.assert_called_once_with(1)  # 0.1 rounded up to 1
     assert error is None
-    assert origin_domain not in domain_backoffs
+    assert origin_domain not in crawl_state
 
 
 @pytest.fixture
 def scrape_result():
     class ScrapeResult:
+        def canonical_url(self):
+            return "https://recipe.migrated.example.test/recipe/canonical"
+
         def title(self):
             return "test"
 
@@ -264,7 +271,7 @@ def scrape_result():
 
 @responses.activate
 @patch("web.parsing.parse_descriptions")
-@patch("web.parsing.scrape_html")
+@patch("web.scrapers.scrape_html")
 def test_crawl_response(
     scrape_html,
     parse_descriptions,
@@ -286,16 +293,17 @@ def test_crawl_response(
     )
 
     scrape_html.return_value = scrape_result
-    parse_descriptions.side_effect = [
-        ["test ingredient"],
-        [
+    parsed = {
+        "ingredient-parser-service": ["test ingredient"],
+        "quantity-parser-service": [
             {"magnitude": 5, "units": "g"},
             {"magnitude": 83.68, "units": "J"},
             {"magnitude": 1, "units": "g"},
             {"magnitude": 1, "units": "g"},
             {"magnitude": 2, "units": "g"},
         ],
-    ]
+    }
+    parse_descriptions.side_effect = lambda service, **kwargs: parsed[service]
 
     response = client.post("/crawl", data={"url": content_url})
     metadata = response.json.get("metadata", {})
@@ -323,14 +331,14 @@ def test_crawl_response(
 
 
 @responses.activate(assert_all_requests_are_fired=True)
-@patch("web.parsing.scrape_html")
-@patch("web.app.can_fetch")
-def test_robots_txt_crawl_filtering(can_fetch, scrape_html, client, content_url):
+@patch("web.scrapers.scrape_html")
+@patch("web.app.robots_rules")
+def test_robots_txt_crawl_filtering(robots_rules, scrape_html, client, content_url):
     responses.get(
         "http://backend-service/domains/recipe.migrated.example.test",
         json={},
     )
-    can_fetch.return_value = False
+    robots_rules.return_value = (False, 1)
 
     response = client.post("/crawl", data={"url": content_url})
 
@@ -339,13 +347,13 @@ def test_robots_txt_crawl_filtering(can_fetch, scrape_html, client, content_url)
 
 
 @responses.activate(assert_all_requests_are_fired=True)
-@patch("web.app.can_fetch")
-def test_robots_txt_resolution_filtering(can_fetch, client, content_url):
+@patch("web.app.robots_rules")
+def test_robots_txt_resolution_filtering(robots_rules, client, content_url):
     responses.get(
         "http://backend-service/domains/recipe.migrated.example.test",
         json={},
     )
-    can_fetch.return_value = False
+    robots_rules.return_value = (False, 1)
 
     response = client.post("/resolve", data={"url": content_url})
 
@@ -353,7 +361,7 @@ def test_robots_txt_resolution_filtering(can_fetch, client, content_url):
 
 
 @responses.activate
-@patch("web.parsing.scrape_html")
+@patch("web.scrapers.scrape_html")
 def test_domain_config_unavailable_not_crawled(scrape_html, client, content_url):
     responses.get(
         "http://backend-service/domains/recipe.subdomain.example.test",
@@ -366,7 +374,7 @@ def test_domain_config_unavailable_not_crawled(scrape_html, client, content_url)
 
 
 @responses.activate
-@patch("web.parsing.scrape_html")
+@patch("web.scrapers.scrape_html")
 def test_http_crawl_disabled_not_crawled(scrape_html, client, content_url):
     responses.get(
         "http://backend-service/domains/recipe.subdomain.example.test",
@@ -379,7 +387,7 @@ def test_http_crawl_disabled_not_crawled(scrape_html, client, content_url):
 
 
 @responses.activate
-@patch("web.parsing.scrape_html")
+@patch("web.scrapers.scrape_html")
 def test_http_cache_disabled_direct_access(
     scrape_html,
     client,
@@ -403,7 +411,7 @@ def test_http_cache_disabled_direct_access(
 
 
 @responses.activate
-@patch("web.parsing.scrape_html")
+@patch("web.scrapers.scrape_html")
 def test_http_error_not_crawled(
     scrape_html,
     client,
@@ -425,3 +433,388 @@ def test_http_error_not_crawled(
 
     assert response.status_code == 404
     assert not scrape_html.called
+
+
+@responses.activate
+@pytest.mark.parametrize("endpoint", ["resolve", "crawl"])
+def test_fetch_endpoints_crawl_delay_rejection(
+    client,
+    permissive_robots_txt,
+    content_url,
+    endpoint,
+):
+    responses.get(
+        "http://backend-service/domains/recipe.migrated.example.test",
+        json={},
+    )
+    responses.get(content_url, status=200)
+
+    first = client.post(f"/{endpoint}", data={"url": content_url})
+    second = client.post(f"/{endpoint}", data={"url": content_url})
+
+    assert first.status_code == 200
+    assert second.status_code == 429
+    assert second.headers["Retry-After"] == "1"
+    assert (
+        len([call for call in responses.calls if call.request.url == content_url]) == 1
+    )
+
+
+@responses.activate
+@pytest.mark.parametrize("endpoint", ["resolve", "crawl"])
+@patch("web.app.extend_backoff")
+def test_fetch_endpoints_backoff_retry_after(
+    extend_backoff,
+    client,
+    permissive_robots_txt,
+    origin_url,
+    endpoint,
+):
+    extend_backoff.return_value = 3
+    responses.get(
+        "http://backend-service/domains/recipe.subdomain.example.test",
+        json={},
+    )
+    responses.get(origin_url, body=ReadTimeout())
+
+    response = client.post(f"/{endpoint}", data={"url": origin_url})
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "3"
+
+
+@responses.activate
+def test_crawl_batch(client, permissive_robots_txt, origin_url, content_url):
+    from web.politeness import scheduler
+
+    for domain in ("recipe.subdomain.example.test", "recipe.migrated.example.test"):
+        responses.get(f"http://backend-service/domains/{domain}", json={})
+    responses.get(origin_url, status=404)
+    responses.get(content_url, status=200)
+    responses.get(f"{content_url}/other", status=200)
+
+    urls = [origin_url, content_url, f"{content_url}/other"]
+    with patch.object(scheduler, "sleeper") as sleeper:
+        response = client.post("/crawl/batch", data={"url": urls})
+        results = [json.loads(line) for line in response.text.splitlines()]
+    statuses = {result["url"]: result["status"] for result in results}
+
+    assert response.mimetype == "application/x-ndjson"
+    assert statuses == {origin_url: 404, content_url: 200, f"{content_url}/other": 200}
+    # Domains are crawled round-robin, and the crawl delay is observed between
+    # same-domain URLs by the batch itself rather than within the scheduler
+    assert results[-1]["url"] == f"{content_url}/other"
+    assert sleeper.call_count <= 1
+
+
+@responses.activate
+def test_crawl_unsupported_website(client):
+    response = client.post("/crawl", data={"url": "https://unsupported.test/recipe"})
+
+    assert response.status_code == 501
+    assert response.json["error"]["message"] == "website is not implemented"
+    assert len(responses.calls) == 0
+
+
+@responses.activate
+def test_crawl_batch_unsupported_websites(client):
+    urls = ["https://unsupported.test/1", "not a url"]
+    response = client.post("/crawl/batch", data={"url": urls})
+    results = [json.loads(line) for line in response.text.splitlines()]
+
+    assert [(result["url"], result["status"]) for result in results] == [
+        ("https://unsupported.test/1", 501),
+        ("not a url", 501),
+    ]
+    assert len(responses.calls) == 0
+
+
+def test_hosts(client, supported_hosts):
+    response = client.get("/hosts")
+
+    assert response.status_code == 200
+    assert response.json["hosts"] == list(supported_hosts)
+    assert "allrecipes.com" in response.json["hosts"]
+    assert "recipe_scrapers_version" in response.json["metadata"]
+
+
+def test_crawl_batch_validation(client):
+    response = client.post("/crawl/batch", json={"urls": []})
+
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("payload", [["https://a.test/"], {"urls": "https://a.test/"}])
+def test_crawl_batch_invalid_json(client, payload):
+    response = client.post("/crawl/batch", json=payload)
+
+    assert response.status_code == 400
+
+
+@patch("web.app.robots_rules", return_value=(True, 0))
+@patch("web.app.backoff_remaining", side_effect=ConnectionError)
+@patch("web.app._crawl", return_value=({"recipe": {}}, 200))
+def test_crawl_batch_state_unavailable(_crawl, backoff_remaining, robots_rules, client):
+    urls = ["https://a.example.test/1", "https://a.example.test/2"]
+    response = client.post("/crawl/batch", data={"url": urls})
+    results = [json.loads(line) for line in response.text.splitlines()]
+
+    assert [result["status"] for result in results] == [200, 200]
+
+
+@patch("web.app._crawl")
+def test_crawl_frontier_stopped(_crawl):
+    frontier = CrawlFrontier()
+    frontier.put("https://a.example.test/1")
+    frontier.close()
+    results, stopped = Queue(), Event()
+    stopped.set()
+
+    _crawl_frontier(frontier, results, stopped)
+
+    assert not _crawl.called
+    assert results.empty()
+
+
+@responses.activate
+@patch("web.parsing.parse_descriptions")
+@patch("web.scrapers.scrape_html")
+def test_crawl_with_resolution(
+    scrape_html,
+    parse_descriptions,
+    client,
+    permissive_robots_txt,
+    content_url,
+    scrape_result,
+):
+    responses.get(
+        "http://backend-service/domains/recipe.migrated.example.test",
+        json={},
+    )
+    responses.get(content_url, status=200)
+
+    scrape_html.return_value = scrape_result
+    parsed = {
+        "ingredient-parser-service": ["test ingredient"],
+        "quantity-parser-service": [{"magnitude": 1, "units": "g"}] * 5,
+    }
+    parse_descriptions.side_effect = lambda service, **kwargs: parsed[service]
+
+    response = client.post("/crawl", data={"url": content_url, "resolve": "true"})
+    resolves_to = response.json.get("url", {}).get("resolves_to")
+    title = response.json.get("recipe", {}).get("title")
+
+    assert resolves_to == "https://recipe.migrated.example.test/recipe/canonical"
+    assert title == "test"
+    assert scrape_html.call_count == 1
+
+
+@responses.activate
+@pytest.mark.parametrize(
+    "revalidation",
+    [
+        {"status": 304},
+        {"status": 200, "body": "<html>recipe</html>"},
+    ],
+)
+@patch("web.parsing.parse_descriptions")
+@patch("web.scrapers.scrape_html")
+def test_crawl_revalidation(
+    scrape_html,
+    parse_descriptions,
+    client,
+    permissive_robots_txt,
+    content_url,
+    scrape_result,
+    revalidation,
+):
+    responses.get(
+        "http://backend-service/domains/recipe.migrated.example.test",
+        json={},
+    )
+    responses.get(
+        content_url,
+        body="<html>recipe</html>",
+        headers={"ETag": '"v1"', "Last-Modified": "Fri, 2 Jan 1970 03:04 GMT"},
+    )
+    conditions = matchers.header_matcher(
+        {"If-None-Match": '"v1"', "If-Modified-Since": "Fri, 2 Jan 1970 03:04 GMT"}
+    )
+    responses.get(content_url, match=[conditions], **revalidation)
+
+    scrape_html.return_value = scrape_result
+    parse_descriptions.side_effect = lambda service, descriptions, **kwargs: [
+        {"magnitude": 1, "units": "g"} for _ in descriptions
+    ]
+
+    initial = client.post("/crawl", data={"url": content_url})
+    crawl_state.clear()  # disregard the crawl delay
+    revalidated = client.post("/crawl", data={"url": content_url})
+
+    assert initial.status_code == revalidated.status_code == 200
+    assert "not_modified" not in initial.json["metadata"]
+    assert revalidated.json["metadata"]["not_modified"] is True
+    assert revalidated.json["recipe"] == initial.json["recipe"]
+    assert scrape_html.call_count == 1
+
+
+@responses.activate
+@patch("web.parsing.parse_descriptions")
+@patch("web.scrapers.scrape_html")
+def test_crawl_trace(
+    scrape_html,
+    parse_descriptions,
+    client,
+    permissive_robots_txt,
+    content_url,
+    scrape_result,
+):
+    responses.get(
+        "http://backend-service/domains/recipe.migrated.example.test",
+        json={},
+    )
+    responses.get(
+        content_url,
+        body="<html>recipe</html>",
+        headers={"X-Cache": "HIT from proxy"},
+    )
+
+    scrape_html.return_value = scrape_result
+    parse_descriptions.side_effect = lambda service, descriptions, **kwargs: [
+        {"magnitude": 1, "units": "g"} for _ in descriptions
+    ]
+
+    untraced = client.post("/crawl", data={"url": content_url})
+    crawl_state.clear()  # disregard the crawl delay
+    traced = client.post("/crawl", data={"url": content_url, "trace": "1"})
+    trace = traced.json["metadata"]["trace"]
+
+    assert "trace" not in untraced.json["metadata"]
+    assert {"domain_config", "robots", "politeness", "origin_fetch", "total"} <= set(
+        trace["stages"]
+    )
+    assert trace["origin"]["status"] == 200
+    assert trace["origin"]["bytes"] == len("<html>recipe</html>")
+    assert trace["politeness"]["crawl_delay_wait"] == 0
+    assert trace["cache"] == {
+        "domain_config": True,
+        "robots": True,
+        "revalidation": True,
+        "squid": "hit",
+    }
+
+
+@responses.activate
+def test_resolve_trace_header(client, permissive_robots_txt, content_url):
+    responses.get(
+        "http://backend-service/domains/recipe.migrated.example.test",
+        json={},
+    )
+    crawl_state.extend_backoff(get_domain(content_url), 30, now=time())
+
+    response = client.post(
+        "/resolve",
+        data={"url": content_url},
+        headers={"X-Crawler-Trace": "true"},
+    )
+    trace = response.json["metadata"]["trace"]
+
+    assert response.status_code == 429
+    assert 0 < trace["politeness"]["backoff_remaining"] <= 30
+    assert "origin_fetch" not in trace["stages"]
+
+
+@responses.activate
+def test_crawl_concurrency_limit(client, permissive_robots_txt, origin_domain):
+    from web.adaptive import origin_limits
+
+    responses.get(f"http://backend-service/domains/{origin_domain}", json={})
+    assert origin_limits.acquire(origin_domain)
+
+    response = client.post("/crawl", data={"url": f"https://{origin_domain}/"})
+
+    assert response.status_code == 429
+    assert "concurrency limit" in response.json["error"]["message"]
+
+
+@responses.activate
+def test_crawl_scheduler_failure(client, permissive_robots_txt, origin_domain):
+    from web.adaptive import origin_limits
+    from web.politeness import scheduler
+
+    responses.get(f"http://backend-service/domains/{origin_domain}", json={})
+
+    with patch.object(scheduler, "acquire", side_effect=ConnectionError):
+        response = client.post("/crawl", data={"url": f"https://{origin_domain}/"})
+
+    assert response.status_code == 500
+
+    # The fetch slot taken for the request is returned
+    assert origin_limits.acquire(origin_domain)
+
+
+@responses.activate
+def test_crawl_timeout_sampled(client, permissive_robots_txt, origin_domain):
+    from web.adaptive import origin_limits
+
+    url = f"https://{origin_domain}/"
+    responses.get(f"http://backend-service/domains/{origin_domain}", json={})
+    responses.get(url, body=ReadTimeout())
+    for _ in range(20):
+        origin_limits.record(origin_domain, latency=0.1)
+    timeout = origin_limits.timeout(origin_domain)
+
+    response = client.post("/crawl", data={"url": url})
+
+    assert response.status_code == 429
+    assert origin_limits.timeout(origin_domain) > timeout
+
+
+@responses.activate
+def test_resolve_decays_backoff(client, permissive_robots_txt, content_url):
+    domain = get_domain(content_url)
+    responses.get(f"http://backend-service/domains/{domain}", json={})
+    responses.get(content_url, status=200)
+    crawl_state.extend_backoff(domain, 4, now=time() - 10)
+
+    response = client.post("/resolve", data={"url": content_url})
+
+    assert response.status_code == 200
+    assert crawl_state.extend_backoff(domain, 1, now=time()) == 3
+
+
+@responses.activate
+@pytest.mark.parametrize(
+    "headers, status",
+    [
+        ({"Content-Type": "image/jpeg"}, 415),
+        ({"Content-Type": "text/html", "Content-Length": "1048576000"}, 413),
+    ],
+)
+def test_crawl_rejects_by_headers(
+    client, permissive_robots_txt, content_url, headers, status
+):
+    responses.get(
+        "http://backend-service/domains/recipe.migrated.example.test",
+        json={},
+    )
+    responses.get(content_url, headers=headers, body=b"")
+
+    response = client.post("/crawl", data={"url": content_url})
+
+    assert response.status_code == status
+
+
+@responses.activate
+@patch("web.app.ORIGIN_MAX_BYTES", 1024)
+def test_crawl_body_size_limit(client, permissive_robots_txt, content_url):
+    responses.get(
+        "http://backend-service/domains/recipe.migrated.example.test",
+        json={},
+    )
+    responses.get(content_url, body="<html>" + "x" * 1024 + "</html>")
+
+    response = client.post("/crawl", data={"url": content_url})
+
+    assert response.status_code == 413
+    assert "exceeds 1024 bytes" in response.json["error"]["message"]
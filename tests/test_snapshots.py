@@ -0,0 +1,115 @@
+from time import time
+
+import pytest
+
+from web.caching import CoalescingCache
+from web.robots import ROBOTS_TXT_TTL, RobotsPolicy
+from web.snapshots import CacheSnapshot
+
+
+def unexpected_load(key):
+    raise AssertionError(f"unexpected load of {key}")
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    return str(tmp_path / "snapshot.json.gz")
+
+
+def build_snapshot(path):
+    domains = CoalescingCache(ttl=300, stale_ttl=3600, maxsize=10)
+    robots = CoalescingCache(ttl=3600, stale_ttl=86400, maxsize=10)
+    snapshot = CacheSnapshot(
+        path=path,
+        caches={
+            "domains": (domains, dict, dict),
+            "robots": (robots, RobotsPolicy.dump, RobotsPolicy.load),
+        },
+    )
+    return snapshot, domains, robots
+
+
+def test_snapshot_round_trip(snapshot_path):
+    snapshot, domains, robots = build_snapshot(snapshot_path)
+    domains.set("example.test", {"crawl_enabled": False})
+    robots_txt = b"User-agent: *\nCrawl-delay: 2\nDisallow: /private\n"
+    robots.set("https://example.test/robots.txt", RobotsPolicy(robots_txt, ttl=60))
+    snapshot.save()
+
+    restored, domains, robots = build_snapshot(snapshot_path)
+
+    assert restored.load() == 2
+    domain = domains.get("example.test", unexpected_load)
+    policy = robots.get("https://example.test/robots.txt", unexpected_load)
+    assert domain == {"crawl_enabled": False}
+    assert policy.content == robots_txt
+    assert policy.matcher.check("https://example.test/private") == (False, 2)
+    assert domains.stats["hits"] == robots.stats["hits"] == 1
+
+
+def test_snapshot_retains_freshness(snapshot_path):
+    snapshot, domains, _ = build_snapshot(snapshot_path)
+    domains.set("fresh.example.test", {}, ttl=300)
+    domains.set("stale.example.test", {}, ttl=-60)
+    domains.set("expired.example.test", {}, ttl=-7200)
+    snapshot.save()
+
+    restored, domains, _ = build_snapshot(snapshot_path)
+    restored.load()
+
+    assert "fresh.example.test" in domains
+    assert "stale.example.test" in domains
+    assert "expired.example.test" not in domains
+    fresh_until = {key: until for key, _, until in domains.snapshot()}
+    assert time() + 290 < fresh_until["fresh.example.test"] <= time() + 300
+    assert domains.get("stale.example.test", lambda key: {}) == {}
+    assert domains.stats["stale_hits"] == 1
+
+
+def test_snapshot_merges_workers(snapshot_path):
+    worker_a, domains_a, _ = build_snapshot(snapshot_path)
+    worker_b, domains_b, _ = build_snapshot(snapshot_path)
+    domains_a.set("a.example.test", {"worker": "a"})
+    domains_a.set("shared.example.test", {"worker": "a"}, ttl=10)
+    domains_b.set("shared.example.test", {"worker": "b"}, ttl=100)
+    worker_b.save()
+    worker_a.save()
+
+    restored, domains, _ = build_snapshot(snapshot_path)
+    restored.load()
+
+    assert domains.get("a.example.test", unexpected_load) == {"worker": "a"}
+    assert domains.get("shared.example.test", unexpected_load) == {"worker": "b"}
+
+
+def test_snapshot_unreadable(snapshot_path):
+    with open(snapshot_path, "wb") as f:
+        f.write(b"not a snapshot")
+
+    snapshot, domains, _ = build_snapshot(snapshot_path)
+
+    assert snapshot.load() == 0
+    domains.set("example.test", {})
+    snapshot.save()
+
+    restored, domains, _ = build_snapshot(snapshot_path)
+    assert restored.load() == 1
+
+
+def test_snapshot_disabled():
+    snapshot, domains, _ = build_snapshot(None)
+    domains.set("example.test", {})
+
+    snapshot.save()
+    snapshot.start()
+
+    assert snapshot.load() == 0
+
+
+def test_robots_policy_serialization():
+    policy = RobotsPolicy(b"User-agent: *\nDisallow: /\xe9\n", ttl=ROBOTS_TXT_TTL)
+
+    restored = RobotsPolicy.load(policy.dump())
+
+    assert restored.content == policy.content
+    assert restored.ttl == ROBOTS_TXT_TTL
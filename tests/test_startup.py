@@ -0,0 +1,46 @@
+import subprocess
+import sys
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+import pytest
+
+from web import gunicorn_config, scrapers
+from web.startup import warm
+
+
+def test_lazy_registry():
+    script = (
+        "import sys, web.app; from web import scrapers; "
+        "assert 'recipe_scrapers' not in sys.modules; "
+        "scrapers.scrape_html; assert 'recipe_scrapers' in sys.modules"
+    )
+
+    subprocess.run([sys.executable, "-c", script], check=True)
+
+
+def test_lazy_names():
+    from recipe_scrapers import SCRAPERS
+
+    assert scrapers.SCRAPERS is SCRAPERS
+    with pytest.raises(AttributeError):
+        scrapers.unknown
+
+
+@patch("web.startup.gc")
+def test_warm(gc):
+    warm()
+
+    assert "recipe_scrapers" in sys.modules
+    gc.freeze.assert_called_once()
+
+
+@patch("web.startup.warm")
+def test_warm_when_preloading(warm):
+    server = SimpleNamespace(cfg=SimpleNamespace(preload_app=False), log=Mock())
+    gunicorn_config.when_ready(server)
+    assert not warm.called
+
+    server.cfg.preload_app = True
+    gunicorn_config.when_ready(server)
+    assert warm.called
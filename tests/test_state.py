@@ -0,0 +1,229 @@
+from fnmatch import fnmatch
+from multiprocessing import get_context
+from threading import Lock
+
+import pytest
+
+from web.state import (
+    DECAY_BACKOFF_SCRIPT,
+    RESERVE_SCRIPT,
+    MemoryStateStore,
+    RedisStateStore,
+    StateStore,
+    SharedMemoryStateStore,
+    open_state_store,
+)
+
+
+# A local stand-in for the subset of Redis commands used by RedisStateStore
+class FakeRedis:
+    def __init__(self, clock):
+        self.clock = clock
+        self.values = {}
+        self.expiries = {}
+        self.zsets = {}
+        self.lock = Lock()
+
+    def _expire(self, name):
+        expiry = self.expiries.get(name)
+        if expiry is not None and expiry <= self.clock.now * 1000:
+            self.values.pop(name, None)
+            self.expiries.pop(name, None)
+
+    def zscore(self, name, member):
+        return self.zsets.get(name, {}).get(member)
+
+    def zadd(self, name, mapping, gt=False):
+        with self.lock:
+            zset = self.zsets.setdefault(name, {})
+            for member, score in mapping.items():
+                if gt and member in zset and zset[member] >= score:
+                    continue
+                zset[member] = score
+
+    def zincrby(self, name, amount, value):
+        with self.lock:
+            zset = self.zsets.setdefault(name, {})
+            zset[value] = zset.get(value, 0) + amount
+            return zset[value]
+
+    # Scripts are run as their Python equivalents
+    def register_script(self, script):
+        scripts = {
+            RESERVE_SCRIPT: self._reserve,
+            DECAY_BACKOFF_SCRIPT: self._decay_backoff,
+        }
+        return scripts[script]
+
+    def _reserve(self, keys, args):
+        (name,), (now, interval, max_wait) = keys, args
+        with self.lock:
+            self._expire(name)
+            slot = max(now, self.values.get(name, now))
+            if slot - now <= max_wait:
+                self.values[name] = slot + interval
+                self.expiries[name] = (slot + interval) * 1000
+            return str(slot - now).encode()
+
+    def _decay_backoff(self, keys, args):
+        (name,), (member, factor, minimum) = keys, args
+        with self.lock:
+            zset = self.zsets.get(name, {})
+            if member not in zset:
+                return b"0"
+            duration = zset[member] * factor
+            if duration < minimum:
+                del zset[member]
+                return b"0"
+            zset[member] = duration
+            return str(duration).encode()
+
+    def scan_iter(self, match):
+        keys = [*self.values, *self.zsets]
+        return [key for key in keys if fnmatch(key, match)]
+
+    def delete(self, name):
+        with self.lock:
+            self.values.pop(name, None)
+            self.expiries.pop(name, None)
+            self.zsets.pop(name, None)
+
+
+class FakeClock:
+    now = 1_000_000.0
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture(params=["memory", "shared-memory", "redis"])
+def store(request, clock, tmp_path):
+    if request.param == "memory":
+        return MemoryStateStore()
+    if request.param == "shared-memory":
+        return SharedMemoryStateStore(str(tmp_path / "state"), capacity=64)
+    return RedisStateStore(FakeRedis(clock))
+
+
+def test_reserve_spacing(store, clock):
+    now = clock.now
+
+    assert store.reserve("example.test", 5, 0, now) == 0
+    assert store.reserve("example.test", 5, 0, now) == 5
+    assert store.reserve("other.test", 5, 0, now) == 0
+
+    clock.now = now + 3
+    assert store.reserve("example.test", 5, 0, clock.now) == 2
+
+    clock.now = now + 5
+    assert store.reserve("example.test", 5, 0, clock.now) == 0
+
+
+def test_reserve_bounded_wait(store, clock):
+    now = clock.now
+    waits = [store.reserve("example.test", 4, 10, now) for _ in range(4)]
+
+    assert waits == [0, 4, 8, 12]
+    assert store.reserve("example.test", 4, 10, now + 4) == 8
+
+
+def test_reserve_clock_skew(store, clock):
+    now = clock.now
+    store.reserve("example.test", 5, 0, now)
+
+    # A host whose clock is ahead of the others' waits for no slot
+    assert store.reserve("example.test", 5, 10, now + 60) == 0
+
+
+def test_backoff(store, clock):
+    now = clock.now
+    assert "example.test" not in store
+    assert store.backoff("example.test", now) == 0
+
+    assert store.extend_backoff("example.test", 1, now) == 1
+    assert store.extend_backoff("example.test", 1, now) == 2
+    assert store.raise_backoff("example.test", 1, now) == 2
+    assert store.raise_backoff("example.test", 30, now) == 30
+
+    assert "example.test" in store
+    assert store.backoff("example.test", now + 10) == 20
+    assert store.backoff("example.test", now + 40) == 0
+    assert store.backoff("other.test", now) == 0
+
+
+def test_backoff_decay(store, clock):
+    now = clock.now
+    assert store.decay_backoff("example.test", 0.5, now) == 0
+
+    store.extend_backoff("example.test", 3, now)
+    assert store.decay_backoff("example.test", 0.5, now) == 1.5
+    assert store.extend_backoff("example.test", 1, now) == 2.5
+
+    # Backoffs that decay below a second are forgotten
+    assert store.decay_backoff("example.test", 0.5, now) == 1.25
+    assert store.decay_backoff("example.test", 0.5, now) == 0
+    assert "example.test" not in store
+    assert store.extend_backoff("example.test", 1, now) == 1
+
+
+def test_backoff_decay_during_backoff(store, clock):
+    now = clock.now
+    store.extend_backoff("example.test", 1, now)
+
+    # Forgetting the duration does not end the backoff that is in effect
+    assert store.decay_backoff("example.test", 0.5, now) == 0
+    assert "example.test" not in store
+    assert store.backoff("example.test", now + 0.5) == 0.5
+    assert store.backoff("example.test", now + 1) == 0
+
+
+def test_clear(store, clock):
+    store.reserve("example.test", 5, 0, clock.now)
+    store.extend_backoff("example.test", 5, clock.now)
+
+    store.clear()
+
+    assert "example.test" not in store
+    assert store.reserve("example.test", 5, 0, clock.now) == 0
+
+
+def test_shared_memory_eviction(clock, tmp_path):
+    store = SharedMemoryStateStore(str(tmp_path / "state"), capacity=4)
+    domains = [f"{n}.example.test" for n in range(8)]
+    for offset, domain in enumerate(domains):
+        store.extend_backoff(domain, 1, clock.now + offset)
+
+    assert sum(domain in store for domain in domains) == 4
+    assert domains[-1] in store
+
+
+def _reserve_slot(path, now):
+    return SharedMemoryStateStore(path).reserve("example.test", 60, 0, now)
+
+
+def test_shared_memory_across_processes(clock, tmp_path):
+    path = str(tmp_path / "state")
+    with get_context("fork").Pool(4) as pool:
+        waits = pool.starmap(_reserve_slot, [(path, clock.now)] * 16)
+
+    assert waits.count(0) == 1
+
+
+def test_abstract_state_store():
+    class PartialStateStore(StateStore):
+        def reserve(self, domain, interval, max_wait, now):
+            return 0
+
+    with pytest.raises(TypeError):
+        PartialStateStore()
+
+
+def test_open_state_store(tmp_path):
+    assert isinstance(open_state_store(None), MemoryStateStore)
+    assert isinstance(
+        open_state_store(f"file://{tmp_path}/state"), SharedMemoryStateStore
+    )
+    with pytest.raises(ValueError):
+        open_state_store("ftp://example.test/state")
@@ -0,0 +1,123 @@
+from os import getenv
+from threading import Lock
+
+from cacheout import LRUCache
+
+ORIGIN_TIMEOUT = float(getenv("ORIGIN_TIMEOUT", 5))
+ORIGIN_TIMEOUT_MIN = float(getenv("ORIGIN_TIMEOUT_MIN", 2))
+ORIGIN_TIMEOUT_MAX = float(getenv("ORIGIN_TIMEOUT_MAX", 15))
+ORIGIN_MAX_CONCURRENCY = int(getenv("ORIGIN_MAX_CONCURRENCY", 4))
+
+P99_DEVIATIONS = 2.33  # of a normal distribution
+
+
+class DomainStats:
+    def __init__(self):
+        self.samples = 0
+        self.latency = 0.0
+        self.variance = 0.0
+        self.error_rate = 0.0
+        self.limit = 1.0
+        self.in_flight = 0
+
+
+# Per-domain origin fetch limits, adapted to each domain's observed behaviour.
+#
+# Response times (to first byte) are tracked as an exponentially-weighted mean
+# and variance, and the fetch timeout is an approximate p99 of those times
+# multiplied by a safety factor, within bounds.  Fetches that time out are
+# recorded with the timeout as their response time, since otherwise only the
+# responses that arrived in time would be sampled.  The number of fetches that
+# each process may have in progress for a domain grows additively with each
+# success and is halved by throttling, server errors and timeouts.
+class AdaptiveLimits:
+    def __init__(
+        self,
+        timeout=ORIGIN_TIMEOUT,
+        min_timeout=ORIGIN_TIMEOUT_MIN,
+        max_timeout=ORIGIN_TIMEOUT_MAX,
+        factor=3,
+        max_concurrency=ORIGIN_MAX_CONCURRENCY,
+        alpha=0.1,
+        warmup=5,
+        maxsize=10_000,
+    ):
+        self.default_timeout = timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.factor = factor
+        self.max_concurrency = max_concurrency
+        self.alpha = alpha
+        self.warmup = warmup
+        self.domains = LRUCache(maxsize=maxsize)
+        self._lock = Lock()
+
+    def _stats(self, domain):
+        stats = self.domains.get(domain)
+        if stats is None:
+            stats = DomainStats()
+            self.domains.set(domain, stats)
+        return stats
+
+    def clear(self):
+        self.domains.clear()
+
+    def timeout(self, domain):
+        with self._lock:
+            stats = self._stats(domain)
+            if stats.samples < self.warmup:
+                return self.default_timeout
+            p99 = stats.latency + P99_DEVIATIONS * stats.variance**0.5
+        timeout = p99 * self.factor
+        return min(max(timeout, self.min_timeout), self.max_timeout)
+
+    def acquire(self, domain):
+        with self._lock:
+            stats = self._stats(domain)
+            if stats.in_flight >= int(stats.limit):
+                return False
+            stats.in_flight += 1
+            return True
+
+    # Releases a fetch that was not attempted
+    def release(self, domain):
+        with self._lock:
+            stats = self._stats(domain)
+            stats.in_flight = max(stats.in_flight - 1, 0)
+
+    # Releases a fetch, given its response time (if any) and whether the origin
+    # was overloaded
+    def record(self, domain, latency=None, failed=False):
+        with self._lock:
+            stats = self._stats(domain)
+            stats.in_flight = max(stats.in_flight - 1, 0)
+            stats.error_rate += self.alpha * (failed - stats.error_rate)
+
+            if failed:
+                stats.limit = max(stats.limit / 2, 1)
+            else:
+                stats.limit = min(stats.limit + 1 / stats.limit, self.max_concurrency)
+
+            if latency is not None:
+                stats.samples += 1
+                if stats.samples == 1:
+                    stats.latency = latency
+                    return
+                deviation = latency - stats.latency
+                increment = self.alpha * deviation
+                stats.latency += increment
+                stats.variance = (1 - self.alpha) * (
+                    stats.variance + deviation * increment
+                )
+
+    def describe(self, domain):
+        with self._lock:
+            stats = self._stats(domain)
+            return {
+                "latency": round(stats.latency, 6),
+                "error_rate": round(stats.error_rate, 6),
+                "concurrency_limit": int(stats.limit),
+            }
+
+
+origin_limits = AdaptiveLimits()
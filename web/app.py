@@ -1,24 +1,69 @@
-from datetime import UTC, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, datetime
+from functools import wraps
+import json
+from math import ceil
 from os import getenv
-from time import sleep
+from queue import Queue
+from threading import Event
+from time import perf_counter
 
-from flask import Flask, request
-from recipe_scrapers.__version__ import __version__ as rs_version
-from requests.exceptions import ConnectionError, HTTPError, ReadTimeout
+from flask import Flask, Response, request
+import httpx
+from requests.exceptions import ConnectionError, ReadTimeout, Timeout
 
-from web.domains import domain_backoffs, get_domain
+from web.adaptive import origin_limits
+from web.async_clients import engine
+from web.downloads import ORIGIN_MAX_BYTES, read_body
 from web.exceptions import (
     CanonicalURLNotFound,
     DomainConfigurationUnavailable,
     DomainCrawlProhibited,
+    ResponseTooLarge,
+    UnsupportedContentType,
 )
-from web.parsing import parse_retry_duration, scrape_recipe, scrape_canonical_url
-from web.robots import can_fetch, crawl_delay
+from web.frontier import CrawlFrontier
+from web.metrics import (
+    domain_requests,
+    outcome_of,
+    render_metrics,
+    response_sizes,
+    stage,
+)
+from web.parsing import (
+    Document,
+    parse_retry_duration,
+    scrape_recipe,
+    scrape_canonical_url,
+)
+from web.politeness import (
+    backoff_remaining,
+    decay_backoff,
+    extend_backoff,
+    raise_backoff,
+    scheduler,
+)
+from web.revalidation import (
+    conditional_headers,
+    get_validators,
+    is_unmodified,
+    store_validators,
+)
+from web.robots import robots_rules
+from web.scrapers import host_index, rs_version
+from web.snapshots import cache_snapshot
+from web.tracing import annotate, tracing
+from web.urls import get_domain
 from web.web_clients import select_client
 
 app = Flask(__name__)
 image_version = getenv("IMAGE_VERSION")
 
+cache_snapshot.load()
+
+BATCH_CONCURRENCY = int(getenv("BATCH_CONCURRENCY", 16))
+BATCH_MAX_WAIT = float(getenv("BATCH_MAX_WAIT", 60))
+
 
 def _service_metadata():
     return {
@@ -27,6 +72,202 @@ def _service_metadata():
     }
 
 
+def _error(message, status, retry_after=None):
+    headers = {}
+    if retry_after:
+        headers["Retry-After"] = str(ceil(retry_after))
+    return {"error": {"message": message}}, status, headers
+
+
+# Recipes cannot be extracted from unsupported websites, so they are rejected
+# before any requests are made
+def _unsupported():
+    message = "website is not implemented"
+    return _error(message, 501)
+
+
+def _admit(url, domain, operation, max_wait=None):
+    with stage("domain_config") as span:
+        try:
+            domain_http_client, headers = select_client(domain)
+        except DomainConfigurationUnavailable:
+            span.outcome = "unavailable"
+            message = f"unable to retrieve {url} domain configuration"
+            return None, _error(message, 500)
+        except DomainCrawlProhibited:
+            span.outcome = "prohibited"
+            message = f"{operation} of {url} disallowed by configuration"
+            return None, _error(message, 403)
+
+    with stage("robots") as span:
+        allowed, delay = robots_rules(url)
+        if not allowed:
+            span.outcome = "disallowed"
+            message = f"crawling {url} disallowed by robots.txt"
+            return None, _error(message, 403)
+
+    with stage("politeness") as span:
+        backoff = backoff_remaining(domain)
+        if backoff:
+            annotate("politeness", backoff_remaining=round(backoff, 6))
+            span.outcome = "backoff"
+            print(f"* Backing off for {domain}")
+            message = f"backing off for {domain}"
+            return None, _error(message, 429, retry_after=backoff)
+
+        # Fetches already in progress count against the domain's limit
+        if not origin_limits.acquire(domain):
+            span.outcome = "saturated"
+            message = f"concurrency limit reached for {domain}"
+            return None, _error(message, 429, retry_after=delay)
+
+        # The fetch slot is returned unless a fetch will be made with it
+        try:
+            wait = scheduler.acquire(domain, delay, max_wait)
+        except BaseException:
+            origin_limits.release(domain)
+            raise
+        if wait:
+            origin_limits.release(domain)
+            span.outcome = "delayed"
+            message = f"crawl delay in effect for {domain}"
+            return None, _error(message, 429, retry_after=wait)
+
+    return (domain_http_client, headers), None
+
+
+def _fetch(url, domain, operation, max_wait=None, conditions=None):
+    admission, error = _admit(url, domain, operation, max_wait)
+    if error:
+        domain_requests.increment(domain, error[1])
+        return None, error
+    domain_http_client, headers = admission
+    headers = {**headers, **(conditions or {})}
+
+    with stage("origin_fetch") as span:
+        timeout = origin_limits.timeout(domain)
+        annotate("origin", timeout=round(timeout, 6), **origin_limits.describe(domain))
+        started = perf_counter()
+        try:
+            if engine.enabled:
+                fetch = engine.fetch(
+                    domain_http_client,
+                    url,
+                    headers=headers,
+                    timeout=timeout,
+                    max_bytes=ORIGIN_MAX_BYTES,
+                )
+                response = engine.run(fetch)
+            else:
+                response = domain_http_client.get(
+                    url, headers=headers, timeout=timeout, stream=True
+                )
+                read_body(response, ORIGIN_MAX_BYTES)
+        except UnsupportedContentType as e:
+            origin_limits.record(domain)
+            span.outcome = "rejected"
+            domain_requests.increment(domain, "rejected")
+            return None, _error(f"unsupported content type {e} at {url}", 415)
+        except ResponseTooLarge:
+            origin_limits.record(domain)
+            span.outcome = "rejected"
+            domain_requests.increment(domain, "rejected")
+            message = f"content at {url} exceeds {ORIGIN_MAX_BYTES} bytes"
+            return None, _error(message, 413)
+        except (ConnectionError, ReadTimeout, httpx.TransportError) as e:
+            # A timeout is recorded as a response time of the timeout itself;
+            # the true time is longer, so the timeout grows for slow origins
+            timed_out = isinstance(e, (Timeout, httpx.TimeoutException))
+            latency = timeout if timed_out else None
+            origin_limits.record(domain, latency=latency, failed=True)
+            span.outcome = "timeout"
+            domain_requests.increment(domain, "timeout")
+            duration = extend_backoff(domain, 1)
+            print(f"* Setting backoff on {domain} for {duration:.0f} seconds")
+            message = f"timeout; adding backoff for {domain}"
+            return None, _error(message, 429, retry_after=duration)
+        except Exception:
+            origin_limits.release(domain)
+            raise
+        span.outcome = outcome_of(response.status_code)
+        span.status = response.status_code
+    domain_requests.increment(domain, response.status_code)
+    response_sizes.observe(len(response.content))
+    _annotate_origin(response, perf_counter() - started)
+
+    # Throttling and server errors indicate an overloaded origin
+    overloaded = response.status_code == 429 or response.status_code >= 500
+    latency = response.elapsed.total_seconds()
+    origin_limits.record(domain, latency=latency, failed=overloaded)
+    if not overloaded:
+        decay_backoff(domain)
+
+    if not response.ok and "Retry-After" in response.headers:
+        retry_duration = parse_retry_duration(
+            from_moment=datetime.now(tz=UTC),
+            retry_after=response.headers["Retry-After"],
+        )
+        if retry_duration:
+            raise_backoff(domain, retry_duration)
+
+    return response, None
+
+
+def _annotate_origin(response, duration):
+    ttfb = response.elapsed.total_seconds()
+    annotate(
+        "origin",
+        status=response.status_code,
+        bytes=len(response.content),
+        ttfb=round(ttfb, 6),
+        download=round(max(duration - ttfb, 0), 6),
+        redirects=len(response.history),
+    )
+    # Squid reports whether the content was served from its cache
+    squid_cache = response.headers.get("X-Cache", "").split(" ")[0].lower()
+    annotate("cache", squid=squid_cache or None)
+
+
+@app.before_request
+def start_cache_snapshots():
+    cache_snapshot.start()
+
+
+@app.route("/hosts")
+def hosts():
+    return {"metadata": _service_metadata(), "hosts": list(host_index())}
+
+
+@app.route("/metrics")
+def metrics():
+    content, content_type = render_metrics()
+    return Response(content, content_type=content_type)
+
+
+def _trace_requested():
+    requested = request.form.get("trace") or request.headers.get("X-Crawler-Trace")
+    return (requested or "").lower() in ("1", "true")
+
+
+# Measures the total duration of a resolution or crawl of a single URL, and
+# reports a breakdown of the time spent in the response metadata on request
+def _timed(handler):
+    @wraps(handler)
+    def timed(*args, trace=False, **kwargs):
+        with tracing(trace) as current_trace:
+            with stage("total") as span:
+                body, status, *headers = handler(*args, **kwargs)
+                span.status = status
+                span.outcome = outcome_of(status)
+
+        if current_trace:
+            metadata = {**body.get("metadata", {}), "trace": current_trace.report()}
+            body = {**body, "metadata": metadata}
+        return body, status, *headers
+
+    return timed
+
+
 @app.route("/resolve", methods=["POST"])
 def resolve():
     url = request.form.get("url")
@@ -34,76 +275,64 @@ def resolve():
         message = "url parameter is required"
         return {"error": {"message": message}}, 400
 
-    domain = get_domain(url)
-    try:
-        domain_http_client, headers = select_client(domain)
-    except DomainConfigurationUnavailable:
-        message = f"unable to retrieve {url} domain configuration"
-        return {"error": {"message": message}}, 500
-    except DomainCrawlProhibited:
-        message = f"url resolution of {url} disallowed by configuration"
-        return {"error": {"message": message}}, 403
-
-    if not can_fetch(url):
-        message = f"crawling {url} disallowed by robots.txt"
-        return {"error": {"message": message}}, 403
-
-    if domain in domain_backoffs:
-        start = domain_backoffs[domain]["timestamp"]
-        duration = domain_backoffs[domain]["duration"]
-
-        if datetime.now(tz=UTC) < (start + duration):
-            print(f"* Backing off for {domain}")
-            sleep(duration.seconds)
-            message = f"backing off for {domain}"
-            return {"error": {"message": message}}, 429
+    return _resolve(url, trace=_trace_requested())
 
-    delay = crawl_delay(url)
-    if delay:
-        sleep(delay)
 
-    retry_duration = 0
-    try:
-        response = domain_http_client.get(url, headers=headers, timeout=5)
-        if not response.ok and "Retry-After" in response.headers:
-            retry_duration = parse_retry_duration(
-                from_moment=datetime.now(tz=UTC),
-                retry_after=response.headers["Retry-After"],
-            )
-    except (ConnectionError, ReadTimeout):
-        duration = timedelta(seconds=1)
-        if domain in domain_backoffs:
-            duration += domain_backoffs[domain]["duration"]
-        domain_backoffs[domain] = {
-            "timestamp": datetime.now(tz=UTC),
-            "duration": duration,
-        }
-        print(f"* Setting backoff on {domain} for {duration.seconds} seconds")
-        sleep(duration.seconds)
-        message = f"timeout; adding backoff for {domain}"
-        return {"error": {"message": message}}, 429
-    finally:
-        if retry_duration:
-            existing_duration = domain_backoffs.get(domain, {}).get("duration") or 0
-            domain_backoffs[domain] = {
-                "timestamp": datetime.now(tz=UTC),
-                "duration": max(existing_duration, retry_duration),
-            }
+@_timed
+def _resolve(url):
+    response, error = _fetch(url, get_domain(url), "url resolution")
+    if error:
+        return error
 
     if not response.ok:
         message = f"received non-success status code from {url}"
         return {"error": {"message": message}}, 400
 
-    # Attempt to identify a canonical URL from the response
+    document = Document.from_response(response)
+    return {
+        "metadata": _service_metadata(),
+        "url": _resolution(document),
+    }, 200
+
+
+def _resolution(document):
+    # Attempt to identify a canonical URL from the document
     try:
-        canonical_url = scrape_canonical_url(response)
+        canonical_url = scrape_canonical_url(document)
     except CanonicalURLNotFound:
         canonical_url = None
+    return {"resolves_to": canonical_url or document.url}
 
-    return {
-        "metadata": _service_metadata(),
-        "url": {"resolves_to": canonical_url or response.url},
-    }
+
+@_timed
+def _crawl(url, max_wait=None, resolve=False):
+    if not host_index().supports(url):
+        return _unsupported()
+
+    domain = get_domain(url)
+    validators = get_validators(url, resolve)
+    annotate("cache", revalidation=validators is not None)
+    conditions = conditional_headers(validators)
+    response, error = _fetch(url, domain, "crawling", max_wait, conditions)
+    if error:
+        return error
+
+    # Content that is unchanged since the previous crawl is not re-extracted
+    if is_unmodified(validators, response):
+        metadata = {**_service_metadata(), "not_modified": True}
+        return {"metadata": metadata, **validators["result"]}, 200
+
+    if not response.ok:
+        message = f"received non-success status code from {url}"
+        return {"error": {"message": message}}, response.status_code
+
+    document = Document.from_response(response, resolve=resolve)
+    result = {"recipe": scrape_recipe(url, domain, document)}
+    if resolve:
+        result["url"] = _resolution(document)
+    if isinstance(result["recipe"], dict):
+        store_validators(url, resolve, response, result)
+    return {"metadata": _service_metadata(), **result}, 200
 
 
 @app.route("/crawl", methods=["POST"])
@@ -113,67 +342,93 @@ def crawl():
         message = "url parameter is required"
         return {"error": {"message": message}}, 400
 
-    domain = get_domain(url)
-    try:
-        domain_http_client, headers = select_client(domain)
-    except DomainConfigurationUnavailable:
-        message = f"unable to retrieve {url} domain configuration"
-        return {"error": {"message": message}}, 500
-    except DomainCrawlProhibited:
-        message = f"crawling {url} disallowed by configuration"
-        return {"error": {"message": message}}, 403
-
-    if not can_fetch(url):
-        message = f"crawling {url} disallowed by robots.txt"
-        return {"error": {"message": message}}, 403
-
-    if domain in domain_backoffs:
-        start = domain_backoffs[domain]["timestamp"]
-        duration = domain_backoffs[domain]["duration"]
-
-        if datetime.now(tz=UTC) < (start + duration):
-            print(f"* Backing off for {domain}")
-            sleep(duration.seconds)
-            message = f"backing off for {domain}"
-            return {"error": {"message": message}}, 429
+    resolve = request.form.get("resolve", "").lower() in ("1", "true")
+    return _crawl(url, resolve=resolve, trace=_trace_requested())
+
 
-    delay = crawl_delay(url)
-    if delay:
-        sleep(delay)
+# Crawls URLs from the frontier until it is drained, or until the batch is
+# stopped; a result is posted for each URL handed out
+def _crawl_frontier(frontier, results, stopped, trace=False):
+    while (entry := frontier.get()) is not None:
+        domain, url, _ = entry
+        if stopped.is_set():
+            frontier.done(domain)
+            return
+        try:
+            result = _crawl(url, max_wait=BATCH_MAX_WAIT, trace=trace)
+        except Exception:
+            message = f"unexpected error while crawling {url}"
+            result = _error(message, 500)
+        body, status = result[:2]
+        results.put({"url": url, "status": status, **body})
+        _release(frontier, domain, url)
 
-    retry_duration = 0
+
+# A domain becomes eligible for crawling again after its crawl delay, and once
+# any backoff has elapsed; longer waits are left to the admission checks.  The
+# domain is released even if its politeness state is unavailable.
+def _release(frontier, domain, url):
     try:
-        response = domain_http_client.get(url, headers=headers, timeout=5)
-        if not response.ok and "Retry-After" in response.headers:
-            retry_duration = parse_retry_duration(
-                from_moment=datetime.now(tz=UTC),
-                retry_after=response.headers["Retry-After"],
-            )
-        response.raise_for_status()
-    except HTTPError:
-        message = f"received non-success status code from {url}"
-        return {"error": {"message": message}}, response.status_code
-    except (ConnectionError, ReadTimeout):
-        duration = timedelta(seconds=1)
-        if domain in domain_backoffs:
-            duration += domain_backoffs[domain]["duration"]
-        domain_backoffs[domain] = {
-            "timestamp": datetime.now(tz=UTC),
-            "duration": duration,
-        }
-        print(f"* Setting backoff on {domain} for {duration.seconds} seconds")
-        sleep(duration.seconds)
-        message = f"timeout; adding backoff for {domain}"
-        return {"error": {"message": message}}, 429
-    finally:
-        if retry_duration:
-            existing_duration = domain_backoffs.get(domain, {}).get("duration") or 0
-            domain_backoffs[domain] = {
-                "timestamp": datetime.now(tz=UTC),
-                "duration": max(existing_duration, retry_duration),
-            }
+        _, delay = robots_rules(url)
+    except Exception:
+        delay = 0
+    try:
+        backoff = backoff_remaining(domain)
+    except Exception:
+        backoff = 0
 
-    return {
-        "metadata": _service_metadata(),
-        "recipe": scrape_recipe(url, domain, response),
-    }
+    frontier.done(domain, min(delay, BATCH_MAX_WAIT))
+    if 0 < backoff <= BATCH_MAX_WAIT:
+        frontier.defer(domain, backoff)
+
+
+@app.route("/crawl/batch", methods=["POST"])
+def crawl_batch():
+    urls = request.form.getlist("url")
+    trace = _trace_requested()
+    if not urls and request.is_json:
+        payload = request.get_json()
+        if not isinstance(payload, dict):
+            message = "request body must be a JSON object"
+            return {"error": {"message": message}}, 400
+        urls = payload.get("urls") or []
+        trace = trace or payload.get("trace") is True
+    if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+        message = "urls must be a list of strings"
+        return {"error": {"message": message}}, 400
+    if not urls:
+        message = "url parameter is required"
+        return {"error": {"message": message}}, 400
+
+    index = host_index()
+    unsupported = [url for url in urls if not index.supports(url)]
+    urls = [url for url in urls if index.supports(url)]
+
+    # URLs are crawled round-robin across domains, so that workers are not
+    # left waiting upon the crawl delay of any one domain
+    frontier = CrawlFrontier()
+    for url in urls:
+        frontier.put(url)
+    frontier.close()
+    workers = min(BATCH_CONCURRENCY, len({get_domain(url) for url in urls}))
+
+    def stream():
+        for url in unsupported:
+            body, status, _ = _unsupported()
+            yield json.dumps({"url": url, "status": status, **body}) + "\n"
+        if not workers:
+            return
+
+        results, stopped = Queue(), Event()
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            for _ in range(workers):
+                executor.submit(_crawl_frontier, frontier, results, stopped, trace)
+            for _ in urls:
+                yield json.dumps(results.get()) + "\n"
+        finally:
+            # Workers stop once the client disconnects
+            stopped.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return Response(stream(), mimetype="application/x-ndjson")
@@ -0,0 +1,176 @@
+import asyncio
+from collections import defaultdict
+from datetime import UTC, datetime, timedelta
+from functools import cache
+import os
+from threading import Lock, Thread
+from time import perf_counter
+
+import httpx
+
+from web.downloads import CHUNK_SIZE, check_headers
+from web.exceptions import ResponseTooLarge
+from web.web_clients import proxy_cache_client, proxy_tls_context
+
+MAX_REDIRECTS = 30  # consistent with requests.Session
+PER_HOST_CONNECTIONS = int(os.getenv("ASYNC_PER_HOST_CONNECTIONS", 4))
+
+
+# Provides requests.Response-style accessors for an httpx.Response, so that
+# parsing code can remain agnostic to the client that retrieved the content.
+class AsyncResponse:
+    def __init__(self, response):
+        self.raw = response
+        self.url = str(response.url)
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.history = response.history
+        self.elapsed = response.time_to_headers
+
+    @property
+    def ok(self):
+        return not (self.raw.is_client_error or self.raw.is_server_error)
+
+    @property
+    def content(self):
+        return self.raw.content
+
+    @property
+    def text(self):
+        return self.raw.text
+
+
+class DelayableRedirectClient:
+    def __init__(self, per_host_connections=PER_HOST_CONNECTIONS, **kwargs):
+        self.client = httpx.AsyncClient(follow_redirects=False, **kwargs)
+        self.per_host_connections = per_host_connections
+        self._host_limits = defaultdict(self._host_limit)
+
+    def _host_limit(self):
+        return asyncio.Semaphore(self.per_host_connections)
+
+    # Consistent with requests.Response.elapsed, the time until the response
+    # headers are received is retained
+    async def _send(self, request, max_bytes=None):
+        async with self._host_limits[request.url.host]:
+            started = perf_counter()
+            response = await self.client.send(request, stream=True)
+            response.time_to_headers = timedelta(seconds=perf_counter() - started)
+            try:
+                if max_bytes is None:
+                    await response.aread()
+                else:
+                    await self._read_limited(response, max_bytes)
+            finally:
+                await response.aclose()
+            return response
+
+    async def _read_limited(self, response, max_bytes):
+        if response.is_success:
+            check_headers(response.headers, max_bytes)
+        chunks, size = [], 0
+        async for chunk in response.aiter_bytes(CHUNK_SIZE):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > max_bytes:
+                raise ResponseTooLarge(size)
+        response._content = b"".join(chunks)
+
+    async def get(self, url, headers=None, timeout=None, max_bytes=None):
+        from web.parsing import parse_retry_duration
+
+        request = self.client.build_request(
+            "GET", url, headers=headers, timeout=timeout
+        )
+        history = []
+        response = await self._send(request, max_bytes)
+        while response.next_request:
+            if len(history) >= MAX_REDIRECTS:
+                raise httpx.TooManyRedirects(
+                    "Exceeded maximum redirects", request=request
+                )
+            if "Retry-After" in response.headers:
+                duration = parse_retry_duration(
+                    from_moment=datetime.now(tz=UTC),
+                    retry_after=response.headers["Retry-After"],
+                )
+                await asyncio.sleep(duration)
+            await response.aclose()
+            history.append(response)
+            response = await self._send(response.next_request, max_bytes)
+        response.history = history
+        return AsyncResponse(response)
+
+    async def post(self, url, data=None, timeout=None):
+        request = self.client.build_request("POST", url, data=data, timeout=timeout)
+        return await self._send(request)
+
+
+# Loading the CA bundle is costly, so clients share a single context
+@cache
+def default_tls_context():
+    return httpx.create_ssl_context()
+
+
+def _build_clients(transport=None):
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=100)
+    options = {"http2": True, "limits": limits, "transport": transport}
+    proxy = None if transport else "http://proxy:3128"
+    verify = default_tls_context() if transport else proxy_tls_context()
+    return {
+        "microservice": DelayableRedirectClient(
+            http2=False, verify=default_tls_context(), transport=transport
+        ),
+        "proxy_cache": DelayableRedirectClient(proxy=proxy, verify=verify, **options),
+        "web": DelayableRedirectClient(verify=default_tls_context(), **options),
+    }
+
+
+# Runs a single asyncio event loop on a daemon thread per worker process.
+#
+# Synchronous request handlers submit coroutines to the loop and wait upon
+# their results, so that all in-flight fetches within a process share the
+# same connection pools.
+class AsyncEngine:
+    def __init__(self, enabled=False, transport=None):
+        self.enabled = enabled
+        self.transport = transport
+        self.clients = None
+        self._loop = None
+        self._pid = None
+        self._lock = Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return self._loop
+            loop = asyncio.new_event_loop()
+            Thread(target=loop.run_forever, daemon=True).start()
+            self._loop, self._pid, self.clients = loop, os.getpid(), None
+            return loop
+
+    async def _clients(self):
+        if self.clients is None:
+            self.clients = _build_clients(self.transport)
+        return self.clients
+
+    async def client(self, name):
+        clients = await self._clients()
+        return clients[name]
+
+    async def client_for(self, session):
+        name = "proxy_cache" if session is proxy_cache_client else "web"
+        return await self.client(name)
+
+    async def fetch(self, session, url, headers=None, timeout=None, max_bytes=None):
+        client = await self.client_for(session)
+        return await client.get(
+            url, headers=headers, timeout=timeout, max_bytes=max_bytes
+        )
+
+    def run(self, coroutine):
+        loop = self._start()
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+
+engine = AsyncEngine(enabled=os.getenv("CRAWL_ENGINE") == "async")
@@ -0,0 +1,281 @@
+from hashlib import blake2b
+import json
+import os
+import sqlite3
+from threading import Event, Lock, Thread
+from time import time
+
+from cacheout import LRUCache
+
+from web.metrics import cache_requests
+
+
+def content_digest(content):
+    return blake2b(content, digest_size=16).hexdigest()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = Event()
+        self.value = None
+        self.error = None
+
+
+# An LRU cache of loader results with a freshness TTL.
+#
+# Entries older than the TTL, but younger than TTL + stale_ttl, are served
+# immediately while a single background refresh takes place; concurrent misses
+# for the same key share the result of a single loader invocation.  The TTL of
+# each loaded value may be determined from the value itself by ttl_of.
+#
+# Lookups are counted by result, and reported as metrics if the cache is named.
+class CoalescingCache:
+    def __init__(self, ttl, maxsize, stale_ttl=0, ttl_of=None, timer=time, name=None):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.ttl_of = ttl_of
+        self.timer = timer
+        self.entries = LRUCache(maxsize=maxsize, ttl=ttl + stale_ttl, timer=timer)
+        self.stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "errors": 0,
+        }
+        self._flights = {}
+        self._lock = Lock()
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        with self._lock:
+            for counter in self.stats:
+                self.stats[counter] = 0
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        fresh_until = self.timer() + ttl
+        self.entries.set(key, (value, fresh_until), ttl=ttl + self.stale_ttl)
+
+    # Returns (key, value, fresh_until) for each unexpired entry
+    def snapshot(self):
+        now = self.timer()
+        return [
+            (key, value, fresh_until)
+            for key, (value, fresh_until) in self.entries.items()
+            if now < fresh_until + self.stale_ttl
+        ]
+
+    # Reinstates a snapshot entry; stale entries are revalidated upon access
+    def restore(self, key, value, fresh_until):
+        ttl = fresh_until - self.timer()
+        if ttl + self.stale_ttl > 0 and key not in self.entries:
+            self.set(key, value, ttl=ttl)
+
+    def get(self, key, loader):
+        entry = self.entries.get(key)
+        if entry is not None:
+            value, fresh_until = entry
+            if self.timer() < fresh_until:
+                self._count("hits")
+                return value
+            self._count("stale_hits")
+            self._load(key, loader, background=True)
+            return value
+
+        self._count("misses")
+        flight, leader = self._load(key, loader)
+        if not leader:
+            self._count("coalesced")
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def _count(self, counter):
+        with self._lock:
+            self.stats[counter] += 1
+        if self.name:
+            cache_requests.labels(self.name, counter).inc()
+
+    def _load(self, key, loader, background=False):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = _Flight()
+
+        if background:
+            Thread(target=self._run, args=(key, loader, flight), daemon=True).start()
+        else:
+            self._run(key, loader, flight)
+        return flight, True
+
+    def _run(self, key, loader, flight):
+        try:
+            flight.value = loader(key)
+            ttl = self.ttl_of(flight.value) if self.ttl_of else None
+            self.set(key, flight.value, ttl=ttl)
+        except Exception as e:
+            flight.error = e
+            self._count("errors")
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+
+# A persistent key-value store of JSON-serializable values in an SQLite file.
+#
+# Entries are discarded once older than the TTL; when the number of entries
+# exceeds maxsize, the oldest-stored are removed.  If a version is provided,
+# opening a file written under any other version discards all of its entries.
+#
+# The cache is an optimization, so database errors (a locked or corrupt file,
+# or a full disk) are reported and treated as misses or skipped writes.
+class DiskCache:
+    evict_interval = 1000  # insertions between size checks
+
+    def __init__(self, path, maxsize, ttl, version=None, timer=time):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = version
+        self.timer = timer
+        self._insertions = 0
+        self._lock = Lock()
+        self._pid = None
+
+    def _connection(self):
+        # SQLite connections must not be shared across a fork
+        if self._pid != os.getpid():
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("pragma journal_mode=wal")
+            db.execute("pragma synchronous=off")
+            db.execute(
+                "create table if not exists entries "
+                "(key text primary key, value text, stored real)"
+            )
+            db.execute("create table if not exists meta (version text)")
+            (version,) = db.execute("select max(version) from meta").fetchone()
+            if version != self.version:
+                with db:
+                    db.execute("delete from entries")
+                    db.execute("delete from meta")
+                    db.execute("insert into meta values (?)", (self.version,))
+            self._db, self._pid = db, os.getpid()
+        return self._db
+
+    def get_many(self, keys):
+        found = {}
+        cutoff = self.timer() - self.ttl
+        chunks = [keys[n:][:500] for n in range(0, len(keys), 500)]
+        try:
+            for chunk in chunks:
+                placeholders = ", ".join("?" * len(chunk))
+                with self._lock:
+                    rows = self._connection().execute(
+                        f"select key, value from entries "
+                        f"where key in ({placeholders}) and stored >= ?",
+                        (*chunk, cutoff),
+                    )
+                    found.update({key: json.loads(value) for key, value in rows})
+        except sqlite3.Error as e:
+            print(f"* Failed to read from disk cache {self.path}: {e}")
+        return found
+
+    def set_many(self, items):
+        stored = self.timer()
+        rows = [(key, json.dumps(value), stored) for key, value in items.items()]
+        try:
+            with self._lock, self._connection() as db:
+                db.executemany("insert or replace into entries values (?, ?, ?)", rows)
+                self._insertions += len(rows)
+                if self._insertions >= self.evict_interval:
+                    self._insertions = 0
+                    self._evict(db)
+        except sqlite3.Error as e:
+            print(f"* Failed to write to disk cache {self.path}: {e}")
+
+    def _evict(self, db):
+        db.execute("delete from entries where stored < ?", (self.timer() - self.ttl,))
+        db.execute(
+            "delete from entries where key in "
+            "(select key from entries order by stored desc limit -1 offset ?)",
+            (self.maxsize,),
+        )
+
+    def clear(self):
+        with self._lock, self._connection() as db:
+            db.execute("delete from entries")
+
+
+# An in-memory LRU cache, optionally backed by a DiskCache that retains
+# entries beyond the lifetime of the process.  Keys are tuples of strings;
+# the disk tier addresses each entry by a digest of its key.  As with
+# CoalescingCache, lookups are reported as metrics if the cache is named.
+class TieredCache:
+    def __init__(self, maxsize, disk=None, name=None):
+        self.name = name
+        self.memory = LRUCache(maxsize=maxsize)
+        self.disk = disk
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0}
+        self._lock = Lock()
+
+    @staticmethod
+    def _digest(key):
+        return blake2b(json.dumps(key).encode("utf-8"), digest_size=16).hexdigest()
+
+    def _count(self, counter, n):
+        with self._lock:
+            self.stats[counter] += n
+        if self.name and n:
+            cache_requests.labels(self.name, counter).inc(n)
+
+    def get_many(self, keys):
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        for key in keys:
+            value = self.memory.get(key)
+            if value is not None:
+                found[key] = value
+        self._count("hits", len(found))
+
+        missing = {self._digest(key): key for key in keys if key not in found}
+        if missing and self.disk:
+            stored = self.disk.get_many(list(missing))
+            for digest, value in stored.items():
+                found[missing[digest]] = value
+                self.memory.set(missing[digest], value)
+            self._count("disk_hits", len(stored))
+
+        self._count("misses", len(keys) - len(found))
+        return found
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def set_many(self, items):
+        self.memory.set_many(items)
+        if self.disk:
+            self.disk.set_many(
+                {self._digest(key): value for key, value in items.items()}
+            )
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk:
+            self.disk.clear()
+        with self._lock:
+            for counter in self.stats:
+                self.stats[counter] = 0
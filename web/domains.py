@@ -1,15 +1,21 @@
-from urllib.parse import urlparse
-
+from web.caching import CoalescingCache
+from web.tracing import annotate
 from web.web_clients import microservice_client
 
-domain_backoffs = {}
+domain_configurations = CoalescingCache(
+    name="domain_config",
+    ttl=5 * 60,  # 5min freshness
+    stale_ttl=60 * 60,  # 1hr stale-while-revalidate
+    maxsize=10_000,
+)
 
 
-def get_domain(url):
-    return urlparse(url).netloc
+def get_domain_configuration(domain):
+    annotate("cache", domain_config=domain in domain_configurations)
+    return domain_configurations.get(domain, _fetch_domain_configuration)
 
 
-def get_domain_configuration(domain):
+def _fetch_domain_configuration(domain):
     response = microservice_client.get(
         url=f"http://backend-service/domains/{domain}",
         proxies={},
@@ -0,0 +1,42 @@
+from os import getenv
+
+from web.exceptions import ResponseTooLarge, UnsupportedContentType
+
+ORIGIN_MAX_BYTES = int(getenv("ORIGIN_MAX_BYTES", 5 * 1024 * 1024))
+CHUNK_SIZE = 64 * 1024
+
+MARKUP_TYPES = ("application/xhtml+xml", "application/xml")
+
+
+# Rejects a successful response whose headers show that it cannot contain a
+# recipe page, before any of its body is read
+def check_headers(headers, max_bytes=ORIGIN_MAX_BYTES):
+    content_type = headers.get("Content-Type", "").split(";")[0].strip().lower()
+    if content_type and not content_type.startswith("text/"):
+        if content_type not in MARKUP_TYPES:
+            raise UnsupportedContentType(content_type)
+
+    # The length of compressed content is a lower bound upon its decoded size
+    length = headers.get("Content-Length", "")
+    if length.isdigit() and int(length) > max_bytes:
+        raise ResponseTooLarge(int(length))
+
+
+# Reads the (decoded) body of a streamed requests.Response into a single
+# buffer, up to max_bytes, and retains it as the response content so that no
+# further copy is made
+def read_body(response, max_bytes=ORIGIN_MAX_BYTES):
+    try:
+        if 200 <= response.status_code < 300:
+            check_headers(response.headers, max_bytes)
+        body = bytearray()
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            body += chunk
+            if len(body) > max_bytes:
+                raise ResponseTooLarge(len(body))
+    finally:
+        response.close()
+
+    response._content = body
+    response._content_consumed = True
+    return response
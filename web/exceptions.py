@@ -8,3 +8,11 @@ class DomainCrawlProhibited(Exception):
 
 class CanonicalURLNotFound(Exception):
     pass
+
+
+class UnsupportedContentType(Exception):
+    pass
+
+
+class ResponseTooLarge(Exception):
+    pass
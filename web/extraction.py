@@ -0,0 +1,186 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from os import getenv, getpid
+import pickle
+import sys
+from threading import BoundedSemaphore, Lock
+
+from web import scrapers
+from web.jsonld import FastPathUnavailable, check_fast_path, fast_scraper
+
+EXTRACTION_PROCESSES = int(getenv("EXTRACTION_PROCESSES", 0))
+EXTRACTION_QUEUE_DEPTH = int(getenv("EXTRACTION_QUEUE_DEPTH", 0))
+
+RECIPE_ACCESSORS = (
+    "author",
+    "language",
+    "ingredients",
+    "nutrients",
+    "total_time",
+    "yields",
+    "ratings",
+    "title",
+)
+
+
+# The results of a scraper's accessors, each evaluated once; exceptions are
+# retained and raised again when the accessor is called
+class RecordedScraper:
+    def __init__(self, scraper, accessors):
+        self._results = {}
+        for accessor in accessors:
+            try:
+                self._results[accessor] = getattr(scraper, accessor)(), None
+            except FastPathUnavailable:
+                raise
+            except Exception as e:
+                self._results[accessor] = None, e
+        check_fast_path(scraper)
+
+    def __contains__(self, accessor):
+        return accessor in self._results
+
+    @classmethod
+    def from_results(cls, results):
+        recorded = cls.__new__(cls)
+        recorded._results = results
+        return recorded
+
+    def __getattr__(self, accessor):
+        try:
+            value, error = self._results[accessor]
+        except KeyError:
+            raise AttributeError(accessor)
+
+        def replay():
+            if error:
+                raise error
+            return value
+
+        return replay
+
+
+# Evaluates the accessors for a page, from JSON-LD where possible; returns
+# whether the fast path was taken, and the recorded scraper
+def extract_recipe(html, url, accessors=RECIPE_ACCESSORS):
+    scraper = fast_scraper(html, url)
+    if scraper:
+        try:
+            return True, RecordedScraper(scraper, accessors)
+        except FastPathUnavailable:
+            pass
+    scraper = scrapers.scrape_html(
+        html=html, org_url=url, online=False, supported_only=True
+    )
+    return False, RecordedScraper(scraper, accessors)
+
+
+# Exceptions raised by accessors are returned to the parent process, so any
+# that cannot be unpickled there are replaced by a generic equivalent
+def _portable(error):
+    if error is None:
+        return None
+    try:
+        pickle.loads(pickle.dumps(error))
+        return error
+    except Exception:
+        return RuntimeError(f"{type(error).__name__}: {error}")
+
+
+def _attach(name):
+    # Python 3.13 allows the segment to remain untracked by the child, since
+    # the parent is responsible for its removal
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name=name, track=False)
+    return SharedMemory(name=name)
+
+
+# Runs within a worker process, reading the page from shared memory
+def _extract_shared(name, size, url, accessors):
+    segment = _attach(name)
+    try:
+        html = bytes(segment.buf[:size]).decode("utf-8", "surrogatepass")
+    finally:
+        segment.close()
+    fast_path, recorded = extract_recipe(html, url, accessors)
+    results = {
+        accessor: (value, _portable(error))
+        for accessor, (value, error) in recorded._results.items()
+    }
+    return fast_path, results
+
+
+# Offloads HTML parsing and recipe field extraction to a pool of processes, so
+# that CPU-bound work does not delay the I/O handled by the calling process.
+#
+# Each page is written to a shared memory segment that the worker reads, and
+# only the accessor results are returned.  The number of pages submitted and
+# awaiting a worker is bounded; callers beyond that wait for a slot.  Worker
+# processes are started from a fork server that has imported this module and
+# recipe-scrapers, so that they neither inherit the caller's threads nor import
+# recipe-scrapers for themselves.
+class ExtractionExecutor:
+    def __init__(self, processes=EXTRACTION_PROCESSES, queue_depth=None):
+        self.processes = processes
+        self.queue_depth = queue_depth or EXTRACTION_QUEUE_DEPTH or 2 * processes
+        self._slots = BoundedSemaphore(max(self.queue_depth, 1))
+        self._pool = None
+        self._pid = None
+        self._lock = Lock()
+
+    @property
+    def enabled(self):
+        return self.processes > 0
+
+    def _executor(self):
+        with self._lock:
+            # Pools are not inherited by forked processes, such as web workers
+            if self._pool is None or self._pid != getpid():
+                context = get_context("forkserver")
+                context.set_forkserver_preload(["recipe_scrapers", "web.extraction"])
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.processes, mp_context=context
+                )
+                self._pid = getpid()
+            return self._pool
+
+    def _discard(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool and self._pid == getpid():
+            pool.shutdown()
+
+    def extract(self, html, url, accessors=RECIPE_ACCESSORS):
+        content = html.encode("utf-8", "surrogatepass")
+        size = len(content)
+        with self._slots:
+            segment = SharedMemory(create=True, size=max(size, 1))
+            try:
+                segment.buf[:size] = content
+                del content
+                pool = self._executor()
+                try:
+                    future = pool.submit(
+                        _extract_shared, segment.name, size, url, accessors
+                    )
+                    fast_path, results = future.result()
+                except BrokenProcessPool:
+                    # A worker exited unexpectedly; replace the pool for
+                    # subsequent pages
+                    self._discard(pool)
+                    raise
+            finally:
+                segment.close()
+                segment.unlink()
+        return fast_path, RecordedScraper.from_results(results)
+
+
+extraction_executor = ExtractionExecutor()
@@ -0,0 +1,117 @@
+from collections import OrderedDict, deque
+from threading import Condition
+from time import monotonic
+
+from web.urls import get_domain
+
+
+# Pending URLs, bucketed by domain and handed out round-robin across the
+# domains that are eligible for crawling.
+#
+# A domain is ineligible while one of its URLs is in progress, and until its
+# next-eligible time has passed; callers derive that time from crawl delays,
+# backoffs and Retry-After responses.
+class CrawlFrontier:
+    def __init__(self, capacity=None, timer=monotonic):
+        self.capacity = capacity
+        self.timer = timer
+        self._queues = OrderedDict()  # domain: deque of (url, item)
+        self._eligible_at = {}
+        self._in_progress = {}  # domain: time of dispatch
+        self._size = 0
+        self._closed = False
+        self._condition = Condition()
+
+    def __len__(self):
+        return self._size
+
+    # Blocks while the frontier is at capacity
+    def put(self, url, item=None, domain=None):
+        domain = domain or get_domain(url)
+        with self._condition:
+            while self.capacity and self._size >= self.capacity:
+                self._condition.wait()
+            self._queues.setdefault(domain, deque()).append((url, item))
+            self._size += 1
+            self._condition.notify_all()
+
+    # Returns a URL handed out by get() to the front of its domain's queue, to
+    # be attempted again; this does not wait for capacity, so that the callers
+    # that drain the frontier are never blocked by it
+    def retry(self, domain, url, item=None):
+        with self._condition:
+            self._queues.setdefault(domain, deque()).appendleft((url, item))
+            self._size += 1
+            self._condition.notify_all()
+
+    # Indicates that no further URLs will be added
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    # Returns the next (domain, url, item) to crawl, waiting until a domain is
+    # eligible; returns None once the frontier is closed and drained
+    def get(self, block=True):
+        with self._condition:
+            while True:
+                now = self.timer()
+                entry = self._pop(now)
+                if entry or not block:
+                    return entry
+                if self._closed and not self._size:
+                    return None
+                self._condition.wait(self._wait_time(now))
+
+    def _pop(self, now):
+        for domain in self._queues:
+            if domain in self._in_progress:
+                continue
+            if self._eligible_at.get(domain, now) > now:
+                continue
+            queue = self._queues.pop(domain)
+            url, item = queue.popleft()
+            if queue:
+                self._queues[domain] = queue  # rotate to the back
+            self._size -= 1
+            self._in_progress[domain] = now
+            self._condition.notify_all()
+            return domain, url, item
+        return None
+
+    def _wait_time(self, now):
+        waits = [
+            self._eligible_at[domain] - now
+            for domain in self._queues
+            if domain in self._eligible_at and domain not in self._in_progress
+        ]
+        return max(min(waits), 0) if waits else None
+
+    def _postpone(self, domain, eligible_at):
+        self._eligible_at[domain] = max(self._eligible_at.get(domain, 0), eligible_at)
+
+    # Prevents a domain from being crawled for the given number of seconds
+    def defer(self, domain, seconds):
+        with self._condition:
+            self._postpone(domain, self.timer() + seconds)
+            self._condition.notify_all()
+
+    # Marks a domain's URL as complete; the domain becomes eligible again once
+    # delay seconds have passed since the URL was handed out
+    def done(self, domain, delay=0):
+        with self._condition:
+            now = self.timer()
+            dispatched = self._in_progress.pop(domain, now)
+            self._postpone(domain, dispatched + delay)
+            if domain not in self._queues and self._eligible_at[domain] <= now:
+                del self._eligible_at[domain]
+            if len(self._eligible_at) > 2 * len(self._queues) + 1_000:
+                self._prune(now)
+            self._condition.notify_all()
+
+    def _prune(self, now):
+        for domain, eligible_at in list(self._eligible_at.items()):
+            if domain in self._queues or domain in self._in_progress:
+                continue
+            if eligible_at <= now:
+                del self._eligible_at[domain]
@@ -0,0 +1,54 @@
+from os import getenv, listdir, remove
+from os.path import isdir, isfile, join
+from time import perf_counter
+
+# Imports and warms the application within the master process, so that
+# workers are forked ready to serve requests; otherwise each worker imports
+# the application, and loads recipe-scrapers upon its first extraction
+preload_app = getenv("PRELOAD_APP") == "true"
+
+# Batch responses stream for as long as their domains' crawl delays require,
+# so requests are handled by threads.  Threaded workers notify the master from
+# their main loop, and the timeout therefore bounds an unresponsive worker
+# rather than the duration of any one request.
+worker_class = "gthread"
+threads = int(getenv("GUNICORN_THREADS", 8))
+timeout = int(getenv("GUNICORN_TIMEOUT", 120))
+
+
+# Worker metrics files persist in the metrics directory, which may outlive the
+# container; those of a previous run are removed before any worker starts
+def on_starting(server):
+    directory = getenv("PROMETHEUS_MULTIPROC_DIR")
+    if not directory or not isdir(directory):
+        return
+    for filename in listdir(directory):
+        path = join(directory, filename)
+        if isfile(path):
+            remove(path)
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        from web.startup import warm
+
+        started = perf_counter()
+        warm()
+        server.log.info("Warmed application in %.3fs", perf_counter() - started)
+
+
+def post_fork(server, worker):
+    worker.forked_at = perf_counter()
+
+
+def post_worker_init(worker):
+    elapsed = perf_counter() - worker.forked_at
+    worker.log.info("Worker %s ready in %.3fs", worker.pid, elapsed)
+
+
+# Gauges of exited workers are no longer reported
+def child_exit(server, worker):
+    if getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
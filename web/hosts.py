@@ -0,0 +1,41 @@
+import json
+from urllib.parse import urlsplit
+from urllib.request import Request, urlopen
+
+
+def normalize_host(host):
+    return host.lower().rstrip(".").removeprefix("www.")
+
+
+# The host names of supported recipe websites, normalized for lookup.
+#
+# A URL is supported when its host, or any domain that its host belongs to,
+# is in the index; the www. and other subdomains of a supported website (which
+# commonly redirect to it) are therefore accepted.
+class HostIndex:
+    def __init__(self, hosts):
+        self.hosts = frozenset(normalize_host(host) for host in hosts)
+
+    def __len__(self):
+        return len(self.hosts)
+
+    def __iter__(self):
+        return iter(sorted(self.hosts))
+
+    def supports(self, url):
+        try:
+            host = urlsplit(url).hostname
+        except ValueError:
+            return False
+        host = normalize_host(host or "")
+        while host:
+            if host in self.hosts:
+                return True
+            _, _, host = host.partition(".")
+        return False
+
+
+# Retrieves the index published by the crawler's /hosts endpoint
+def fetch_host_index(url, headers=None):
+    with urlopen(Request(url, headers=headers or {})) as response:
+        return HostIndex(json.load(response)["hosts"])
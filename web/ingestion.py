@@ -0,0 +1,224 @@
+from abc import ABC, abstractmethod
+from base64 import b64decode, b64encode
+from collections import Counter, OrderedDict
+from http import HTTPStatus
+import json
+import os
+from threading import Lock, Thread
+from time import monotonic, sleep
+
+from web.frontier import CrawlFrontier
+from web.hosts import fetch_host_index
+
+# Dispatch and checkpointing for the standalone ingestion tools (the
+# openrecipes loader, and the reciperadar recrawling and reindexing tools),
+# which submit work to the crawler and backend services in bulk.
+#
+# The tools import this module from the parent directory, without installing
+# the crawler's requirements; it, and the modules of this package that it
+# imports (web.frontier, web.hosts and web.urls), use only the standard library.
+
+CRAWL_DELAY = 1  # the minimum delay that the crawler observes for each domain
+BACKOFF = 30  # delay before further requests to a domain after a failure
+MAX_ATTEMPTS = 3  # for each item that fails transiently, within a run
+HOSTS_URL = "http://localhost:30080/hosts"
+
+
+def is_transient(outcome):
+    if isinstance(outcome, str):
+        return outcome == "exception"
+    return outcome == HTTPStatus.TOO_MANY_REQUESTS or outcome >= 500
+
+
+# The websites that the crawler supports, so that URLs for others need not be
+# submitted
+def supported_hosts(url=HOSTS_URL):
+    return fetch_host_index(url, headers={"Host": "crawler"})
+
+
+class RateLimiter:
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_slot = monotonic()
+        self._lock = Lock()
+
+    def wait(self):
+        with self._lock:
+            now = monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            sleep(slot - now)
+
+
+# The progress of a run, saved periodically so that an interrupted run can
+# resume; the scope of the run must match upon resumption, and the outcomes of
+# each completed item are counted across runs
+class Checkpoint(ABC):
+    def __init__(self, path, scope, interval=30):
+        self.path = path
+        self.scope = scope
+        self.interval = interval
+        self.outcomes = Counter()
+        self.saved_at = monotonic()
+        self._lock = Lock()
+
+    @abstractmethod
+    def _progress(self):
+        pass
+
+    @abstractmethod
+    def _restore(self, progress):
+        pass
+
+    @abstractmethod
+    def _complete(self, key, outcome):
+        pass
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path) as f:
+            state = json.load(f)
+        if state["scope"] != self.scope:
+            raise SystemExit(f"{self.path} was recorded for {state['scope']}")
+        self.outcomes = Counter(state["outcomes"])
+        self._restore(state["progress"])
+        return True
+
+    # Called with the lock held, since worker threads share the temporary file
+    def _write(self):
+        state = {
+            "scope": self.scope,
+            "progress": self._progress(),
+            "outcomes": dict(self.outcomes),
+        }
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(f"{self.path}.tmp", self.path)
+        self.saved_at = monotonic()
+
+    def save(self):
+        with self._lock:
+            self._write()
+
+    # Registers an item before it is dispatched
+    def track(self, key):
+        pass
+
+    def complete(self, key, outcome):
+        with self._lock:
+            self.outcomes[str(outcome)] += 1
+            self._complete(key, outcome)
+            if monotonic() - self.saved_at > self.interval:
+                self._write()
+
+
+# Records the greatest key beneath which every item has been completed, for
+# items that are dispatched in order of their keys
+class KeyCheckpoint(Checkpoint):
+    def __init__(self, path, scope, interval=30):
+        super().__init__(path, scope, interval)
+        self.position = None
+        self.pending = OrderedDict()
+
+    def _progress(self):
+        return self.position
+
+    def _restore(self, progress):
+        self.position = progress
+
+    def track(self, key):
+        with self._lock:
+            self.pending[key] = False
+
+    def _complete(self, key, outcome):
+        self.pending[key] = True
+        while self.pending and next(iter(self.pending.values())):
+            self.position, _ = self.pending.popitem(last=False)
+
+
+# Records the completed items, numbered from zero, as a bitmap, for items that
+# are dispatched in any order; items whose final outcome was a transient
+# failure remain pending, to be attempted again upon resumption
+class BitmapCheckpoint(Checkpoint):
+    def __init__(self, path, scope, interval=30):
+        super().__init__(path, scope, interval)
+        self.done = bytearray()
+
+    def _progress(self):
+        return b64encode(bytes(self.done)).decode("ascii")
+
+    def _restore(self, progress):
+        self.done = bytearray(b64decode(progress))
+
+    def is_done(self, number):
+        byte, bit = divmod(number, 8)
+        return byte < len(self.done) and bool(self.done[byte] & (1 << bit))
+
+    def _complete(self, number, outcome):
+        if is_transient(outcome):
+            return
+        byte, bit = divmod(number, 8)
+        if byte >= len(self.done):
+            self.done.extend(bytes(byte - len(self.done) + 1))
+        self.done[byte] |= 1 << bit
+
+
+# Runs an action for each item using a bounded pool of workers; each item
+# begins with its checkpoint key.  Items with URLs are interleaved across
+# domains, and each domain observes the crawl delay.  Items that are not
+# accepted are skipped, with the outcome "unsupported", and items that fail
+# transiently are retried after a backoff, up to MAX_ATTEMPTS times in all.
+def dispatch(
+    items,
+    action,
+    checkpoint,
+    concurrency=8,
+    url_of=None,
+    accept=None,
+    window=1000,
+    backoff=BACKOFF,
+    rate=None,
+):
+    frontier = CrawlFrontier(capacity=window)
+    delay = CRAWL_DELAY if url_of else 0
+    limiter = RateLimiter(rate)
+
+    def feed():
+        try:
+            for item in items:
+                checkpoint.track(item[0])
+                if accept and not accept(item):
+                    checkpoint.complete(item[0], "unsupported")
+                elif url_of:
+                    frontier.put(url_of(item), (item, 1))
+                else:
+                    frontier.put(str(item[0]), (item, 1), domain=str(item[0]))
+        finally:
+            frontier.close()
+
+    def work():
+        while (entry := frontier.get()) is not None:
+            domain, url, (item, attempt) = entry
+            limiter.wait()
+            outcome = action(item)
+            retry = is_transient(outcome) and attempt < MAX_ATTEMPTS
+            if retry:
+                frontier.defer(domain, backoff)
+                frontier.retry(domain, url, (item, attempt + 1))
+            frontier.done(domain, delay)
+            if not retry:
+                checkpoint.complete(item[0], outcome)
+
+    # Daemon threads are abandoned upon interruption, once progress is saved
+    threads = [Thread(target=feed, daemon=True)]
+    threads += [Thread(target=work, daemon=True) for _ in range(concurrency)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        checkpoint.save()
+    return checkpoint.outcomes
@@ -0,0 +1,106 @@
+import re
+
+from web import scrapers
+
+HTML_TAG = re.compile(r"<html\b[^>]*>", re.IGNORECASE)
+META_TAG = re.compile(r"<meta\b[^>]*>", re.IGNORECASE)
+# JSON-LD scripts are captured by the second group; comments, and other scripts
+# (within which "<!--" does not begin a comment), are matched so that they are
+# skipped over
+JSONLD_SCRIPT = re.compile(
+    r"<!--.*?(?:-->|\Z)"
+    r"|(<script\b[^>]*\btype\s*=\s*(?:\"application/ld\+json\"|'application/ld\+json'"
+    r"|application/ld\+json(?=[\s>/]))[^>]*>.*?</script\s*>)"
+    r"|<script\b[^>]*>.*?</script\s*>",
+    re.IGNORECASE | re.DOTALL,
+)
+MICRODATA = re.compile(r"\bitemscope\b", re.IGNORECASE)
+
+
+class FastPathUnavailable(Exception):
+    pass
+
+
+# Stands in for the parsed document of a fast-path scraper; only lookups of
+# the elements retained from the page are answered, and anything else
+# requires the full document.  The first such lookup is recorded, since the
+# exception raised for it may be caught by the site's scraper.
+class HeadSoup:
+    retained = ("html", "meta")
+
+    def __init__(self, soup):
+        self._soup = soup
+        self.unavailable = None
+
+    def _unavailable(self, lookup):
+        self.unavailable = self.unavailable or lookup
+        return FastPathUnavailable(lookup)
+
+    def find(self, name=None, *args, **kwargs):
+        if name not in self.retained:
+            raise self._unavailable(f"soup.find({name!r})")
+        return self._soup.find(name, *args, **kwargs)
+
+    def find_all(self, name=None, *args, **kwargs):
+        if name not in self.retained:
+            raise self._unavailable(f"soup.find_all({name!r})")
+        return self._soup.find_all(name, *args, **kwargs)
+
+    __call__ = find_all
+
+    def __getattr__(self, name):
+        raise self._unavailable(f"soup.{name}")
+
+    def __getitem__(self, key):
+        raise self._unavailable(f"soup[{key!r}]")
+
+    def __iter__(self):
+        raise self._unavailable("iter(soup)")
+
+
+# Raises FastPathUnavailable if any accessor of a fast-path scraper has
+# required the full document, including lookups whose exception was caught
+def check_fast_path(scraper):
+    soup = getattr(scraper, "soup", None)
+    if isinstance(soup, HeadSoup) and soup.unavailable:
+        raise FastPathUnavailable(soup.unavailable)
+
+
+def _eligible(scraper_class):
+    return (
+        scraper_class.__init__ is scrapers.AbstractScraper.__init__
+        and scraper_class._schema_cls is scrapers.SchemaOrg
+    )
+
+
+# Returns a scraper for the recipe-scrapers site class of the page, built from
+# a minimal document: the page's <html> tag, its <meta> tags and its JSON-LD
+# scripts.  Schema.org data is then read without parsing the entire page.
+#
+# This is equivalent to the full scraper for pages without microdata (which
+# recipe-scrapers would merge with JSON-LD), provided that the site's scraper
+# does not override its constructor or schema; accessors that consult other
+# parts of the page raise FastPathUnavailable.
+def fast_scraper(html, url):
+    scraper_class = scrapers.SCRAPERS.get(scrapers.get_host_name(url))
+    if not scraper_class or not _eligible(scraper_class):
+        return None
+
+    matches = JSONLD_SCRIPT.finditer(html)
+    scripts = [match.group(1) for match in matches if match.group(1)]
+    if not scripts or MICRODATA.search(html):
+        return None
+
+    html_tag = HTML_TAG.search(html)
+    head = "".join(match.group(0) for match in META_TAG.finditer(html))
+    document = "".join(
+        [
+            html_tag.group(0) if html_tag else "<html>",
+            f"<head>{head}{''.join(scripts)}</head></html>",
+        ]
+    )
+
+    scraper = scraper_class(html=document, url=url)
+    scraper.page_data = html
+    scraper.soup = HeadSoup(scraper.soup)
+    return scraper
@@ -0,0 +1,205 @@
+from collections import Counter
+from contextlib import contextmanager
+import json
+import os
+from threading import Lock
+from time import perf_counter, time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter as CounterMetric,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import CounterMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector
+
+from web.tracing import record
+
+# When set, metric values are written to files within this directory so that
+# each gunicorn worker can report the values aggregated across all workers
+METRICS_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+METRICS_TOP_DOMAINS = int(os.getenv("METRICS_TOP_DOMAINS", 20))
+
+# Unlabelled metrics create their files as soon as they are defined
+if METRICS_DIR:
+    os.makedirs(METRICS_DIR, exist_ok=True)
+
+STAGE_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+)
+
+SIZE_BUCKETS = tuple(1024 * 2**n for n in range(14))  # 1KiB to 8MiB
+
+stage_durations = Histogram(
+    "crawler_stage_duration_seconds",
+    "Time spent within each stage of request handling",
+    ["stage", "outcome", "status"],
+    buckets=STAGE_BUCKETS,
+)
+
+response_sizes = Histogram(
+    "crawler_origin_response_bytes",
+    "Size of each origin response body held in memory, once decoded",
+    buckets=SIZE_BUCKETS,
+)
+
+
+cache_requests = CounterMetric(
+    "crawler_cache_requests",
+    "Lookups of each in-process cache, by result",
+    ["cache", "result"],
+)
+
+
+class Span:
+    def __init__(self):
+        self.outcome = "ok"
+        self.status = None
+
+
+# Measures the duration of a stage; the outcome and status code may be set
+# upon the yielded span, and an unhandled exception is recorded as an error
+@contextmanager
+def stage(name):
+    span = Span()
+    start = perf_counter()
+    try:
+        yield span
+    except Exception:
+        if span.outcome == "ok":
+            span.outcome = "error"
+        raise
+    finally:
+        duration = perf_counter() - start
+        status = "" if span.status is None else str(span.status)
+        stage_durations.labels(name, span.outcome, status).observe(duration)
+        record(name, duration)
+
+
+def outcome_of(status):
+    return "ok" if status < 400 else "error"
+
+
+# Counts origin requests per domain and status, reporting only the busiest
+# domains to bound the number of timeseries.
+#
+# Counts are retained for up to capacity domains per process, and requests to
+# any further domains are counted as "other"; no count ever decreases, and a
+# domain that has been reported continues to be, so that exported counters are
+# never reset.  Counts are periodically written to the metrics directory (if
+# any) so that each worker can report the busiest domains across all workers.
+class DomainCounter:
+    other = "other"
+
+    def __init__(
+        self,
+        directory=None,
+        top=METRICS_TOP_DOMAINS,
+        capacity=1_000,
+        flush_interval=10,
+        timer=time,
+    ):
+        self.directory = directory
+        self.top = top
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.timer = timer
+        self.counts = Counter()
+        self.domains = set()
+        self.exported = set()
+        self._flushed = timer()
+        self._lock = Lock()
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f"domains_{pid}.json")
+
+    def increment(self, domain, status):
+        with self._lock:
+            if domain not in self.domains:
+                if len(self.domains) < self.capacity:
+                    self.domains.add(domain)
+                else:
+                    domain = self.other
+            self.counts[domain, str(status)] += 1
+        if self.directory and self.timer() - self._flushed > self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            counts = [[*key, count] for key, count in self.counts.items()]
+            self._flushed = self.timer()
+        path = self._path(os.getpid())
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(counts, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _aggregate(self):
+        with self._lock:
+            counts = Counter(self.counts)
+        if not self.directory:
+            return counts
+
+        own_file = os.path.basename(self._path(os.getpid()))
+        for filename in os.listdir(self.directory):
+            if filename == own_file or not filename.startswith("domains_"):
+                continue
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    for domain, status, count in json.load(f):
+                        counts[domain, status] += count
+            except (OSError, ValueError):
+                continue
+        return counts
+
+    def collect(self):
+        counts = self._aggregate()
+        totals = Counter()
+        for (domain, _), count in counts.items():
+            totals[domain] += count
+        busiest = {domain for domain, _ in totals.most_common(self.top)}
+        with self._lock:
+            self.exported |= busiest
+            reported = set(self.exported)
+
+        family = CounterMetricFamily(
+            "crawler_domain_requests",
+            f"Origin requests for each of the {self.top} busiest domains",
+            labels=["domain", "status"],
+        )
+        for (domain, status), count in sorted(counts.items()):
+            if domain in reported:
+                family.add_metric([domain, status], count)
+        yield family
+
+
+domain_requests = DomainCounter(directory=METRICS_DIR)
+
+if METRICS_DIR:
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry)
+else:
+    registry = REGISTRY
+registry.register(domain_requests)
+
+
+def render_metrics():
+    return generate_latest(registry), CONTENT_TYPE_LATEST
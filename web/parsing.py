@@ -1,18 +1,64 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 from datetime import UTC, datetime
 from email.utils import parsedate_to_datetime
+from functools import cached_property
 from math import ceil
+from os import getenv
 from string import digits
 
-from recipe_scrapers._utils import get_yields
-from recipe_scrapers import (
-    StaticValueException,
-    WebsiteNotImplementedError,
-    scrape_html,
-)
+import httpx
+from requests.exceptions import ConnectionError, Timeout
 
+from web import scrapers
+from web.async_clients import engine
+from web.caching import DiskCache, TieredCache, content_digest
 from web.exceptions import CanonicalURLNotFound
+from web.extraction import RECIPE_ACCESSORS, RecordedScraper, extraction_executor
+from web.jsonld import FastPathUnavailable, fast_scraper
+from web.metrics import stage
+from web.scrapers import rs_version
+from web.tracing import annotate
 from web.web_clients import microservice_client
 
+PARSER_STAGES = {
+    "ingredient-parser-service": "ingredient_parsing",
+    "quantity-parser-service": "quantity_parsing",
+}
+PARSER_BUDGETS = {
+    "ingredient-parser-service": {"timeout": 10, "retries": 1},
+    "quantity-parser-service": {"timeout": 5, "retries": 1},
+}
+parser_pool = ThreadPoolExecutor(max_workers=int(getenv("PARSER_CONCURRENCY", 8)))
+
+parser_cache_path = getenv("PARSER_CACHE_PATH")
+description_cache = TieredCache(
+    name="descriptions",
+    maxsize=20_000,
+    disk=(
+        DiskCache(parser_cache_path, maxsize=100_000, ttl=7 * 24 * 60 * 60)
+        if parser_cache_path
+        else None
+    ),
+)
+
+service_version = getenv("IMAGE_VERSION")
+extraction_cache_path = getenv("EXTRACTION_CACHE_PATH")
+extraction_cache = TieredCache(
+    name="extraction",
+    maxsize=1_000,
+    disk=(
+        DiskCache(
+            extraction_cache_path,
+            maxsize=20_000,
+            ttl=30 * 24 * 60 * 60,
+            version=f"{rs_version}/{service_version}",
+        )
+        if extraction_cache_path
+        else None
+    ),
+)
+
 NUTRITION_SCHEMA_FIELDS = {
     "carbohydrates": "carbohydrateContent",
     "energy": "calories",
@@ -52,45 +98,203 @@ def parse_retry_duration(from_moment: datetime, retry_after: str) -> int:
 
 
 def parse_descriptions(service, language_code, descriptions):
-    entities = microservice_client.post(
-        url=f"http://{service}",
-        data={
-            "language_code": language_code,
-            "descriptions[]": descriptions,
-        },
-        proxies={},
-    ).json()
-    return [{**{"index": index}, **entity} for index, entity in enumerate(entities)]
-
-
-def scrape_canonical_url(response):
-    try:
-        scrape = scrape_html(
-            html=response.text,
-            org_url=response.url,
-            online=False,
-            supported_only=True,
+    # Only descriptions absent from the cache are sent to the parser service
+    keys = [(service, language_code, description) for description in descriptions]
+    entities = description_cache.get_many(keys)
+    misses = list(dict.fromkeys(key[2] for key in keys if key not in entities))
+    annotate(PARSER_STAGES[service], cached=len(entities), requested=len(misses))
+
+    if misses:
+        with stage(PARSER_STAGES[service]) as span:
+            if engine.enabled:
+                request = _request_descriptions_async(service, language_code, misses)
+                response = engine.run(request)
+            else:
+                response = _request_descriptions(service, language_code, misses)
+            span.status = response.status_code
+            parsed = response.json()
+        if len(parsed) != len(misses):
+            raise ValueError(f"{service} returned {len(parsed)} of {len(misses)}")
+        parsed = {
+            (service, language_code, description): entity
+            for description, entity in zip(misses, parsed)
+        }
+        description_cache.set_many(parsed)
+        entities.update(parsed)
+
+    return [{**{"index": index}, **entities[key]} for index, key in enumerate(keys)]
+
+
+def _request_descriptions(service, language_code, descriptions):
+    budget = PARSER_BUDGETS[service]
+    for attempt in range(budget["retries"] + 1):
+        try:
+            response = microservice_client.post(
+                url=f"http://{service}",
+                data={
+                    "language_code": language_code,
+                    "descriptions[]": descriptions,
+                },
+                proxies={},
+                timeout=budget["timeout"],
+            )
+            if response.status_code < 500 or attempt == budget["retries"]:
+                break
+        except (ConnectionError, Timeout):
+            if attempt == budget["retries"]:
+                raise
+    return response
+
+
+async def _request_descriptions_async(service, language_code, descriptions):
+    client = await engine.client("microservice")
+    budget = PARSER_BUDGETS[service]
+    for attempt in range(budget["retries"] + 1):
+        try:
+            response = await client.post(
+                url=f"http://{service}",
+                data={
+                    "language_code": language_code,
+                    "descriptions[]": descriptions,
+                },
+                timeout=budget["timeout"],
+            )
+            if response.status_code < 500 or attempt == budget["retries"]:
+                break
+        except httpx.TransportError:
+            if attempt == budget["retries"]:
+                raise
+    return response
+
+
+# A retrieved HTML document, decoded once and parsed (at most) once, shared by
+# each of the extraction functions that examine the document.
+#
+# When extraction is offloaded, the accessor results recorded by the worker
+# process are retained, including the canonical URL if resolution is required.
+class Document:
+    def __init__(self, text, url, content=None, resolve=False):
+        self.text = text
+        self.url = url
+        self.content = content
+        self.resolve = resolve
+        self.recorded = None
+
+    @classmethod
+    def from_response(cls, response, resolve=False):
+        return cls(
+            text=response.text,
+            url=response.url,
+            content=response.content,
+            resolve=resolve,
         )
-        return scrape.canonical_url()
-    except WebsiteNotImplementedError:
+
+    @cached_property
+    def digest(self):
+        content = self.content
+        if content is None:
+            content = self.text.encode("utf-8")
+        return content_digest(content)
+
+    @cached_property
+    def scraper(self):
+        with stage("html_parse") as span:
+            try:
+                return scrapers.scrape_html(
+                    html=self.text,
+                    org_url=self.url,
+                    online=False,
+                    supported_only=True,
+                )
+            except scrapers.WebsiteNotImplementedError:
+                span.outcome = "unsupported"
+                raise
+
+    @property
+    def soup(self):
+        return self.scraper.soup
+
+    @property
+    def schema(self):
+        return self.scraper.schema.data
+
+
+def scrape_canonical_url(document):
+    try:
+        if document.recorded and "canonical_url" in document.recorded:
+            return document.recorded.canonical_url()
+        if extraction_executor.enabled:
+            scrape = _scrape_offloaded(document, accessors=("canonical_url",))
+            return scrape.canonical_url()
+        return document.scraper.canonical_url()
+    except scrapers.WebsiteNotImplementedError:
         raise CanonicalURLNotFound
 
 
-def scrape_recipe(src, domain, response):
+def scrape_recipe(src, domain, document):
+    # Identical content at the same URL yields the same recipe, until either
+    # the service or recipe-scrapers is upgraded
+    key = (document.digest, document.url, rs_version, service_version)
+    recipe = extraction_cache.get(key)
+    annotate("cache", extraction=recipe is not None)
+    if recipe is not None:
+        return {**recipe, "src": src, "domain": domain}
+
+    recipe = _scrape_recipe(src, domain, document)
+    if isinstance(recipe, dict):
+        extraction_cache.set(key, recipe)
+    return recipe
+
+
+# Reads the recipe fields from JSON-LD without a full parse of the page, when
+# doing so is equivalent to using the site's scraper
+def _scrape_fast_path(document):
+    with stage("jsonld_extract") as span:
+        scraper = fast_scraper(document.text, document.url)
+        try:
+            scrape = scraper and RecordedScraper(scraper, RECIPE_ACCESSORS)
+        except FastPathUnavailable:
+            scrape = None
+        if scrape is None:
+            span.outcome = "unavailable"
+    annotate("extraction", fast_path=scrape is not None)
+    return scrape
+
+
+# Parses the page and evaluates its accessors in a worker process
+def _scrape_offloaded(document, accessors):
+    with stage("extraction") as span:
+        try:
+            fast_path, scrape = extraction_executor.extract(
+                document.text, document.url, accessors
+            )
+        except scrapers.WebsiteNotImplementedError:
+            span.outcome = "unsupported"
+            raise
+    annotate("extraction", fast_path=fast_path, offloaded=True)
+    document.recorded = scrape
+    return scrape
+
+
+def _scraper(document):
+    if extraction_executor.enabled:
+        accessors = RECIPE_ACCESSORS
+        if document.resolve:
+            accessors += ("canonical_url",)
+        return _scrape_offloaded(document, accessors)
+    return _scrape_fast_path(document) or document.scraper
+
+
+def _scrape_recipe(src, domain, document):
     try:
-        scrape = scrape_html(
-            html=response.text,
-            org_url=response.url,
-            online=False,
-            supported_only=True,
-        )
-    except WebsiteNotImplementedError:
+        scrape = _scraper(document)
+    except scrapers.WebsiteNotImplementedError:
         message = "website is not implemented"
         return {"error": {"message": message}}, 501
 
     try:
         author = scrape.author()
-    except StaticValueException as static:
+    except scrapers.StaticValueException as static:
         author = static.return_value
     except NotImplementedError:
         author = None
@@ -99,7 +303,7 @@ def scrape_recipe(src, domain, response):
 
     try:
         language_code = scrape.language()
-    except StaticValueException as static:
+    except scrapers.StaticValueException as static:
         language_code = static.return_value
 
     # Naive filtering for ingredient lines that describe ingredient sub-groups
@@ -109,12 +313,35 @@ def scrape_recipe(src, domain, response):
         for ingredient in scrape.ingredients()
         if not (ingredient[:4].lower() == "for " and ingredient.endswith(":"))
     ]
+
     try:
-        ingredients = parse_descriptions(
-            service="ingredient-parser-service",
-            language_code=language_code,
-            descriptions=ingredients,
-        )
+        nutrients = scrape.nutrients()
+    except NotImplementedError:
+        nutrients = {}
+    nutrients = {
+        field: nutrients[source]
+        for field, source in NUTRITION_SCHEMA_FIELDS.items()
+        if source in nutrients
+    }
+
+    # Both parser services are queried concurrently, within the request context
+    parsed_ingredients = parser_pool.submit(
+        copy_context().run,
+        parse_descriptions,
+        service="ingredient-parser-service",
+        language_code=language_code,
+        descriptions=ingredients,
+    )
+    parsed_quantities = parser_pool.submit(
+        copy_context().run,
+        parse_descriptions,
+        service="quantity-parser-service",
+        language_code=language_code,
+        descriptions=nutrients.values(),
+    )
+
+    try:
+        ingredients = parsed_ingredients.result()
     except Exception:
         message = f"ingredient parsing failed for: {ingredients}"
         return {"error": {"message": message}}, 400
@@ -134,7 +361,7 @@ def scrape_recipe(src, domain, response):
         if not isinstance(yields, str):
             yields = str(yields)
         if not yields[0].isnumeric():
-            yields = get_yields(yields)
+            yields = scrapers.get_yields(yields)
         tokens = yields.split()
         try:
             servings = int(tokens[0])
@@ -144,20 +371,7 @@ def scrape_recipe(src, domain, response):
             message = f"servings parsing failed for: {yields}"
             return {"error": {"message": message}}, 400
 
-    try:
-        nutrients = scrape.nutrients()
-    except NotImplementedError:
-        nutrients = {}
-    nutrients = {
-        field: nutrients[source]
-        for field, source in NUTRITION_SCHEMA_FIELDS.items()
-        if source in nutrients
-    }
-    quantities = parse_descriptions(
-        service="quantity-parser-service",
-        language_code=language_code,
-        descriptions=nutrients.values(),
-    )
+    quantities = parsed_quantities.result()
     nutrition = {}
     for idx, field in enumerate(nutrients):
         quantity = quantities[idx]
@@ -175,7 +389,7 @@ def scrape_recipe(src, domain, response):
     return {
         "title": scrape.title(),
         "src": src,
-        "dst": response.url,
+        "dst": document.url,
         "domain": domain,
         "ingredients": ingredients,
         "author": author,
@@ -0,0 +1,55 @@
+from os import getenv
+from time import sleep, time
+
+from web.state import open_state_store
+from web.tracing import annotate
+
+crawl_state = open_state_store(getenv("CRAWL_STATE_STORE"))
+
+BACKOFF_DECAY = 0.5  # applied to a domain's backoff duration upon each success
+
+
+# Allocates per-domain fetch slots spaced by each domain's crawl delay.
+#
+# Slots are handed out in arrival order; a caller whose slot would begin more
+# than max_wait seconds from now is turned away with the time remaining until
+# the next free slot, instead of being parked asleep inside a request worker.
+class PolitenessScheduler:
+    def __init__(self, store, max_wait=0, timer=time, sleeper=sleep):
+        self.store = store
+        self.max_wait = max_wait
+        self.timer = timer
+        self.sleeper = sleeper
+
+    def acquire(self, domain, interval, max_wait=None):
+        max_wait = self.max_wait if max_wait is None else max_wait
+        wait = self.store.reserve(domain, interval, max_wait, self.timer())
+        if wait > max_wait:
+            return wait
+
+        if wait:
+            self.sleeper(wait)
+        annotate("politeness", crawl_delay_wait=round(wait, 6))
+        return 0
+
+
+scheduler = PolitenessScheduler(
+    store=crawl_state,
+    max_wait=float(getenv("POLITENESS_MAX_WAIT", 0)),
+)
+
+
+def backoff_remaining(domain):
+    return crawl_state.backoff(domain, time())
+
+
+def extend_backoff(domain, seconds):
+    return crawl_state.extend_backoff(domain, seconds, time())
+
+
+def raise_backoff(domain, seconds):
+    return crawl_state.raise_backoff(domain, seconds, time())
+
+
+def decay_backoff(domain):
+    return crawl_state.decay_backoff(domain, BACKOFF_DECAY, time())
@@ -0,0 +1,53 @@
+from os import getenv
+
+from web.caching import DiskCache, TieredCache, content_digest
+from web.scrapers import rs_version
+
+revalidation_cache_path = getenv("REVALIDATION_CACHE_PATH")
+revalidation_cache = TieredCache(
+    name="revalidation",
+    maxsize=2_000,
+    disk=(
+        DiskCache(
+            revalidation_cache_path,
+            maxsize=20_000,
+            ttl=30 * 24 * 60 * 60,
+            version=f"{rs_version}/{getenv('IMAGE_VERSION')}",
+        )
+        if revalidation_cache_path
+        else None
+    ),
+)
+
+
+def get_validators(url, resolve):
+    return revalidation_cache.get((url, resolve))
+
+
+def conditional_headers(validators):
+    headers = {}
+    if validators and validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators and validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+def is_unmodified(validators, response):
+    if not validators:
+        return False
+    if response.status_code == 304:
+        return True
+    return response.ok and validators["digest"] == content_digest(response.content)
+
+
+def store_validators(url, resolve, response, result):
+    revalidation_cache.set(
+        (url, resolve),
+        {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "digest": content_digest(response.content),
+            "result": result,
+        },
+    )
@@ -1,14 +1,32 @@
-from time import time
-from urllib.parse import urljoin
+from datetime import UTC, datetime
+from email.utils import parsedate_to_datetime
+import re
+from urllib.parse import urljoin, urlsplit, urlunsplit
 
-from cacheout import Cache
-from robotexclusionrulesparser import RobotExclusionRulesParser, _Ruleset
+from requests.exceptions import RequestException
+from robotexclusionrulesparser import (
+    RobotExclusionRulesParser,
+    _Ruleset,
+    _unquote_path,
+)
 
-from web.domains import get_domain
+from web.caching import CoalescingCache
+from web.tracing import annotate
+from web.urls import get_domain
 from web.web_clients import HEADERS_DEFAULT, select_client
 
+ROBOTS_TXT_MAX_BYTES = 500 * 1024  # RFC 9309: parse at least 500KiB
+ROBOTS_TXT_TIMEOUT = (3, 5)  # connect, read
+ROBOTS_TXT_TTL = 60 * 60  # 1hr default cache expiry
+ROBOTS_TXT_MIN_TTL = 60
+ROBOTS_TXT_MAX_TTL = 24 * 60 * 60  # RFC 9309: should not exceed 24hrs
+ROBOTS_TXT_UNREACHABLE_TTL = 5 * 60
 
-domain_robot_parsers = Cache(ttl=60 * 60, timer=time)  # 1hr cache expiry
+ALLOW_ALL = b""
+DISALLOW_ALL = b"User-agent: *\nDisallow: /\n"
+
+USER_AGENT = HEADERS_DEFAULT.get("User-Agent", "*")
+MIN_CRAWL_DELAY = 1
 
 
 # Workaround: recognize robots.txt rulesets containining solely a crawl-delay.
@@ -22,27 +40,165 @@ class _PatchedRuleset(_Ruleset):
 _Ruleset.is_not_empty = _PatchedRuleset.is_not_empty
 
 
-def get_robot_parser(url):
-    domain = get_domain(url)
-    domain_http_client, headers = select_client(domain)
-    if domain not in domain_robot_parsers:
-        robot_parser = RobotExclusionRulesParser()
-        robots_txt = domain_http_client.get(
-            urljoin(url, "/robots.txt"),
+# Answers robots.txt queries for a single user agent without rescanning the
+# parsed rulesets.
+#
+# Literal path rules are held in a character trie, and wildcard rules are
+# combined into a single alternation; in both cases the earliest rule in the
+# file wins, consistent with RobotExclusionRulesParser (GYM2008 syntax).
+class RobotsMatcher:
+    def __init__(self, rules=(), crawl_delay=None):
+        self.trie = {}
+        self.crawl_delay = max(MIN_CRAWL_DELAY, crawl_delay or 0)
+        wildcard_patterns, self.wildcard_rules = [], []
+        for index, (rule_type, path) in enumerate(rules):
+            allowed = rule_type == _Ruleset.ALLOW
+            if "*" in path or path.endswith("$"):
+                wildcard_patterns.append(f"({self._wildcard_pattern(path)})")
+                self.wildcard_rules.append((index, allowed))
+                continue
+
+            # An empty rule path matches nothing, which inverts the rule
+            if not path:
+                allowed = not allowed
+            node = self.trie
+            for char in path:
+                node = node.setdefault(char, {})
+            node.setdefault(None, (index, allowed))
+        self.wildcards = (
+            re.compile("|".join(wildcard_patterns)) if wildcard_patterns else None
+        )
+
+    @staticmethod
+    def _wildcard_pattern(path):
+        appendix = "$" if path.endswith("$") else ""
+        path = re.sub(r"\*+", "*", path.removesuffix("$"))
+        return ".*".join(re.escape(part) for part in path.split("*")) + appendix
+
+    @classmethod
+    def compile(cls, parser, user_agent):
+        for ruleset in parser._RobotExclusionRulesParser__rulesets:
+            if ruleset.does_user_agent_match(user_agent):
+                return cls(ruleset.rules, ruleset.crawl_delay)
+        return cls()
+
+    def _match(self, path):
+        node, match = self.trie, self.trie.get(None)
+        for char in path:
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node and (match is None or node[None] < match):
+                match = node[None]
+
+        wildcard = self.wildcards.match(path) if self.wildcards else None
+        if wildcard:
+            candidate = self.wildcard_rules[wildcard.lastindex - 1]
+            if match is None or candidate < match:
+                match = candidate
+        return match
+
+    def is_allowed(self, url):
+        _, _, path, query, fragment = urlsplit(url)
+        path = _unquote_path(urlunsplit(("", "", path, query, fragment)))
+        match = self._match(path)
+        return match[1] if match else True
+
+    def check(self, url):
+        return self.is_allowed(url), self.crawl_delay
+
+
+class RobotsPolicy:
+    def __init__(self, content, ttl):
+        self.content = content
+        self.ttl = ttl
+        self.parser = RobotExclusionRulesParser()
+        self.parser.parse(content)
+        self.matcher = RobotsMatcher.compile(self.parser, USER_AGENT)
+
+    def dump(self):
+        return {"content": self.content.decode("iso-8859-1"), "ttl": self.ttl}
+
+    @classmethod
+    def load(cls, data):
+        return cls(data["content"].encode("iso-8859-1"), data["ttl"])
+
+
+domain_robot_parsers = CoalescingCache(
+    name="robots",
+    ttl=ROBOTS_TXT_TTL,
+    stale_ttl=ROBOTS_TXT_MAX_TTL,
+    maxsize=10_000,
+    ttl_of=lambda policy: policy.ttl,
+)
+
+
+def _cache_ttl(headers):
+    cache_control = headers.get("Cache-Control", "")
+    max_age = re.search(r"\bmax-age=(\d+)", cache_control)
+    if max_age:
+        ttl = int(max_age.group(1))
+    elif "Expires" in headers:
+        try:
+            expires = parsedate_to_datetime(headers["Expires"])
+            ttl = (expires - datetime.now(tz=UTC)).total_seconds()
+        except (TypeError, ValueError):
+            ttl = ROBOTS_TXT_TTL
+    else:
+        ttl = ROBOTS_TXT_TTL
+    return min(max(ttl, ROBOTS_TXT_MIN_TTL), ROBOTS_TXT_MAX_TTL)
+
+
+def _read_limited(response, limit):
+    content = b""
+    for chunk in response.iter_content(chunk_size=64 * 1024):
+        content += chunk
+        if len(content) >= limit:
+            break
+    response.close()
+    return content[:limit]
+
+
+def fetch_robots_policy(robots_url):
+    domain_http_client, headers = select_client(get_domain(robots_url))
+    try:
+        response = domain_http_client.get(
+            robots_url,
             headers=headers,
+            timeout=ROBOTS_TXT_TIMEOUT,
+            stream=True,
         )
-        robot_parser.parse(robots_txt.content)
-        domain_robot_parsers.set(domain, robot_parser)
-    return domain_robot_parsers.get(domain)
+        content = _read_limited(response, ROBOTS_TXT_MAX_BYTES)
+    except RequestException:
+        # RFC 9309: an unreachable robots.txt implies complete disallowance
+        return RobotsPolicy(DISALLOW_ALL, ttl=ROBOTS_TXT_UNREACHABLE_TTL)
+
+    # RFC 9309: an unavailable (4xx) robots.txt implies no restrictions, and a
+    # server error implies complete disallowance
+    if response.status_code >= 500:
+        return RobotsPolicy(DISALLOW_ALL, ttl=ROBOTS_TXT_UNREACHABLE_TTL)
+    if response.status_code >= 400:
+        return RobotsPolicy(ALLOW_ALL, ttl=_cache_ttl(response.headers))
+    return RobotsPolicy(content, ttl=_cache_ttl(response.headers))
+
+
+def get_robots_policy(url):
+    robots_url = urljoin(url, "/robots.txt")
+    annotate("cache", robots=robots_url in domain_robot_parsers)
+    return domain_robot_parsers.get(robots_url, fetch_robots_policy)
+
+
+def get_robot_parser(url):
+    return get_robots_policy(url).parser
+
+
+def robots_rules(url):
+    return get_robots_policy(url).matcher.check(url)
 
 
 def can_fetch(url):
-    robot_parser = get_robot_parser(url)
-    user_agent = HEADERS_DEFAULT.get("User-Agent", "*")
-    return robot_parser.is_allowed(user_agent, url)
+    return get_robots_policy(url).matcher.is_allowed(url)
 
 
 def crawl_delay(url):
-    robot_parser = get_robot_parser(url)
-    user_agent = HEADERS_DEFAULT.get("User-Agent", "*")
-    return max(1, robot_parser.get_crawl_delay(user_agent) or 0)
+    return get_robots_policy(url).matcher.crawl_delay
@@ -0,0 +1,43 @@
+from functools import cache
+from importlib import import_module
+from importlib.metadata import version
+import sys
+
+from web.hosts import HostIndex
+
+# Importing any module of recipe-scrapers imports its entire registry of site
+# scrapers, so the version is read from the package metadata instead
+rs_version = version("recipe-scrapers")
+
+# Names that are imported from recipe-scrapers upon first use
+LAZY_NAMES = {
+    "SCRAPERS": "recipe_scrapers",
+    "StaticValueException": "recipe_scrapers",
+    "WebsiteNotImplementedError": "recipe_scrapers",
+    "scrape_html": "recipe_scrapers",
+    "AbstractScraper": "recipe_scrapers._abstract",
+    "SchemaOrg": "recipe_scrapers._schemaorg",
+    "get_host_name": "recipe_scrapers._utils",
+    "get_yields": "recipe_scrapers._utils",
+}
+
+
+def __getattr__(name):
+    if name not in LAZY_NAMES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(LAZY_NAMES[name]), name)
+    globals()[name] = value
+    return value
+
+
+# Imports the registry and resolves each of the lazily-imported names
+def load():
+    module = sys.modules[__name__]
+    for name in LAZY_NAMES:
+        getattr(module, name)
+
+
+# Recipe extraction is limited to the websites in the registry
+@cache
+def host_index():
+    return HostIndex(sys.modules[__name__].SCRAPERS)
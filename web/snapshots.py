@@ -0,0 +1,113 @@
+import atexit
+import gzip
+import json
+import os
+from threading import Event, Lock, Thread
+
+from web.domains import domain_configurations
+from web.robots import RobotsPolicy, domain_robot_parsers
+
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_INTERVAL = int(os.getenv("CACHE_SNAPSHOT_INTERVAL", 5 * 60))
+
+
+def _identity(value):
+    return value
+
+
+# Periodically persists the entries of CoalescingCaches to a gzipped JSON file,
+# so that restarted workers can resume with warm caches.
+#
+# Entries retain their freshness deadlines; those that have become stale by
+# the time they are restored are served while being revalidated.  Workers
+# sharing a snapshot file merge their entries into it, preferring the fresher
+# copy of each.
+class CacheSnapshot:
+    def __init__(self, path, caches, interval=SNAPSHOT_INTERVAL):
+        self.path = path
+        self.caches = caches  # name: (cache, dump, load)
+        self.interval = interval
+        self._lock = Lock()
+        self._stopped = Event()
+        self._pid = None
+
+    def _read(self):
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, EOFError, ValueError) as e:
+            print(f"* Discarding unreadable cache snapshot {self.path}: {e}")
+            return {}
+        if snapshot.get("format") != SNAPSHOT_FORMAT:
+            return {}
+        return snapshot.get("caches", {})
+
+    def load(self):
+        if not self.path:
+            return 0
+        restored = 0
+        for name, entries in self._read().items():
+            if name not in self.caches:
+                continue
+            cache, _, load = self.caches[name]
+            for key, value, fresh_until in entries:
+                cache.restore(key, load(value), fresh_until)
+                restored += 1
+        return restored
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            stored, merged = self._read(), {}
+            for name, (cache, dump, _) in self.caches.items():
+                # Discard stored entries that have expired since being written
+                now = cache.timer()
+                entries = merged[name] = {
+                    key: (value, until)
+                    for key, value, until in stored.get(name, [])
+                    if now < until + cache.stale_ttl
+                }
+                for key, value, fresh_until in cache.snapshot():
+                    if key in entries and entries[key][1] > fresh_until:
+                        continue
+                    entries[key] = (dump(value), fresh_until)
+
+            snapshot = {
+                "format": SNAPSHOT_FORMAT,
+                "caches": {
+                    name: [[key, *entry] for key, entry in entries.items()]
+                    for name, entries in merged.items()
+                },
+            }
+            temporary_path = f"{self.path}.{os.getpid()}.tmp"
+            with gzip.open(temporary_path, "wt", encoding="utf-8") as f:
+                json.dump(snapshot, f, separators=(",", ":"))
+            os.replace(temporary_path, self.path)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.save()
+            except OSError as e:
+                print(f"* Failed to write cache snapshot {self.path}: {e}")
+
+    # Starts periodic snapshots from the current process; threads do not
+    # survive a fork, so each worker process starts its own
+    def start(self):
+        if not self.path or self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        Thread(target=self._run, daemon=True).start()
+        atexit.register(self.save)
+
+
+cache_snapshot = CacheSnapshot(
+    path=os.getenv("CACHE_SNAPSHOT_PATH"),
+    caches={
+        "domains": (domain_configurations, _identity, _identity),
+        "robots": (domain_robot_parsers, RobotsPolicy.dump, RobotsPolicy.load),
+    },
+)
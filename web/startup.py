@@ -0,0 +1,22 @@
+import gc
+
+from web import scrapers
+from web.async_clients import default_tls_context
+from web.web_clients import proxy_tls_context
+
+
+# Loads, within the gunicorn master process, the modules and resources that
+# each worker would otherwise load for itself; workers forked afterwards share
+# the memory pages that hold them until those pages are written to
+def warm():
+    scrapers.load()
+    scrapers.host_index()
+    default_tls_context()
+    try:
+        proxy_tls_context()
+    except OSError:
+        pass  # the proxy's CA certificate is only available within the cluster
+
+    # Garbage collection within a worker would write to every tracked object,
+    # copying the pages that hold them, so existing objects are exempted
+    gc.freeze()
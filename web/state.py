@@ -0,0 +1,328 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from fcntl import LOCK_EX, LOCK_SH, LOCK_UN, lockf
+from hashlib import blake2b
+import mmap
+import os
+from struct import Struct
+from threading import Lock
+from urllib.parse import urlparse
+
+BACKOFF_MINIMUM = 1  # backoffs that decay below this duration are forgotten
+
+
+# Per-domain crawl state shared by request handlers: the time at which the
+# next fetch slot for a domain begins, and any backoff requested by (or
+# imposed upon) the domain.
+#
+# Implementations must apply each update atomically with respect to all other
+# workers sharing the store; times are given as UNIX timestamps in seconds.
+class StateStore(ABC):
+    @abstractmethod
+    def reserve(self, domain, interval, max_wait, now):
+        pass
+
+    @abstractmethod
+    def backoff(self, domain, now):
+        pass
+
+    @abstractmethod
+    def extend_backoff(self, domain, seconds, now):
+        pass
+
+    @abstractmethod
+    def raise_backoff(self, domain, seconds, now):
+        pass
+
+    @abstractmethod
+    def decay_backoff(self, domain, factor, now):
+        pass
+
+    @abstractmethod
+    def __contains__(self, domain):
+        pass
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+
+class MemoryStateStore(StateStore):
+    def __init__(self):
+        self._next_allowed = {}
+        self._backoffs = {}
+        self._lock = Lock()
+
+    def reserve(self, domain, interval, max_wait, now):
+        with self._lock:
+            slot = max(now, self._next_allowed.get(domain, now))
+            if slot - now <= max_wait:
+                self._next_allowed[domain] = slot + interval
+            return slot - now
+
+    def backoff(self, domain, now):
+        until, _ = self._backoffs.get(domain, (now, 0))
+        return max(0, until - now)
+
+    def extend_backoff(self, domain, seconds, now):
+        with self._lock:
+            _, duration = self._backoffs.get(domain, (now, 0))
+            duration += seconds
+            self._backoffs[domain] = (now + duration, duration)
+            return duration
+
+    def raise_backoff(self, domain, seconds, now):
+        with self._lock:
+            _, duration = self._backoffs.get(domain, (now, 0))
+            duration = max(duration, seconds)
+            self._backoffs[domain] = (now + duration, duration)
+            return duration
+
+    # The duration is forgotten once it decays below the minimum, but any
+    # backoff that is in effect continues until it ends
+    def decay_backoff(self, domain, factor, now):
+        with self._lock:
+            until, duration = self._backoffs.get(domain, (now, 0))
+            if not duration:
+                return 0
+            duration *= factor
+            if duration < BACKOFF_MINIMUM:
+                duration = 0
+            self._backoffs[domain] = (until, duration)
+            return duration
+
+    def __contains__(self, domain):
+        _, duration = self._backoffs.get(domain, (0, 0))
+        return duration > 0
+
+    def clear(self):
+        with self._lock:
+            self._next_allowed.clear()
+            self._backoffs.clear()
+
+
+# A fixed-size open-addressing hash table in a memory-mapped file, allowing
+# worker processes on the same host to share state.
+#
+# Each slot holds an 8-byte digest of the domain alongside its next-allowed,
+# backoff-until and backoff-duration times; writers hold an exclusive POSIX
+# record lock on the file, and readers a shared lock.  When a domain's probe
+# window is full, the entry within it that expired longest ago is replaced.
+class SharedMemoryStateStore(StateStore):
+    slot = Struct("<Qddd")
+    probes = 32
+
+    def __init__(self, path, capacity=65536):
+        self.path = path
+        self.capacity = capacity
+        self._lock = Lock()
+        self._pid = None
+
+    def _map(self):
+        # POSIX record locks are held per-process, and a forked worker must
+        # map the file afresh for its own locks to exclude its siblings
+        if self._pid != os.getpid():
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            size = self.slot.size * self.capacity
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._fd, self._mmap = fd, mmap.mmap(fd, size)
+            self._pid = os.getpid()
+        return self._mmap
+
+    @contextmanager
+    def _locked(self, mode):
+        with self._lock:
+            buffer = self._map()
+            lockf(self._fd, mode)
+            try:
+                yield buffer
+            finally:
+                lockf(self._fd, LOCK_UN)
+
+    def _digest(self, domain):
+        digest = blake2b(domain.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "little") or 1
+
+    def _find(self, buffer, domain, create):
+        digest = self._digest(domain)
+        start = digest % self.capacity
+        victim, victim_expiry = None, None
+        for probe in range(self.probes):
+            index = (start + probe) % self.capacity
+            key, next_allowed, until, duration = self.slot.unpack_from(
+                buffer, index * self.slot.size
+            )
+            if key == digest:
+                return index, (next_allowed, until, duration)
+            if not create:
+                if key == 0:
+                    break
+                continue
+            if key == 0:
+                return index, None
+            expiry = max(next_allowed, until)
+            if victim is None or expiry < victim_expiry:
+                victim, victim_expiry = index, expiry
+        return victim, None
+
+    def _store(self, buffer, index, domain, next_allowed, until, duration):
+        offset = index * self.slot.size
+        values = self._digest(domain), next_allowed, until, duration
+        self.slot.pack_into(buffer, offset, *values)
+
+    def reserve(self, domain, interval, max_wait, now):
+        with self._locked(LOCK_EX) as buffer:
+            index, entry = self._find(buffer, domain, create=True)
+            next_allowed, until, duration = entry or (now, 0, 0)
+            slot = max(now, next_allowed)
+            if slot - now <= max_wait:
+                self._store(buffer, index, domain, slot + interval, until, duration)
+            return slot - now
+
+    def backoff(self, domain, now):
+        with self._locked(LOCK_SH) as buffer:
+            _, entry = self._find(buffer, domain, create=False)
+        if entry is None:
+            return 0
+        _, until, _ = entry
+        return max(0, until - now)
+
+    def _update_backoff(self, domain, now, merge):
+        with self._locked(LOCK_EX) as buffer:
+            index, entry = self._find(buffer, domain, create=True)
+            next_allowed, _, duration = entry or (now, 0, 0)
+            duration = merge(duration)
+            self._store(buffer, index, domain, next_allowed, now + duration, duration)
+            return duration
+
+    def extend_backoff(self, domain, seconds, now):
+        return self._update_backoff(domain, now, lambda duration: duration + seconds)
+
+    def raise_backoff(self, domain, seconds, now):
+        return self._update_backoff(
+            domain, now, lambda duration: max(duration, seconds)
+        )
+
+    def decay_backoff(self, domain, factor, now):
+        with self._locked(LOCK_EX) as buffer:
+            index, entry = self._find(buffer, domain, create=False)
+            if entry is None or entry[2] == 0:
+                return 0
+            next_allowed, until, duration = entry
+            duration *= factor
+            if duration < BACKOFF_MINIMUM:
+                duration = 0
+            self._store(buffer, index, domain, next_allowed, until, duration)
+            return duration
+
+    def __contains__(self, domain):
+        with self._locked(LOCK_SH) as buffer:
+            _, entry = self._find(buffer, domain, create=False)
+        return entry is not None and entry[2] > 0
+
+    def clear(self):
+        with self._locked(LOCK_EX) as buffer:
+            buffer[:] = bytes(len(buffer))
+
+
+# Reserves the next fetch slot for a domain (at time ARGV[1], spaced by
+# ARGV[2]) unless it begins more than ARGV[3] seconds from now, returning the
+# wait until the slot begins; slot keys expire once their next slot begins
+RESERVE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local slot = math.max(now, tonumber(redis.call("GET", KEYS[1]) or now))
+if slot - now <= tonumber(ARGV[3]) then
+    local next_allowed = slot + tonumber(ARGV[2])
+    redis.call(
+        "SET", KEYS[1], string.format("%.17g", next_allowed),
+        "PXAT", string.format("%.0f", math.ceil(next_allowed * 1000))
+    )
+end
+return string.format("%.17g", slot - now)
+"""
+
+# Decays a backoff duration by a factor (ARGV[2]), forgetting it once below a
+# minimum (ARGV[3]); scores are returned as strings to retain their precision
+DECAY_BACKOFF_SCRIPT = """
+local duration = redis.call("ZSCORE", KEYS[1], ARGV[1])
+if not duration then
+    return "0"
+end
+duration = tonumber(duration) * tonumber(ARGV[2])
+if duration < tonumber(ARGV[3]) then
+    redis.call("ZREM", KEYS[1], ARGV[1])
+    return "0"
+end
+redis.call("ZADD", KEYS[1], duration, ARGV[1])
+return tostring(duration)
+"""
+
+
+# Shares state between hosts by way of a Redis-compatible service.
+#
+# Every update is atomic: slot keys hold the next-allowed time of their domain
+# and expire at that moment, and backoffs are held in sorted sets so that
+# extensions (ZINCRBY) and raises (ZADD GT) are single commands.  Reservations
+# and decays read and rewrite a value, and so are applied by scripts.
+class RedisStateStore(StateStore):
+    def __init__(self, client, prefix="crawler"):
+        self.client = client
+        self.prefix = prefix
+        self._reserve = client.register_script(RESERVE_SCRIPT)
+        self._decay_backoff = client.register_script(DECAY_BACKOFF_SCRIPT)
+
+    def _key(self, *parts):
+        return ":".join((self.prefix, *parts))
+
+    # Waits are never negative, even between hosts whose clocks differ
+    def reserve(self, domain, interval, max_wait, now):
+        key = self._key("slot", domain)
+        wait = float(self._reserve(keys=[key], args=[now, interval, max_wait]))
+        return max(0.0, wait)
+
+    def backoff(self, domain, now):
+        until = self.client.zscore(self._key("backoff", "until"), domain)
+        return max(0, (until or 0) - now)
+
+    def _apply_backoff(self, domain, duration, now):
+        self.client.zadd(self._key("backoff", "until"), {domain: now + duration})
+        return duration
+
+    def extend_backoff(self, domain, seconds, now):
+        key = self._key("backoff", "duration")
+        duration = float(self.client.zincrby(key, seconds, domain))
+        return self._apply_backoff(domain, duration, now)
+
+    def raise_backoff(self, domain, seconds, now):
+        key = self._key("backoff", "duration")
+        self.client.zadd(key, {domain: seconds}, gt=True)
+        duration = float(self.client.zscore(key, domain))
+        return self._apply_backoff(domain, duration, now)
+
+    def decay_backoff(self, domain, factor, now):
+        key = self._key("backoff", "duration")
+        args = [domain, factor, BACKOFF_MINIMUM]
+        return float(self._decay_backoff(keys=[key], args=args))
+
+    def __contains__(self, domain):
+        key = self._key("backoff", "duration")
+        return self.client.zscore(key, domain) is not None
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self._key("*")):
+            self.client.delete(key)
+
+
+def open_state_store(url):
+    if not url:
+        return MemoryStateStore()
+
+    location = urlparse(url)
+    if location.scheme == "file":
+        return SharedMemoryStateStore(location.path)
+    if location.scheme in ("redis", "rediss", "unix"):
+        from redis import Redis
+
+        return RedisStateStore(Redis.from_url(url))
+    raise ValueError(f"unsupported state store location: {url}")
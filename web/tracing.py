@@ -0,0 +1,52 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current_trace = ContextVar("trace", default=None)
+
+
+# A breakdown of the time spent handling a single request, collected only when
+# the client requests it.
+#
+# Stage durations are recorded by web.metrics.stage; other details are added
+# by annotation, grouped into sections.  Code running in other threads on
+# behalf of the request must be run within a copy of the request's context.
+class Trace:
+    def __init__(self):
+        self.stages = {}
+        self.sections = {}
+
+    def record(self, stage, duration):
+        self.stages[stage] = self.stages.get(stage, 0) + duration
+
+    def annotate(self, section, **values):
+        self.sections.setdefault(section, {}).update(values)
+
+    def report(self):
+        stages = {stage: round(duration, 6) for stage, duration in self.stages.items()}
+        return {"stages": stages, **self.sections}
+
+
+@contextmanager
+def tracing(enabled=True):
+    if not enabled:
+        yield None
+        return
+
+    trace = Trace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def record(stage, duration):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record(stage, duration)
+
+
+def annotate(section, **values):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.annotate(section, **values)
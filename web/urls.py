@@ -0,0 +1,5 @@
+from urllib.parse import urlparse
+
+
+def get_domain(url):
+    return urlparse(url).netloc
@@ -1,4 +1,5 @@
 from datetime import UTC, datetime
+from functools import cache
 import ssl
 from time import sleep
 
@@ -6,7 +7,6 @@ import requests
 from requests.adapters import HTTPAdapter
 from requests.utils import default_user_agent as requests_user_agent
 
-
 HEADERS_DEFAULT = {
     "User-Agent": (
         "Mozilla/5.0 ("
@@ -21,10 +21,17 @@ HEADERS_DEFAULT = {
 HEADERS_NOCACHE = {"Cache-Control": "no-store"}
 
 
+# Created once per process, or within the gunicorn master when preloading
+@cache
+def proxy_tls_context():
+    context = ssl.create_default_context(cafile="/etc/ssl/k8s/proxy-cert/ca.crt")
+    context.verify_flags &= ~ssl.VERIFY_X509_STRICT
+    return context
+
+
 class ProxyCacheHTTPAdapter(HTTPAdapter):
     def _get_tls_context(self):
-        context = ssl.create_default_context(cafile="/etc/ssl/k8s/proxy-cert/ca.crt")
-        context.verify_flags &= ~ssl.VERIFY_X509_STRICT
+        context = proxy_tls_context()
         while True:
             yield context
 